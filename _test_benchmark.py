@@ -0,0 +1,24 @@
+"""Tests for the benchmark suite, run at the smallest sizes"""
+import benchmark
+import pandas as pd
+import reporting
+
+
+def test_make_station_csv_format(tmp_path):
+    filename = tmp_path / "Pollution-London Synthetic.csv"
+    benchmark.make_station_csv(filename, 1)
+    df = pd.read_csv(filename)
+    assert list(df.columns) == ["date", "time", "no", "pm10", "pm25"] and len(df) == benchmark.ROWS_PER_YEAR
+    assert df["time"].iloc[23] == "24:00:00" and (df["no"] == "No data").any()
+    assert len(reporting.daily_average({"S": df}, "S", "no")) == 365
+
+
+def test_run_every_group(tmp_path):
+    report = benchmark.run(tmp_path, scales=[1], sizes=[32], repeat=1)
+    groups = {result["group"] for result in report["results"]}
+    assert groups == set(benchmark.GROUPS)
+    names = {result["name"] for result in report["results"] if result["group"] == "intelligence"}
+    assert {"colour_mask", "find_colour_pixels", "label_components", "label_components_tiled"} <= names
+    assert all(result["min"] <= result["median"] for result in report["results"])
+    rows = benchmark.compare(report, report)
+    assert len(rows) == len(report["results"]) and not any(row[-1] for row in rows)
@@ -0,0 +1,117 @@
+"""Tests for the command line entry point"""
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+import cli
+import pytest
+
+
+def write_station(folder):
+    times = [f"{hour:0>2}:00:00" for hour in range(1, 25)]
+    lines = ["date,time,no,pm10,pm25"]
+    lines += [f"2021-01-01,{time},{hour},1,2" for hour, time in enumerate(times)]
+    lines += [f"2021-01-02,{time},No data,1,2" for time in times]
+    (folder / "Pollution-London Test.csv").write_text("\n".join(lines) + "\n")
+    return ["--data-dir", str(folder), "--cache-dir", str(folder / "cache")]
+
+
+def test_report_json(tmp_path, capsys):
+    options = write_station(tmp_path)
+    assert cli.main(options + ["report", "daily-average", "--station", "Test", "--pollutant", "no"]) == 0
+    records = json.loads(capsys.readouterr().out)
+    assert [record["value"] for record in records] == [11.5, None]
+    assert records[0] == {"station": "Test", "pollutant": "no", "position": 0, "value": 11.5}
+
+
+def test_report_csv_file_with_options_after_command(tmp_path):
+    options = write_station(tmp_path)
+    output = tmp_path / "peaks.csv"
+    assert cli.main(["report", "peak-hours", "--station", "Test", "--pollutant", "no", "--format", "csv",
+                     "--output", str(output)] + options) == 0
+    assert output.read_text().splitlines() == ["station,pollutant,date,time,value",
+                                               "Test,no,2021-01-01,24:00:00,23.0", "Test,no,2021-01-02,,"]
+
+
+def test_report_invalid_station(tmp_path, capsys):
+    options = write_station(tmp_path)
+    assert cli.main(options + ["report", "count-missing-data", "--station", "Nowhere", "--pollutant", "no"]) == 1
+    assert "Monitoring station invalid" in capsys.readouterr().err
+
+
+def test_report_all_json(tmp_path, capsys):
+    options = write_station(tmp_path)
+    assert cli.main(options + ["report-all", "--stations", "Test", "--pollutants", "no", "--workers", "1"]) == 0
+    records = json.loads(capsys.readouterr().out)
+    assert {"station": "Test", "pollutant": "no", "report": "count_missing_data", "position": 0, "value": 24} in records
+
+
+def test_report_imports_only_what_it_needs(tmp_path):
+    options = write_station(tmp_path)
+    code = ("import sys, cli; cli.main(sys.argv[1:]); "
+            "print(sorted(name for name in ('matplotlib', 'requests', 'PIL') if name in sys.modules), file=sys.stderr)")
+    result = subprocess.run([sys.executable, "-c", code] + options +
+                            ["report", "count-missing-data", "--station", "Test", "--pollutant", "no"],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(cli.__file__)))
+    assert json.loads(result.stdout) == [{"station": "Test", "pollutant": "no", "value": 24}]
+    assert result.stderr.strip() == "[]"
+
+
+@pytest.mark.parametrize("command", [["aqi", "--site", "MY1"],
+                                     ["compare-species", "--sites", "MY1", "--species", "NO2"],
+                                     ["objectives", "--site", "MY1", "--year", "2021"]])
+def test_monitoring_commands_import_only_what_they_need(command):
+    # nothing listens on port 9 so every request fails straight away, only the imports are checked
+    code = ("import sys, api, cli; api.API_URL = 'http://127.0.0.1:9/AirQuality'; cli.main(sys.argv[1:]); "
+            "print(sorted(name for name in ('matplotlib', 'PIL') if name in sys.modules), file=sys.stderr)")
+    result = subprocess.run([sys.executable, "-c", code] + command, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(cli.__file__)))
+    assert result.stderr.strip().splitlines()[-1] == "[]"
+
+
+def test_rolling_report_and_station_objectives(tmp_path, capsys):
+    options = write_station(tmp_path)
+    assert cli.main(options + ["report", "rolling-maximum", "--station", "Test", "--pollutant", "no",
+                               "--hours", "2"]) == 0
+    records = json.loads(capsys.readouterr().out)
+    assert len(records) == 48 and records[24] == {"station": "Test", "pollutant": "no", "date": "2021-01-02",
+                                                  "time": "01:00:00", "value": 23.0}
+    assert cli.main(options + ["report", "rolling-average", "--station", "Test", "--pollutant", "no",
+                               "--hours", "0"]) == 1  # not replaced by the default
+    assert "hours must be a positive whole number" in capsys.readouterr().err
+    assert cli.main(options + ["station-objectives", "--stations", "Test"]) == 0
+    records = json.loads(capsys.readouterr().out)
+    assert [(record["species"], record["achieved"]) for record in records] == [("PM10", "YES")] * 2 + [("PM25", "YES")]
+    assert {record["year"] for record in records} == {"2021"}
+
+
+def write_map(folder):
+    from matplotlib import pyplot as plt
+    rng = np.random.default_rng(0)
+    plt.imsave(folder / "map.png", (rng.random((20, 15, 3)) < 0.5).astype(np.float32))
+    return str(folder / "map.png")
+
+
+@pytest.mark.parametrize("command", ["red-pixels", "cyan-pixels"])
+def test_pixel_counts_match_intelligence(tmp_path, monkeypatch, capsys, command):
+    import intelligence
+    monkeypatch.chdir(tmp_path)  # map-*.jpg written to temporary folder
+    map_file = write_map(tmp_path)
+    assert cli.main([command, "--map", map_file]) == 0
+    find = intelligence.find_red_pixels if command == "red-pixels" else intelligence.find_cyan_pixels
+    expected = int((find(map_file) == 0).sum())  # matching pixels are 0
+    assert 0 < expected < 20 * 15
+    assert json.loads(capsys.readouterr().out)[0]["pixels"] == expected
+
+
+def test_components_match_intelligence(tmp_path, monkeypatch, capsys):
+    import intelligence
+    from matplotlib import pyplot as plt
+    monkeypatch.chdir(tmp_path)
+    intelligence.find_red_pixels(write_map(tmp_path))
+    assert cli.main(["components", "--map", "map-red-pixels.jpg"]) == 0
+    records = json.loads(capsys.readouterr().out)
+    _, sizes = intelligence.label_components(plt.imread("map-red-pixels.jpg")[:, :, 0] > 200)
+    assert [record["size"] for record in records] == sizes.tolist() and len(records) > 0
+    assert [record["component"] for record in records] == list(range(1, len(sizes) + 1))
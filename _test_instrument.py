@@ -0,0 +1,75 @@
+"""Tests for the opt-in instrumentation"""
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+import instrument
+import pandas as pd
+import reporting
+import utils
+
+
+@instrument.timed
+def allocate(size):
+    with instrument.phase("fill"):
+        instrument.add(rows=size)
+        return np.ones(size)
+
+
+def test_disabled_records_nothing():
+    instrument.reset()
+    utils.median([3, 1, 2])
+    allocate(10)
+    assert instrument.summary() == []
+
+
+def test_profiling_records_calls_counts_and_phases():
+    instrument.reset()
+    with instrument.profiling():
+        allocate(10)
+        allocate(5)
+    records = {record["name"]: record for record in instrument.summary()}
+    instrument.reset()
+    name = f"{__name__}.allocate"
+    assert records[name]["calls"] == 2 and records[name]["rows"] == 15
+    assert records[f"{name}:fill"]["calls"] == 2
+    allocate(1)
+    assert instrument.summary() == []  # recording stops when the context ends
+
+
+def test_profiling_peak_memory():
+    instrument.reset()
+    with instrument.profiling(memory=True):
+        allocate(2 ** 20)
+    records = {record["name"]: record for record in instrument.summary()}
+    instrument.reset()
+    assert records[f"{__name__}.allocate"]["peak_memory"] >= 8 * 2 ** 20
+
+
+def test_reporting_rows_counted():
+    times = [f"{hour:0>2}:00:00" for hour in range(1, 25)]
+    data = {"Test": pd.DataFrame({"date": ["2021-01-01"] * 24, "time": times, "no": ["1"] * 24})}
+    instrument.reset()
+    with instrument.profiling():
+        reporting.daily_average(data, "Test", "no")
+    records = {record["name"]: record for record in instrument.summary()}
+    instrument.reset()
+    assert records["reporting.daily_average"]["rows"] == 24
+
+
+def test_dump_json(tmp_path):
+    instrument.reset()
+    with instrument.profiling():
+        utils.sumvalues([1, 2])
+    instrument.dump(str(tmp_path / "profile.json"), as_json=True)
+    instrument.reset()
+    assert json.loads((tmp_path / "profile.json").read_text())[0]["name"] == "utils.sumvalues"
+
+
+def test_environment_variable_switch(tmp_path):
+    output = tmp_path / "profile.json"
+    code = "import utils; utils.meannvalue([1.0, 2.0])"
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(os.path.abspath(utils.__file__)),
+                   env={**os.environ, instrument.ENV_VAR: str(output)})
+    assert [record["name"] for record in json.loads(output.read_text())] == ["utils.meannvalue"]
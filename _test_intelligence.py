@@ -0,0 +1,161 @@
+"""Tests for the mobility intelligence functions"""
+import os
+import subprocess
+import sys
+from matplotlib import pyplot as plt
+import numpy as np
+from PIL import Image
+import intelligence
+import pytest
+
+
+def make_image():
+    # one red pixel, one cyan pixel, one white pixel
+    return np.array([[[1.0, 0.0, 0.0], [0.0, 1.0, 1.0], [1.0, 1.0, 1.0]]], dtype=np.float32)
+
+
+def test_colour_mask_red():
+    mask = intelligence.colour_mask(make_image(), [(0, ">", 100), (1, "<", 50), (2, "<", 50)])
+    assert mask.tolist() == [[True, False, False]]
+
+
+def test_colour_mask_no_rules():
+    assert intelligence.colour_mask(make_image(), []).all()
+
+
+def test_colour_mask_invalid_comparison():
+    with pytest.raises(ValueError):
+        intelligence.colour_mask(make_image(), [(0, "==", 100)])
+
+
+def test_label_components_diagonal():
+    mask = np.array([[1, 0, 0, 1],
+                     [0, 1, 0, 1],
+                     [0, 0, 0, 0],
+                     [1, 1, 0, 0]], dtype=bool)
+    MARK, sizes = intelligence.label_components(mask)
+    assert MARK.tolist() == [[1, 0, 0, 2],
+                             [0, 1, 0, 2],
+                             [0, 0, 0, 0],
+                             [3, 3, 0, 0]]
+    assert sizes.tolist() == [2, 2, 2]
+
+
+def test_label_components_numbered_by_first_pixel():
+    # component whose first pixel comes first is numbered 1 even though it joins up later
+    mask = np.array([[0, 1, 0, 0],
+                     [0, 0, 1, 0],
+                     [1, 0, 0, 1]], dtype=bool)
+    MARK, sizes = intelligence.label_components(mask)
+    assert MARK[2, 0] == 2 and MARK[2, 3] == 1
+    assert sizes.tolist() == [3, 1]
+
+
+def test_label_components_empty():
+    MARK, sizes = intelligence.label_components(np.zeros((2, 2), dtype=bool))
+    assert not MARK.any() and len(sizes) == 0
+
+
+def test_detect_connected_components_sorted_top_k(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # output files written to temporary folder
+    MARK = np.array([[1, 0, 2, 2],
+                     [0, 0, 2, 0],
+                     [3, 3, 0, 4]])
+    top = intelligence.detect_connected_components_sorted(MARK, k=2)
+    assert top.tolist() == [[1, 1, 0, 0],
+                            [1, 1, 0, 1],
+                            [0, 0, 1, 1]]
+    assert (tmp_path / "cc-top-2.jpg").exists()
+    assert (tmp_path / "cc-output-2b.txt").read_text().splitlines()[:2] == [
+        "Connected Component 2, number of pixels = 3",
+        "Connected Component 3, number of pixels = 2"]
+
+
+@pytest.mark.parametrize("band_height", [1, 3, 100])
+def test_tiled_mode_matches_whole_image(tmp_path, monkeypatch, band_height):
+    monkeypatch.chdir(tmp_path)  # output files written to temporary folder
+    rng = np.random.default_rng(0)
+    image = rng.random((20, 15, 3)) < 0.3  # random red, green and blue pixels
+    plt.imsave("map.png", image.astype(np.float32))
+
+    whole = intelligence.find_red_pixels("map.png")
+    whole_jpg = (tmp_path / "map-red-pixels.jpg").read_bytes()
+    whole_mark = intelligence.detect_connected_components("map-red-pixels.jpg")
+
+    tiled = intelligence.find_red_pixels("map.png", band_height=band_height)
+    assert np.array_equal(tiled, whole)
+    assert (tmp_path / "map-red-pixels.jpg").read_bytes() == whole_jpg
+    tiled_mark = intelligence.detect_connected_components("map-red-pixels.jpg", band_height=band_height,
+                                                          mark_filename="mark.npy")
+    assert np.array_equal(tiled_mark, whole_mark)
+
+
+def test_tiled_mode_no_matching_pixels(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    plt.imsave("map.png", np.ones((4, 4, 3), dtype=np.float32))  # white image has no red pixels
+    intelligence.find_red_pixels("map.png")
+    whole_jpg = (tmp_path / "map-red-pixels.jpg").read_bytes()
+    intelligence.find_red_pixels("map.png", band_height=2)
+    assert (tmp_path / "map-red-pixels.jpg").read_bytes() == whole_jpg
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "P", "LA", "L", "I;16"])
+def test_image_bands_match_imread(tmp_path, mode):
+    rng = np.random.default_rng(1)
+    if mode == "I;16":  # 16 bit greyscale is scaled from 0-65535 rather than 0-255
+        image = Image.fromarray(rng.integers(0, 2 ** 16, (13, 9)).astype(np.uint16))
+    else:
+        image = Image.fromarray(rng.integers(0, 256, (13, 9, 4), dtype=np.uint8)).convert(mode)
+    options = {"transparency": 3} if mode == "P" else {}  # palette with a transparent colour
+    image.save(tmp_path / "map.png", **options)
+    whole = plt.imread(tmp_path / "map.png")
+    for band_height in (1, 4, 100):
+        bands = list(intelligence.image_bands(tmp_path / "map.png", band_height))
+        assert [top for top, _ in bands] == list(range(0, 13, band_height))
+        assert np.array_equal(np.concatenate([band for _, band in bands]), whole)
+
+
+@pytest.mark.parametrize("mode, subsampling", [("RGB", 0), ("RGB", 1), ("RGB", 2), ("L", 0)])
+def test_image_bands_match_imread_jpeg(tmp_path, mode, subsampling):
+    rng = np.random.default_rng(2)
+    image = Image.fromarray(rng.integers(0, 256, (45, 21, 3), dtype=np.uint8)).convert(mode)
+    image.save(tmp_path / "map.jpg", subsampling=subsampling, **intelligence.JPEG_SAVE_OPTIONS)
+    whole = plt.imread(tmp_path / "map.jpg")
+    for band_height in (1, 7, 16, 100):
+        bands = list(intelligence.image_bands(tmp_path / "map.jpg", band_height))
+        assert [top for top, _ in bands] == list(range(0, 45, band_height))
+        assert np.array_equal(np.concatenate([band for _, band in bands]), whole)
+
+
+def test_image_bands_rejects_images_decoded_whole(tmp_path):
+    image = Image.fromarray(np.zeros((8, 8, 3), dtype=np.uint8))
+    image.save(tmp_path / "plain.jpg")  # no restart markers
+    image.save(tmp_path / "progressive.jpg", progressive=True, **intelligence.JPEG_SAVE_OPTIONS)
+    image.convert("1").save(tmp_path / "bits.png")  # pixels packed 8 to a byte
+    image.save(tmp_path / "map.bmp")
+    for name in ("plain.jpg", "progressive.jpg", "bits.png", "map.bmp"):
+        with pytest.raises(ValueError):
+            next(intelligence.image_bands(tmp_path / name, 4))
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="reads memory use from /proc")
+def test_image_bands_jpeg_peak_memory(tmp_path):
+    height, width = 4000, 3000
+    rows = np.linspace(0, 255, height, dtype=np.uint8)[:, None].repeat(width, axis=1)
+    Image.fromarray(rows).convert("RGB").save(tmp_path / "map.jpg", **intelligence.JPEG_SAVE_OPTIONS)
+    # peak resident memory above the memory in use before reading, which includes PIL's own allocations. Read from
+    # /proc as getrusage's peak starts from the size of the process that started the subprocess
+    code = ("import re, sys, intelligence; from matplotlib import pyplot as plt; "
+            "memory = lambda name: int(re.search(name + r':\\s+(\\d+) kB', open('/proc/self/status').read())[1]); "
+            "before = memory('VmRSS'); "
+            "read = (lambda: plt.imread(sys.argv[1])) if sys.argv[2] == 'whole' else "
+            "(lambda: [band.sum() for _, band in intelligence.image_bands(sys.argv[1], 64)]); read(); "
+            "print(memory('VmHWM') - before)")
+    peaks = {}
+    for how in ("whole", "bands"):
+        result = subprocess.run([sys.executable, "-c", code, str(tmp_path / "map.jpg"), how], capture_output=True,
+                                text=True, check=True, cwd=os.path.dirname(os.path.abspath(intelligence.__file__)))
+        peaks[how] = int(result.stdout) * 1024
+    decoded = height * width * 3
+    assert peaks["whole"] >= decoded  # the measurement sees PIL's own memory
+    assert peaks["bands"] < decoded // 4
@@ -0,0 +1,233 @@
+"""Tests for the real-time monitoring functions, run against a local stub of the London Air API"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import datetime
+import json
+import math
+import threading
+import time
+import numpy as np
+import api
+import monitoring
+import pytest
+
+
+class StubAPI(BaseHTTPRequestHandler):
+    responses = {}  # path after API_URL: function returning the body for that path
+    requested = []  # paths requested in the order they arrived
+
+    def do_GET(self):
+        path = self.path.split("/AirQuality", 1)[1]
+        StubAPI.requested.append(path)
+        for prefix, respond in StubAPI.responses.items():
+            if path.startswith(prefix):
+                body = respond(path).encode()
+                break
+        else:
+            body = b"not found"
+        try:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):  # the client timed out and closed the connection
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubAPI)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    monkeypatch.setattr(api, "API_URL", f"http://127.0.0.1:{server.server_address[1]}/AirQuality")
+    StubAPI.responses, StubAPI.requested = {}, []
+    yield StubAPI
+    server.shutdown()
+    server.server_close()
+
+
+def daily_index(path):
+    date = path.split("Date=")[1][:10]
+    if date.endswith("5"):  # no data for days ending in 5
+        return "{}"
+    day = int(date[8:10])
+    species = [{"@SpeciesCode": "NO2", "@AirQualityIndex": str(day)},
+               {"@SpeciesCode": "PM10", "@AirQualityIndex": "1"}]
+    return json.dumps({"DailyAirQualityIndex": {"LocalAuthority": {"Site": {"Species": species}}}})
+
+
+def test_air_quality_indexes_date_order(stub):
+    stub.responses["/Daily/MonitoringIndex"] = daily_index
+    indexes = monitoring.air_quality_indexes("MY1", max_workers=8)
+
+    first_date = datetime.date.today() - datetime.timedelta(days=31)
+    expected = []
+    for day in range(31):
+        date = first_date + datetime.timedelta(days=day)
+        if not expected and str(date).endswith("5"):  # no lists exist yet to add "N/A" to
+            continue
+        expected.append("N/A" if str(date).endswith("5") else date.day)
+    assert indexes["NO2"] == expected
+    assert len(stub.requested) == 31
+
+
+def test_air_quality_indexes_no_data(stub):
+    stub.responses["/Daily/MonitoringIndex"] = lambda path: "{}"
+    assert monitoring.air_quality_indexes("MY1") == {}
+
+
+def test_fetch_all_keeps_order(stub):
+    stub.responses["/echo"] = lambda path: path
+    urls = [f"{api.API_URL}/echo/{number}" for number in range(20)]
+    assert api.fetch_all(urls, max_workers=5) == [f"/echo/{number}".encode() for number in range(20)]
+
+
+def test_response_cache_historic_never_requested_twice(stub, tmp_path):
+    stub.responses["/Annual"] = lambda path: json.dumps({"SiteObjectives": {"Site": {"Objective": [
+        {"@SpeciesCode": "NO2", "@ObjectiveName": "mean", "@Achieved": "YES"}]}}})
+    api.set_cache(api.ResponseCache(tmp_path))
+    try:
+        first = monitoring.year_objectives("MY1", "2019")
+        second = monitoring.year_objectives("MY1", "2019")
+    finally:
+        api.set_cache(None)
+    assert first == second == ([("NO2", "mean", "YES")], 100.0)
+    assert len(stub.requested) == 1
+
+
+def test_response_cache_recent_expires(tmp_path):
+    cache = api.ResponseCache(tmp_path, recent_ttl=0)
+    today = datetime.date.today()
+    recent_url = f"http://test/Date={today}/Json"
+    old_url = f"http://test/Date={today - datetime.timedelta(days=30)}/Json"
+    cache.put(recent_url, b"recent")
+    cache.put(old_url, b"old")
+    assert cache.get(recent_url) is None
+    assert cache.get(old_url) == b"old"
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    cache = api.ResponseCache(tmp_path, max_bytes=100)
+    for number in range(3):
+        cache.put(f"http://test/Year=2000/{number}", b"x" * 30)
+        cache.get("http://test/Year=2000/0")  # keeps response 0 recently used
+    cache.put("http://test/Year=2000/3", b"x" * 30)
+    assert cache.get("http://test/Year=2000/0") is not None
+    assert cache.get("http://test/Year=2000/1") is None
+
+
+def site_species(path):
+    # hourly values from StartDate up to and including midnight on EndDate, value is the month, empty on the 2nd
+    start = datetime.datetime.fromisoformat(path.split("StartDate=")[1][:10])
+    end = datetime.datetime.fromisoformat(path.split("EndDate=")[1][:10])
+    data = []
+    while start <= end:
+        value = "" if start.day == 2 else str(start.month)
+        data.append({"@MeasurementDateGMT": str(start), "@Value": value})
+        start += datetime.timedelta(hours=1)
+    return json.dumps({"RawAQData": {"@SiteCode": "MY1", "Data": data}})
+
+
+@pytest.mark.parametrize("months_per_request, requests", [(12, 1), (5, 3), (1, 12)])
+def test_monthly_average_batched(stub, monkeypatch, months_per_request, requests):
+    from matplotlib import pyplot as plt
+    monkeypatch.setattr(plt, "show", lambda: None)
+    stub.responses["/Data/SiteSpecies"] = site_species
+    averages = monitoring.monthly_average("MY1", "NO2", "2021", months_per_request=months_per_request)
+    assert averages == [float(month) for month in range(1, 13)]
+    assert len(stub.requested) == requests
+
+
+def site_species_week(path):
+    # three values for each site, no data for CO
+    species = path.split("SpeciesCode=")[1].split("/")[0]
+    values = ["", ""] if species == "CO" else ["1", "2", "6"]
+    data = [{"@MeasurementDateGMT": f"2021-01-01 0{hour}:00:00", "@Value": value} for hour, value in enumerate(values)]
+    return json.dumps({"RawAQData": {"Data": data}})
+
+
+def test_compare_sites_standard(stub):
+    stub.responses["/Data/SiteSpecies"] = site_species_week
+    assert monitoring.compare_sites("MY1", "BL0", "NO2") == {"MY1": (3.0, 2.0, 2), "BL0": (3.0, 2.0, 2)}
+
+
+def test_compare_species_table(stub):
+    stub.responses["/Data/SiteSpecies"] = site_species_week
+    table = monitoring.compare_species(["MY1", "BL0", "KC1"], ["NO2", "CO"], max_workers=4)
+    assert len(stub.requested) == 6
+    assert list(table["site"]) == ["MY1", "MY1", "BL0", "BL0", "KC1", "KC1"]
+    no2 = table[table["species"] == "NO2"]
+    assert list(no2["mean"]) == [3.0] * 3 and list(no2["sd"]) == [2.16] * 3
+    assert table[table["species"] == "CO"]["mean"].isna().all()
+
+
+def test_compare_species_failed_pair(stub, monkeypatch):
+    def respond(path):
+        if "SiteCode=BL0" in path and "SpeciesCode=NO2" in path:
+            time.sleep(0.5)  # longer than the timeout
+        return site_species_week(path)
+
+    stub.responses["/Data/SiteSpecies"] = respond
+    monkeypatch.setattr(api, "TIMEOUT", 0.1)
+    table = monitoring.compare_species(["MY1", "BL0"], ["NO2", "CO"], max_workers=4)
+    assert table.iloc[2, 2:6].isna().all() and "timed out" in table.iloc[2]["error"].lower()
+    assert table.iloc[0, 2:6].tolist() == [3, 3.0, 2.0, 2.16] and table["error"].isna().sum() == 3
+    assert table.iloc[3]["count"] == 0 and np.isnan(table.iloc[3]["mean"])
+    assert all(table[column].dtype == np.float64 for column in ["count", "mean", "median", "sd"])
+
+
+def test_session_pool_sized_for_workers(monkeypatch):
+    monkeypatch.setattr(api, "_session", None)
+    monkeypatch.setattr(api, "_pool_size", 0)
+    assert api.get_session().get_adapter("http://localhost")._pool_maxsize == api.MAX_WORKERS
+    session = api.get_session(20)
+    assert session is api.get_session(4)  # the pool never shrinks
+    assert session.get_adapter("https://localhost")._pool_maxsize == 20
+
+
+def test_fetch_times_out(stub, monkeypatch):
+    stub.responses["/slow"] = lambda path: time.sleep(0.5) or "late"
+    monkeypatch.setattr(api, "TIMEOUT", 0.1)
+    with pytest.raises(api.requests.Timeout):
+        api.fetch(f"{api.API_URL}/slow")
+    with pytest.raises(api.requests.Timeout):
+        b"".join(api.stream(f"{api.API_URL}/slow"))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 10000])
+def test_read_raw_values_split_chunks(chunk_size):
+    body = site_species("/StartDate=2021-01-01/EndDate=2021-01-03").encode()
+    chunks = [body[start:start + chunk_size] for start in range(0, len(body), chunk_size)]
+    dates, values = api.read_raw_values(chunks, expected=4)  # arrays have to grow
+    assert len(dates) == 49
+    assert str(dates[-1]) == "2021-01-03T00:00:00"
+    assert values[0] == 1.0 and math.isnan(values[24])  # values on the 2nd are empty
+
+
+def test_read_raw_values_braces_in_strings():
+    data = [{"@MeasurementDateGMT": "2021-01-01 00:00:00", "@Value": "{"},
+            {"@MeasurementDateGMT": "2021-01-01 01:00:00", "@Value": "2"}]
+    body = json.dumps({"RawAQData": {"@SiteCode": "}{\"{", "Data": data}}).encode()
+    dates, values = api.read_raw_values([body[start:start + 3] for start in range(0, len(body), 3)])
+    assert len(dates) == 2 and math.isnan(values[0]) and values[1] == 2.0
+
+
+@pytest.mark.parametrize("body", [b"<html><body>Error {500}</body></html>", b'{"error": "Invalid site"}',
+                                  b'{"RawAQData": {"Data": [{"@Value": "1"}', b""])
+def test_read_raw_values_not_raw_data(body):
+    with pytest.raises(ValueError):
+        api.read_raw_values([body])
+
+
+def test_stream_cached(stub, tmp_path):
+    stub.responses["/Data/SiteSpecies"] = site_species
+    url = f"{api.API_URL}/Data/SiteSpecies/SiteCode=MY1/SpeciesCode=NO2/StartDate=2020-01-01/EndDate=2020-01-02/Json"
+    api.set_cache(api.ResponseCache(tmp_path))
+    try:
+        first = api.read_raw_values(api.stream(url))
+        second = api.read_raw_values(api.stream(url))
+    finally:
+        api.set_cache(None)
+    assert len(stub.requested) == 1
+    assert (first[0] == second[0]).all() and len(first[0]) == 25
@@ -0,0 +1,273 @@
+"""Tests for the reporting functions"""
+import numpy as np
+import pandas as pd
+import reporting
+import storage
+import pytest
+
+
+def make_data():
+    times = [f"{hour:0>2}:00:00" for hour in range(1, 25)]
+    df = pd.DataFrame({"date": ["2021-01-01"] * 24 + ["2021-01-02"] * 24,
+                       "time": times * 2,
+                       "no": [str(x) for x in range(24)] + ["No data"] * 24})
+    return {"Test": df}
+
+
+def test_daily_average_standard():
+    assert reporting.daily_average(make_data(), "Test", "no") == [11.5, "N/A"]
+
+
+def test_daily_median_standard():
+    assert reporting.daily_median(make_data(), "Test", "no") == [11.5, "N/A"]
+
+
+def test_daily_average_invalid_station():
+    with pytest.raises(KeyError):
+        reporting.daily_average(make_data(), "Nowhere", "no")
+
+
+def test_daily_median_invalid_pollutant():
+    with pytest.raises(KeyError):
+        reporting.daily_median(make_data(), "Test", "co")
+
+
+def test_fill_missing_data_standard():
+    filled = reporting.fill_missing_data(make_data(), "5", "Test", "no")
+    assert reporting.count_missing_data({"Test": filled}, "Test", "no") == 0
+
+
+def test_fill_missing_data_non_numerical():
+    with pytest.raises(ValueError):
+        reporting.fill_missing_data(make_data(), "abc", "Test", "no")
+
+
+def test_count_missing_data_standard():
+    assert reporting.count_missing_data(make_data(), "Test", "no") == 24
+
+
+def test_peak_hour_date_standard():
+    assert reporting.peak_hour_date(make_data(), "2021-01-01", "Test", "no") == ("24:00:00", 23.0)
+
+
+def test_peak_hour_date_no_data():
+    assert reporting.peak_hour_date(make_data(), "2021-01-02", "Test", "no") == (None, None)
+
+
+def test_station_store_matches_plain_dict():
+    data = make_data()
+    data["Test"].loc[5, "no"] = "23"  # second occurrence of the peak value
+    store = storage.StationStore(data)
+    for function in (reporting.daily_average, reporting.hourly_average, reporting.monthly_average,
+                     reporting.count_missing_data):
+        assert function(store, "Test", "no") == function(data, "Test", "no")
+    for date in ("2021-01-01", "2021-01-02", "2021-01-03"):
+        assert reporting.peak_hour_date(store, date, "Test", "no") == reporting.peak_hour_date(data, date, "Test", "no")
+    assert reporting.peak_hour_date(store, "2021-01-01", "Test", "no") == ("06:00:00", 23.0)
+
+
+def test_station_store_invalid_inputs():
+    store = storage.StationStore(make_data())
+    with pytest.raises(KeyError):
+        reporting.daily_average(store, "Nowhere", "no")
+    with pytest.raises(KeyError):
+        reporting.peak_hour_date(store, "2021-01-01", "Test", "co")
+
+
+def test_fill_missing_data_updates_store_index():
+    store = storage.StationStore(make_data())
+    filled = reporting.fill_missing_data(store, "5", "Test", "no")
+    store["Test"] = filled
+    assert store.aggregates["Test"].frame is filled
+    assert reporting.count_missing_data(store, "Test", "no") == 0
+    assert reporting.daily_average(store, "Test", "no") == [11.5, 5.0]
+    assert reporting.peak_hour_date(store, "2021-01-02", "Test", "no") == ("01:00:00", 5.0)
+
+
+def test_peak_hours_every_day():
+    data = make_data()
+    assert reporting.peak_hours(data, "Test", "no") == [("2021-01-01", "24:00:00", 23.0), ("2021-01-02", None, None)]
+    store = storage.StationStore(make_data())
+    assert reporting.peak_hours(store, "Test", "no") == reporting.peak_hours(data, "Test", "no")
+
+
+def test_peak_hours_date_range():
+    data = make_data()
+    assert reporting.peak_hours(data, "Test", "no", "2021-01-02") == [("2021-01-02", None, None)]
+    assert reporting.peak_hours(storage.StationStore(data), "Test", "no", end_date="2021-01-01")[0][1] == "24:00:00"
+    assert reporting.peak_hours(data, "Test", "no", "2021-02-01", "2021-02-28") == []
+
+
+def test_peak_hour_date_unindexed_pollutant():
+    data = make_data()
+    data["Test"]["nox"] = [str(x % 7) for x in range(48)]
+    store = storage.StationStore(data)
+    assert "nox" not in store.index("Test").tables
+    assert reporting.peak_hour_date(store, "2021-01-02", "Test", "nox") == ("04:00:00", 6.0)
+    assert reporting.peak_hour_date(store, "2021-01-05", "Test", "nox") == (None, None)
+
+
+def make_gappy_data():
+    times = [f"{hour:0>2}:00:00" for hour in range(1, 25)]
+    values = [str(float(hour)) for hour in range(24)] + ["No data", "30", "No data", "No data", "36"] + ["No data"] * 19
+    return {"A": pd.DataFrame({"date": ["2021-01-01"] * 24 + ["2021-01-02"] * 24, "time": times * 2,
+                               "no": values, "pm10": ["No data"] + ["1"] * 47})}
+
+
+def test_fill_missing_strategies():
+    data = make_gappy_data()
+    ffill = reporting.fill_missing(data, ["A"], ["no"], "ffill")["A"]["no"].tolist()
+    assert ffill[24:29] == [23.0, 30.0, 30.0, 30.0, 36.0] and ffill[-1] == 36.0
+    linear = reporting.fill_missing(data, ["A"], ["no"], "linear")["A"]["no"].tolist()
+    assert linear[24:29] == [26.5, 30.0, 32.0, 34.0, 36.0] and np.isnan(linear[-1])
+    climate = reporting.fill_missing(data, ["A"], ["no"], "climatology")["A"]["no"].tolist()
+    assert climate[24] == 0.0 and climate[26] == 2.0 and climate[47] == 23.0
+    assert reporting.fill_missing(data, ["A"], ["pm10"], "ffill")["A"]["pm10"].isna().sum() == 1
+
+
+def test_fill_missing_copy_and_inplace():
+    data = make_gappy_data()
+    filled = reporting.fill_missing(data, new_value=0)
+    assert reporting.count_missing_data(filled, "A", "no") == 0
+    assert reporting.count_missing_data(filled, "A", "pm10") == 0
+    assert reporting.count_missing_data(data, "A", "no") == 22
+    result = reporting.fill_missing(data, ["A"], ["no", "pm10"], "constant", "1.5", inplace=True)
+    assert result["A"] is data["A"] and reporting.count_missing_data(data, "A", "no") == 0
+
+
+def test_fill_missing_inplace_updates_store_index():
+    store = storage.StationStore(make_gappy_data())
+    frame = store["A"]
+    reporting.fill_missing(store, strategy="linear", inplace=True)
+    assert store["A"] is frame and store.aggregates["A"].frame is frame
+    rebuilt = storage.StationAggregates(frame)
+    for pollutant in ("no", "pm10"):
+        for grouping in rebuilt.GROUPINGS:
+            for name, column in rebuilt.tables[pollutant][grouping].items():
+                assert np.allclose(store.aggregates["A"].tables[pollutant][grouping][name], column, equal_nan=True)
+    assert reporting.daily_average(store, "A", "no") == reporting.daily_average(dict(store), "A", "no")
+
+
+def test_fill_missing_invalid_inputs():
+    data = make_gappy_data()
+    with pytest.raises(ValueError):
+        reporting.fill_missing(data, strategy="mean")
+    with pytest.raises(ValueError):
+        reporting.fill_missing(data, strategy="constant")
+    with pytest.raises(KeyError):
+        reporting.fill_missing(data, ["B"], new_value=0)
+    with pytest.raises(KeyError):
+        reporting.fill_missing(data, ["A"], ["co"], new_value=0)
+
+
+def test_report_all_matches_single_reports():
+    data = {**make_data(), **make_gappy_data()}
+    table = reporting.report_all(data, max_workers=1)
+    assert list(table.columns) == ["station", "pollutant", "report", "position", "value"]
+    averages = table[(table.station == "Test") & (table.report == "daily_average")]["value"].tolist()
+    assert averages[0] == 11.5 and np.isnan(averages[1])
+    missing = table[(table.station == "A") & (table.report == "count_missing_data")]
+    assert missing["value"].tolist() == [22, 1] and missing["pollutant"].tolist() == ["no", "pm10"]
+
+
+def test_report_all_process_pool():
+    data = {**make_data(), **make_gappy_data()}
+    reports = (reporting.hourly_average, reporting.count_missing_data)
+    pooled = reporting.report_all(data, reports, pollutants=["no"], max_workers=2)
+    assert pooled.equals(reporting.report_all(data, reports, pollutants=["no"], max_workers=1))
+    assert len(pooled) == 2 * (24 + 1)
+
+
+def test_report_all_invalid_station():
+    with pytest.raises(KeyError):
+        reporting.report_all(make_data(), monitoring_stations=["Nowhere"])
+    with pytest.raises(ValueError):  # takes a date as well
+        reporting.report_all(make_data(), (reporting.peak_hour_date,))
+    with pytest.raises(ValueError):
+        reporting._report_station("Test", "missing", {}, (reporting.daily_average,), None)
+
+
+def test_report_all_maps_store_cache(tmp_path, monkeypatch):
+    make_data()["Test"].to_csv(tmp_path / "Pollution-London Test.csv", index=False)
+    store = storage.StationStore.load(["Test"], tmp_path, cache_dir=tmp_path / "cache")
+    written = []
+    write = storage.write_station_cache
+    monkeypatch.setattr(storage, "write_station_cache", lambda *args: written.append(args) or write(*args))
+    table = reporting.report_all(store, (reporting.daily_average,), max_workers=1)
+    assert written == [] and table["value"].iloc[0] == 11.5
+    store["Test"].loc[store["Test"].index[0], "no"] = 24.0  # changed since it was cached
+    table = reporting.report_all(store, (reporting.daily_average,), max_workers=1)
+    assert len(written) == 1 and table["value"].iloc[0] == 12.5
+
+
+def make_hourly_data():
+    times = [f"{hour:0>2}:00:00" for hour in range(1, 25)]
+    values = [10.0] * 72
+    values[30:34] = [70.0, 80.0, 90.0, 100.0]
+    values[50:60] = [np.nan] * 10
+    df = pd.DataFrame({"date": ["2021-01-01"] * 24 + ["2021-01-02"] * 24 + ["2021-01-03"] * 24,
+                       "time": times * 3, "pm10": values, "co": [1.0] * 72})
+    return {"A": df.drop(index=[40, 41])}  # rows missing altogether are still counted as hours
+
+
+def test_rolling_average_matches_window_means():
+    data = make_hourly_data()
+    values = np.array([10.0] * 72)
+    values[30:34] = [70.0, 80.0, 90.0, 100.0]
+    values[50:60] = np.nan
+    values[40:42] = np.nan
+    rolling = reporting.rolling_average(data, "A", "pm10", 8)
+    assert len(rolling) == 72
+    for hour in range(72):
+        window = values[max(0, hour - 7):hour + 1]
+        window = window[~np.isnan(window)]
+        assert rolling[hour] == (round(window.mean(), 3) if len(window) >= 6 else "N/A")
+
+
+def test_rolling_maximum_matches_window_maxima():
+    rolling = reporting.rolling_maximum(make_hourly_data(), "A", "pm10", 3)
+    assert rolling[29:37] == [10.0, 70.0, 80.0, 90.0, 100.0, 100.0, 100.0, 10.0]
+    assert rolling[52:59] == ["N/A"] * 7
+
+
+def test_rolling_times_mark_window_ends():
+    data = make_hourly_data()
+    times = reporting.rolling_times(data, "A")
+    assert len(times) == len(reporting.rolling_average(data, "A", "pm10"))
+    assert times[0] == ("2021-01-01", "01:00:00") and times[23] == ("2021-01-01", "24:00:00")
+    assert times[40] == ("2021-01-02", "17:00:00") and times[-1] == ("2021-01-03", "24:00:00")
+    assert reporting.rolling_times({"A": data["A"].iloc[:0]}, "A") == []
+
+
+def test_rolling_invalid_inputs():
+    with pytest.raises(ValueError):
+        reporting.rolling_average(make_hourly_data(), "A", "pm10", 0)
+    with pytest.raises(KeyError):
+        reporting.rolling_maximum(make_hourly_data(), "B", "pm10")
+
+
+def test_station_objectives_counts_exceedances():
+    objectives = (("PM10", "daily", 24, 15.0, 0, "day"), ("PM10", "hourly", 1, 75.0, 2, "hour"),
+                  ("PM10", "annual", None, 12.0, 0, "year"), ("CO", "8 hour", 8, 10.0, 0, "day max"),
+                  ("NO2", "not measured", 1, 200.0, 18, "hour"))
+    results = reporting.station_objectives(make_hourly_data(), "A", "2021", objectives)
+    assert results == [("PM10", "daily", 1, "NO"), ("PM10", "hourly", 3, "NO"), ("PM10", "annual", 1, "NO"),
+                       ("CO", "8 hour", 0, "YES")]
+    assert reporting.station_objectives(make_hourly_data(), "A", "2022", objectives)[0][3] == "N/A"
+    table = reporting.all_station_objectives(make_hourly_data())
+    assert list(table.columns) == ["station", "year", "species", "objective", "exceedances", "achieved"]
+    assert table["species"].tolist() == ["PM10", "PM10", "CO"] and set(table["year"]) == {"2021"}
+    with pytest.raises(ValueError):
+        reporting.station_objectives(make_hourly_data(), "A", None, objectives)
+
+
+def test_all_station_objectives_checks_each_year():
+    objectives = (("PM10", "hourly", 1, 75.0, 2, "hour"),)
+    df = make_hourly_data()["A"]
+    later = df.assign(date=df["date"].str.replace("2021", "2022"))
+    data = {"A": pd.concat([df, later], ignore_index=True)}  # 3 exceedances a year, 6 altogether
+    table = reporting.all_station_objectives(data, objectives=objectives)
+    assert table[["year", "exceedances", "achieved"]].values.tolist() == [["2021", 3, "NO"], ["2022", 3, "NO"]]
+    objectives = (("PM10", "hourly", 1, 75.0, 4, "hour"),)
+    assert reporting.all_station_objectives(data, objectives=objectives)["achieved"].tolist() == ["YES", "YES"]
+    assert reporting.all_station_objectives(data, year="2022", objectives=objectives)["year"].tolist() == ["2022"]
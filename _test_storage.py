@@ -0,0 +1,223 @@
+"""Tests for loading monitoring station data"""
+import os
+import numpy as np
+import pandas as pd
+import storage
+import pytest
+
+
+def write_csv(path):
+    path.write_text("date,time,no,pm10,pm25\n"
+                    "2021-01-01,23:00:00,1.5,No data,2\n"
+                    "2021-01-01,24:00:00,No data,3.25,4\n")
+    return path
+
+
+def test_read_station_csv_types(tmp_path):
+    df = storage.read_station_csv(write_csv(tmp_path / "station.csv"))
+    assert df["no"].dtype == np.float64
+    assert np.isnan(df["pm10"].iloc[0])
+    assert df["pm10"].iloc[1] == 3.25
+
+
+def test_read_station_csv_midnight(tmp_path):
+    df = storage.read_station_csv(write_csv(tmp_path / "station.csv"))
+    assert str(df.index[1]) == "2021-01-02 00:00:00"
+
+
+def test_station_store_load(tmp_path):
+    write_csv(tmp_path / "Pollution-London Test.csv")
+    store = storage.StationStore.load(["Test"], tmp_path)
+    assert list(store.keys()) == ["Test"]
+
+
+def test_read_station_csv_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        storage.read_station_csv(tmp_path / "missing.csv")
+
+
+def test_load_station_cache_reused(tmp_path):
+    csv = write_csv(tmp_path / "station.csv")
+    cold = storage.load_station(csv, tmp_path / "cache")
+    warm = storage.load_station(csv, tmp_path / "cache")
+    assert warm.equals(cold)
+
+
+def test_load_station_cache_maps_every_column(tmp_path):
+    csv = write_csv(tmp_path / "station.csv")
+    storage.load_station(csv, tmp_path / "cache")
+    warm = storage.load_station(csv, tmp_path / "cache")
+
+    def mapped(array):
+        while array is not None and not isinstance(array, np.memmap):
+            array = array.base
+        return array is not None
+
+    assert all(mapped(storage._column_data(warm[column])) for column in warm.columns)  # dates and times not copied
+    assert list(warm["date"]) == ["2021-01-01"] * 2 and warm["time"].iloc[1] == "24:00:00"
+
+
+def test_load_station_cache_rebuilt(tmp_path):
+    csv = write_csv(tmp_path / "station.csv")
+    storage.load_station(csv, tmp_path / "cache")
+    with open(csv, "a") as file:
+        file.write("2021-01-02,01:00:00,7,8,9\n")
+    assert len(storage.load_station(csv, tmp_path / "cache")) == 3
+
+
+def make_station():
+    times = [f"{hour:0>2}:00:00" for hour in range(1, 25)]
+    return pd.DataFrame({"date": ["2021-01-31"] * 24 + ["2021-02-01"] * 24,
+                         "time": times * 2,
+                         "no": [float(hour % 5) for hour in range(24)] + [np.nan] * 23 + [2.0]})
+
+
+def test_station_aggregates_tables():
+    index = storage.StationAggregates(make_station())
+    day = index.tables["no"]["day"]
+    assert list(day["count"]) == [24, 1] and list(day["missing"]) == [0, 23]
+    assert list(day["argmax"]) == [4, 47] and list(day["argmin"]) == [0, 47]
+    assert list(index.tables["no"]["month"]["count"][:3]) == [24, 1, 0]
+    assert index.mean("no", "hour")[1] == 1.0 and index.mean("no", "hour")[23] == 2.5
+
+
+def test_station_aggregates_filled_matches_rebuild():
+    df = make_station()
+    index = storage.StationAggregates(df)
+    filled = df.copy()
+    missing = np.flatnonzero(np.isnan(df["no"].to_numpy()))
+    filled.loc[np.isnan(df["no"]), "no"] = 9.0
+    updated = index.filled(filled, "no", missing, 9.0)
+    rebuilt = storage.StationAggregates(filled)
+    for grouping in rebuilt.GROUPINGS:
+        for name, column in rebuilt.tables["no"][grouping].items():
+            assert np.array_equal(updated.tables["no"][grouping][name], column, equal_nan=True)
+    assert index.tables["no"]["day"]["missing"][1] == 23  # original index unchanged
+
+
+@pytest.mark.parametrize("new_value", [7.0, 0.1])
+def test_station_aggregates_filled_matches_rebuild_exactly(new_value):
+    csv = os.path.join(os.path.dirname(os.path.abspath(storage.__file__)), "Pollution-London Marylebone Road.csv")
+    df = storage.read_station_csv(csv)
+    index = storage.StationAggregates(df)
+    filled = df.copy()
+    missing = np.flatnonzero(np.isnan(df["pm25"].to_numpy()))
+    filled.loc[np.isnan(df["pm25"]), "pm25"] = new_value
+    updated = index.filled(filled, "pm25", missing, new_value)
+    rebuilt = storage.StationAggregates(filled, ["pm25"])
+    for grouping in rebuilt.GROUPINGS:
+        for name, column in rebuilt.tables["pm25"][grouping].items():
+            assert np.array_equal(updated.tables["pm25"][grouping][name], column, equal_nan=True), (grouping, name)
+
+
+def test_station_store_builds_aggregates():
+    store = storage.StationStore({"Test": make_station()})
+    assert store.aggregates == {}  # built on first use
+    assert store.index("Test").frame is store["Test"] and store.aggregates["Test"] is store.index("Test")
+    store["Test"] = make_station()
+    assert "Test" not in store.aggregates and store.index("Test").frame is store["Test"]
+    del store["Test"]
+    assert store.aggregates == {}
+    store["Other"] = pd.DataFrame({"value": [1.0]})
+    assert store.index("Other") is None
+
+
+def test_station_store_index_rebuilt_after_inplace_change():
+    store = storage.StationStore({"Test": make_station()})
+    index = store.index("Test")
+    assert index.describes(store["Test"]) and store.index("Test") is index
+    store["Test"].loc[24, "no"] = 10.0
+    assert not index.describes(store["Test"])
+    assert store.index("Test").tables["no"]["day"]["count"][1] == 2
+    store["Test"]["time"] = store["Test"]["time"].str.replace("01:00:00", "02:00:00")
+    assert store.index("Test").tables["no"]["hour"]["count"][0] == 0
+
+
+def test_station_store_dict_methods_keep_indexes():
+    store = storage.StationStore({"Test": make_station()})
+    store.index("Test")
+    copied = store.copy()
+    assert type(copied) is storage.StationStore and copied.index("Test") is store.index("Test")
+    store.prepare("Test", store.index("Test").filled(store["Test"].copy(), "no", np.array([30]), 1.0))
+    assert store.pop("Test").equals(make_station())
+    assert store.aggregates == {} and store._prepared == {}
+    frame = make_station()
+    assert store.setdefault("Test", frame) is frame and store.setdefault("Test", None) is frame
+    store |= {"Other": make_station()}
+    assert store.index("Other") is not None
+    store.clear()
+    assert store.aggregates == {} and len(copied) == 1
+
+
+def test_station_aggregates_date_partition():
+    df = make_station().iloc[::-1].reset_index(drop=True)  # dates out of order
+    index = storage.StationAggregates(df)
+    assert list(index.sorted_dates) == ["2021-01-31", "2021-02-01"]
+    assert index.day("2021-01-31") == 1 and index.day("2021-03-01") == -1
+    assert list(index.rows(index.day("2021-01-31"))) == list(range(24, 48))
+    assert list(index.days_between("2021-02-01")) == [0]
+
+
+def test_station_aggregates_appended_matches_rebuild():
+    df = make_station()
+    index = storage.StationAggregates(df.iloc[:30])  # part way through the second day
+    appended = index.appended(df, 30)
+    rebuilt = storage.StationAggregates(df)
+    for name in ("day_order", "times", "sorted_dates", "days_by_date", "row_order", "day_offsets"):
+        assert np.array_equal(getattr(appended, name), getattr(rebuilt, name))
+    for grouping in rebuilt.GROUPINGS:
+        assert np.array_equal(appended.codes[grouping], rebuilt.codes[grouping])
+        for name, column in rebuilt.tables["no"][grouping].items():
+            assert np.array_equal(appended.tables["no"][grouping][name], column, equal_nan=True)
+    assert index.tables["no"]["day"]["count"][0] == 24 and len(index.tables["no"]["day"]["count"]) == 2
+
+
+def test_read_appended_rows_complete_lines_only(tmp_path):
+    csv = write_csv(tmp_path / "station.csv")
+    offset = csv.stat().st_size
+    with open(csv, "a") as file:
+        file.write("2021-01-02,01:00:00,7,8,9\n2021-01-02,02:00:00,1")
+    new, offset = storage.read_appended_rows(csv, offset)
+    assert list(new["no"]) == [7.0] and str(new.index[0]) == "2021-01-02 01:00:00"
+    with open(csv, "a") as file:
+        file.write("0,No data,2\n")
+    new, offset = storage.read_appended_rows(csv, offset)
+    assert list(new["no"]) == [10.0] and np.isnan(new["pm10"].iloc[0])
+    assert offset == csv.stat().st_size
+    assert len(storage.read_appended_rows(csv, offset)[0]) == 0
+    assert len(storage.read_appended_rows(csv, offset - 5)[0]) == 1  # offset part way through a line
+
+
+def test_station_store_refresh_replaced_by_longer_csv(tmp_path):
+    csv = write_csv(tmp_path / "Pollution-London Test.csv")
+    store = storage.StationStore.load(["Test"], tmp_path)
+    replacement = tmp_path / "replacement.csv"
+    replacement.write_text(csv.read_text().replace("1.5", "2.5") + "2021-01-02,01:00:00,7,8,9\n")
+    os.replace(replacement, csv)  # new file longer than the offset read, same header
+    assert store.refresh() == {"Test": 3}
+    assert store["Test"]["no"].iloc[0] == 2.5
+    csv.write_text(csv.read_text().replace("7,8,9", "6,8,9") + "2021-01-02,02:00:00,1,1,1\n")  # rewritten in place
+    assert store.refresh() == {"Test": 4} and store["Test"]["no"].iloc[2] == 6.0
+    csv.unlink()
+    with pytest.raises(FileNotFoundError):
+        store.refresh()
+
+
+def test_station_store_refresh(tmp_path):
+    csv = write_csv(tmp_path / "Pollution-London Test.csv")
+    store = storage.StationStore.load(["Test"], tmp_path, cache_dir=tmp_path / "cache")
+    store.index("Test")  # extended by refresh rather than rebuilt
+    with open(csv, "a") as file:
+        file.write("2021-01-01,24:00:00,5,5,5\n2021-01-02,01:00:00,7,8,9\n")  # first row was already read
+    assert store.refresh() == {"Test": 1}
+    assert len(store["Test"]) == 3 and store.aggregates["Test"].frame is store["Test"]
+    assert store["Test"].dtypes.equals(storage.read_station_csv(csv).dtypes)  # same types as loading the csv again
+    assert list(store.aggregates["Test"].tables["no"]["day"]["count"]) == [1, 1]
+    assert store.refresh() == {"Test": 0}
+    write_csv(csv)  # replaced by a shorter file
+    assert store.refresh(["Test"]) == {"Test": 2}
+    with open(csv, "a") as file:
+        file.write("2021-01-02,01:00:00,7,8,9\n")
+    assert store.refresh() == {"Test": 1}
+    with pytest.raises(KeyError):
+        store.refresh(["Nowhere"])
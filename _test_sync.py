@@ -0,0 +1,128 @@
+"""Tests for syncing London Air API data into the station csv files, run against a local stub of the API"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import datetime
+import json
+import threading
+import numpy as np
+import api
+import reporting
+import storage
+import sync
+import pytest
+
+
+class StubAPI(BaseHTTPRequestHandler):
+    last_hour = datetime.datetime(2021, 1, 3, 5)  # latest hour measured, later hours are listed without values
+    lag = {}  # species code: hours it is measured behind last_hour
+    broken = set()  # species codes answered with an error page
+    requested = []
+
+    def do_GET(self):
+        path = self.path.split("/AirQuality", 1)[1]
+        StubAPI.requested.append(path)
+        start = datetime.datetime.fromisoformat(path.split("StartDate=")[1][:10])
+        end = datetime.datetime.fromisoformat(path.split("EndDate=")[1][:10])
+        species = path.split("SpeciesCode=")[1].split("/")[0]
+        offset = 100 if species == "PM25" else 0
+        last_hour = StubAPI.last_hour - datetime.timedelta(hours=StubAPI.lag.get(species, 0))
+        data = []
+        for hour in range(int((end - start).total_seconds() // 3600) + 1):  # end date included so ranges overlap
+            time = start + datetime.timedelta(hours=hour)
+            value = str(offset + time.hour) if time <= last_hour and time.hour != 7 else ""
+            data.append({"@MeasurementDateGMT": str(time), "@Value": value})
+        body = json.dumps({"RawAQData": {"@SiteCode": "MY1", "Data": data}}).encode()
+        if species in StubAPI.broken:
+            body = b"<html><body>Service Unavailable</body></html>"
+        self.send_response(503 if species in StubAPI.broken else 200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubAPI)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    monkeypatch.setattr(api, "API_URL", f"http://127.0.0.1:{server.server_address[1]}/AirQuality")
+    monkeypatch.setattr(api, "_cache", None)
+    StubAPI.last_hour, StubAPI.lag, StubAPI.broken, StubAPI.requested = datetime.datetime(2021, 1, 3, 5), {}, set(), []
+    yield StubAPI
+    server.shutdown()
+    server.server_close()
+
+
+def test_sync_creates_csv_and_deduplicates(stub, tmp_path):
+    store = storage.StationStore()
+    added = sync.sync(store, ["Marylebone Road"], "2021-01-01", "2021-01-05", tmp_path, days_per_request=1,
+                      max_workers=4)
+    assert added == {"Marylebone Road": 24 * 2 + 6}  # up to the hour ending 06:00 on the third day
+    assert len(stub.requested) == 4 * 2
+    df = store["Marylebone Road"]
+    assert list(df.columns) == ["date", "time", "no", "pm10", "pm25"] and np.isnan(df["no"]).all()
+    assert (df["time"].iloc[0], df["pm10"].iloc[0], df["pm25"].iloc[0]) == ("01:00:00", 0.0, 100.0)
+    assert (df["date"].iloc[23], df["time"].iloc[23], df["pm10"].iloc[23]) == ("2021-01-01", "24:00:00", 23.0)
+    assert reporting.count_missing_data(store, "Marylebone Road", "pm10") == 2  # hour from 07:00 of the first two days
+    assert reporting.daily_average(store, "Marylebone Road", "pm10")[0] == round((276 - 7) / 23, 3)
+
+
+def test_sync_resumes_from_last_hour(stub, tmp_path):
+    store = storage.StationStore()
+    sync.sync(store, ["Marylebone Road"], "2021-01-01", "2021-01-05", tmp_path, max_workers=1)
+    index = store.index("Marylebone Road")  # extended with the new hours by the next sync
+    stub.last_hour, stub.requested = datetime.datetime(2021, 1, 4, 2), []
+    added = sync.sync(store, ["Marylebone Road"], end_date="2021-01-05", directory=tmp_path)
+    assert added == {"Marylebone Road": 21}
+    assert all("StartDate=2021-01-03" in path for path in stub.requested)
+    df = store["Marylebone Road"]
+    assert df.index.is_unique and len(df) == 24 * 3 + 3
+    assert store.aggregates["Marylebone Road"] is not index and store.aggregates["Marylebone Road"].describes(df)
+    assert storage.read_station_csv(tmp_path / "Pollution-London Marylebone Road.csv")["pm25"].equals(df["pm25"])
+
+
+def test_sync_waits_for_lagging_species(stub, tmp_path):
+    store = storage.StationStore()
+    stub.lag = {"PM25": 3}
+    added = sync.sync(store, ["Marylebone Road"], "2021-01-01", "2021-01-05", tmp_path, max_workers=1)
+    assert added == {"Marylebone Road": 24 * 2 + 3}  # up to the hour ending 03:00, the last with a pm25 value
+    stub.lag = {}
+    assert sync.sync(store, ["Marylebone Road"], end_date="2021-01-05", directory=tmp_path) == {"Marylebone Road": 3}
+    df = store["Marylebone Road"]
+    assert df["pm25"].iloc[-3:].tolist() == [103.0, 104.0, 105.0] and df["pm10"].iloc[-1] == 5.0
+    stub.last_hour, stub.lag = datetime.datetime(2021, 1, 4, 10), {"PM25": 30}  # taken to have stopped
+    assert sync.sync(store, ["Marylebone Road"], end_date="2021-01-05", directory=tmp_path) == {"Marylebone Road": 29}
+    assert np.isnan(store["Marylebone Road"]["pm25"].iloc[-29:]).all()
+
+
+def test_sync_failed_response_writes_nothing(stub, tmp_path):
+    store = storage.StationStore()
+    stub.broken = {"PM25"}
+    with pytest.raises(ValueError):
+        sync.sync(store, ["Marylebone Road"], "2021-01-01", "2021-01-05", tmp_path, max_workers=4)
+    assert not (tmp_path / "Pollution-London Marylebone Road.csv").exists() and len(store) == 0
+    stub.broken = set()
+    sync.sync(store, ["Marylebone Road"], "2021-01-01", "2021-01-05", tmp_path, max_workers=4)
+    csv = (tmp_path / "Pollution-London Marylebone Road.csv").read_bytes()
+    stub.last_hour, stub.broken = datetime.datetime(2021, 1, 4, 2), {"PM10"}
+    with pytest.raises(ValueError):
+        sync.sync(store, ["Marylebone Road"], end_date="2021-01-05", directory=tmp_path, max_workers=1)
+    assert (tmp_path / "Pollution-London Marylebone Road.csv").read_bytes() == csv
+    assert len(store["Marylebone Road"]) == 24 * 2 + 6
+
+
+def test_sync_appends_to_csv_without_final_newline(stub, tmp_path):
+    csv = tmp_path / "Pollution-London Harlington.csv"
+    csv.write_text("date,time,no,pm10,pm25\n2021-01-03,01:00:00,1,2,3")
+    store = storage.StationStore.load(["Harlington"], tmp_path)
+    assert sync.sync(store, ["Harlington"], end_date="2021-01-04", directory=tmp_path) == {"Harlington": 5}
+    assert store["Harlington"]["no"].iloc[0] == 1.0 and np.isnan(store["Harlington"]["no"].iloc[1:]).all()
+    assert list(store["Harlington"]["pm10"]) == [2.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+
+
+def test_sync_invalid_inputs(tmp_path):
+    with pytest.raises(KeyError):
+        sync.sync(storage.StationStore(), ["Nowhere"], "2021-01-01", directory=tmp_path)
+    with pytest.raises(ValueError):
+        sync.sync(storage.StationStore(), ["Harlington"], directory=tmp_path)
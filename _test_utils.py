@@ -1,4 +1,5 @@
 """Tests for the utility functions"""
+import numpy as np
 import utils
 import pytest
 
@@ -94,6 +95,13 @@ def test_sort_list_standard():
     assert utils.sort_list([3, 1, 2, 4]) == [4, 3, 2, 1]
 
 
+def test_sort_list_iterables():
+    assert utils.sort_list(value for value in [3, 1, 2]) == [3, 2, 1]
+    assert utils.sort_list({"a": 2, "b": 5.0, "c": 1}.values()) == [5.0, 2, 1]
+    assert utils.sort_list({4, 1}) == [4, 1]
+    assert utils.median({"a": 2, "b": 5.0, "c": 1}.values()) == 2
+
+
 def test_sort_list_empty_list():
     assert utils.sort_list([]) == []
 
@@ -116,3 +124,154 @@ def test_median_non_numerical():
     with pytest.raises(TypeError):
         utils.median(["a", "b", "c"])
 
+
+
+def test_sort_list_equal_values():
+    sorted_l = utils.sort_list([1, 2, 1.0])
+    assert sorted_l == [2, 1, 1] and type(sorted_l[1]) is float
+
+
+def test_median_even_length():
+    assert utils.median([4, 1, 3, 2]) == 2.5
+
+
+def test_median_numpy_array():
+    assert utils.median(np.array([5.0, 1.0, 4.0, 2.0])) == 3.0
+
+
+def test_median_numpy_array_empty():
+    with pytest.raises(IndexError):
+        utils.median(np.array([]))
+
+
+def test_median_numpy_array_non_numerical():
+    with pytest.raises(TypeError):
+        utils.median(np.array(["a", "b"]))
+
+
+
+def test_array_aggregates_match_lists():
+    values = [3.5, 1, 7, 7, -2.25]
+    for arr in (np.array(values), np.array(values, dtype=np.float32)):
+        assert utils.sumvalues(arr) == pytest.approx(utils.sumvalues(values))
+        assert utils.maxvalue(arr) == utils.maxvalue(values) == 2
+        assert utils.minvalue(arr) == utils.minvalue(values) == 4
+        assert utils.meannvalue(arr) == pytest.approx(utils.meannvalue(values))
+        assert utils.countvalue(arr, 7) == utils.countvalue(values, 7) == 2
+        assert utils.length(arr) == utils.length(values) == 5
+
+
+def test_array_aggregates_return_python_numbers():
+    assert type(utils.sumvalues(np.arange(4))) is int
+    assert type(utils.maxvalue(np.arange(4))) is int
+    assert type(utils.meannvalue(np.arange(4))) is float
+
+
+def test_array_like_buffers():
+    import array
+    buffer = array.array("d", [2.0, 9.0, 4.0])
+    assert utils.sumvalues(buffer) == 15.0
+    assert utils.maxvalue(memoryview(buffer)) == 1
+
+
+def test_array_aggregates_errors():
+    with pytest.raises(IndexError):
+        utils.maxvalue(np.array([]))
+    with pytest.raises(IndexError):
+        utils.minvalue(np.array([]))
+    with pytest.raises(ZeroDivisionError):
+        utils.meannvalue(np.array([]))
+    with pytest.raises(TypeError):
+        utils.sumvalues(np.array(["a", "b"]))
+    with pytest.raises(TypeError):
+        utils.maxvalue(np.array([True, False]))
+
+
+def test_maxvalue_does_not_print(capsys):
+    utils.maxvalue([1, 3, 2])
+    assert capsys.readouterr().out == ""
+
+
+def test_skip_nan_arrays_and_lists():
+    values = [float("nan"), 4.0, 1.0, float("nan"), 3.0]
+    for data in (values, np.array(values)):
+        assert utils.sumvalues(data, skip_nan=True) == 8.0
+        assert utils.maxvalue(data, skip_nan=True) == 1
+        assert utils.minvalue(data, skip_nan=True) == 2
+        assert utils.meannvalue(data, skip_nan=True) == pytest.approx(8 / 3)
+        assert utils.median(data, skip_nan=True) == 3.0
+
+
+def test_skip_nan_all_nan():
+    for data in ([float("nan")], np.array([np.nan, np.nan])):
+        with pytest.raises(IndexError):
+            utils.maxvalue(data, skip_nan=True)
+        with pytest.raises(ZeroDivisionError):
+            utils.meannvalue(data, skip_nan=True)
+
+
+
+def test_running_mean_matches_numpy():
+    values = np.random.default_rng(1).normal(40, 12, 1001)
+    running = utils.RunningMean()
+    for value in values[:10]:
+        running.update(float(value))
+    running.update(values[10:])
+    mean, variance = running.result()
+    assert mean == pytest.approx(values.mean()) and variance == pytest.approx(values.var())
+    assert running.result(ddof=1)[1] == pytest.approx(values.var(ddof=1))
+
+
+def test_running_mean_merge_and_nan():
+    left, right = utils.RunningMean().update([1, 2, float("nan")]), utils.RunningMean().update(np.array([3.0, 4.0]))
+    assert left.merge(right).result() == pytest.approx((2.5, 1.25))
+    assert left.count == 4
+    with pytest.raises(ZeroDivisionError):
+        utils.RunningMean().update([float("nan")]).result()
+    with pytest.raises(TypeError):
+        utils.RunningMean().update(["a"])
+
+
+def test_running_extremes_positions():
+    extremes = utils.RunningExtremes().update([float("nan"), 3.0, 1.0])
+    later = utils.RunningExtremes().update(np.array([9.0, 1.0, 9.0]))
+    assert extremes.merge(later).result() == (2, 1.0, 3, 9.0)
+    values = [5, 2, 8, 2, 8]
+    assert utils.RunningExtremes().update(values).result() == (utils.minvalue(values), 2, utils.maxvalue(values), 8)
+    with pytest.raises(IndexError):
+        utils.RunningExtremes().result()
+
+
+def test_streaming_quantiles_exact_when_small():
+    digest = utils.StreamingQuantiles().update([4, 1, 3, 2])
+    assert digest.result() == utils.median([4, 1, 3, 2])
+    assert digest.update(10).result() == 3.0
+    assert digest.result(0) == 1.0 and digest.result(1) == 10.0
+
+
+def test_streaming_quantiles_large_and_merged():
+    values = np.random.default_rng(2).gamma(2, 10, 50000)
+    digest = utils.StreamingQuantiles()
+    for part in np.array_split(values, 20):
+        digest.update(part)
+    other = utils.StreamingQuantiles().update(values[:25000]).merge(utils.StreamingQuantiles().update(values[25000:]))
+    for estimate in (digest, other):
+        assert estimate.result() == pytest.approx(np.median(values), rel=0.01)
+        assert estimate.result(0.9) == pytest.approx(np.quantile(values, 0.9), rel=0.01)
+        assert len(estimate._means) < 2 * estimate.compression
+    with pytest.raises(ValueError):
+        digest.result(1.5)
+    with pytest.raises(IndexError):
+        utils.StreamingQuantiles().result()
+
+
+def test_streaming_quantiles_exact_below_compression():
+    values = np.random.default_rng(3).random(99)
+    digest = utils.StreamingQuantiles()
+    for part in np.array_split(values, 7):
+        digest.update(part)
+    for q in (0, 0.1, 0.25, 0.5, 0.9, 1):
+        assert digest.result(q) == np.quantile(values, q)
+    merged = utils.StreamingQuantiles().update(values[:40]).merge(utils.StreamingQuantiles().update(values[40:]))
+    assert merged.result() == np.median(values)
+    assert len(digest.update(values).update(values)._means) < len(values) * 3  # merged once past compression
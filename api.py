@@ -0,0 +1,398 @@
+from concurrent.futures import ThreadPoolExecutor
+import codecs
+import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+import instrument
+
+API_URL = "https://api.erg.ic.ac.uk/AirQuality"  # base url of the London Air API, can be pointed at a local server
+MAX_WORKERS = 8  # default number of requests made at the same time
+TIMEOUT = 30  # seconds to wait for the API to accept a connection or send the next part of a response
+
+CHUNK_SIZE = 2 ** 16  # bytes read from a streamed response at a time
+
+_session = None  # shared session so connections are reused between requests
+_pool_size = 0  # most connections the session keeps open to one host
+_cache = None  # ResponseCache used by fetch, None if responses are not cached
+
+
+class ResponseCache:
+    """
+Keeps API responses on disk so the same url is only requested once. Responses for urls whose dates are all older than
+recent_days ago never change so never expire, responses for recent or undated urls expire after recent_ttl seconds.
+When the cache grows beyond max_bytes the least recently used responses are removed
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 2 ** 20, recent_days: int = 7, recent_ttl: float = 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.recent_days = recent_days
+        self.recent_ttl = recent_ttl
+        self._lock = threading.Lock()  # responses can be stored from several fetch_all threads at once
+        self._last_used = 0  # nanosecond time of the most recent use, used to order uses made within one clock tick
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith(".response"))
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(url.encode()).hexdigest() + ".response")
+
+    def is_historic(self, url: str) -> bool:
+        """
+Checks whether every date or year in a url is older than recent_days ago, meaning its data can no longer change
+
+     Args:
+         url: full url of the request
+
+     Returns:
+         historic: True if the url only refers to old dates, False if it refers to recent dates or no dates
+        """
+        latest = [datetime.date.fromisoformat(date) for date in re.findall(r"Date=(\d{4}-\d{2}-\d{2})", url)]
+        latest += [datetime.date(int(year), 12, 31) for year in re.findall(r"Year=(\d{4})", url)]
+        if len(latest) == 0:  # undated request e.g. list of sites
+            return False
+        return max(latest) < datetime.date.today() - datetime.timedelta(days=self.recent_days)
+
+    def open(self, url: str):
+        """
+Opens the cached response for a url for reading and marks it as recently used
+
+     Args:
+         url: full url of the request
+
+     Returns:
+         file: binary file positioned at the start of the response body, None if not cached or expired
+        """
+        path = self._path(url)
+        try:
+            file = open(path, "rb")
+        except OSError:
+            return None
+        try:
+            fetched = float(file.readline())  # first line is the time the response was fetched
+        except ValueError:
+            file.close()
+            return None
+        if not self.is_historic(url) and time.time() - fetched > self.recent_ttl:
+            file.close()
+            return None
+        self._touch(path)
+        return file
+
+    def get(self, url: str) -> bytes or None:
+        """
+Returns the cached response for a url and marks it as recently used
+
+     Args:
+         url: full url of the request
+
+     Returns:
+         content: bytes of the cached response body, None if not cached or expired
+        """
+        file = self.open(url)
+        if file is None:
+            return None
+        with file:
+            return file.read()
+
+    def _touch(self, path: str):
+        """
+Sets the modification time of a response to now, which records when it was last used. Times always increase even
+when the filesystem clock has not ticked between uses
+        """
+        with self._lock:
+            self._last_used = max(time.time_ns(), self._last_used + 1)
+            used = self._last_used
+        try:
+            os.utime(path, ns=(used, used))
+        except OSError:  # response removed by another thread
+            pass
+
+    def put(self, url: str, content: bytes):
+        """
+Stores the response for a url then removes least recently used responses until the cache is within max_bytes
+
+     Args:
+         url: full url of the request
+         content: bytes of the response body
+        """
+        for _ in self.store(url, [content]):
+            pass
+
+    def store(self, url: str, chunks):
+        """
+Passes on the chunks of a response body while writing them to the cache. The response is only added to the cache
+once every chunk has been read, so a response that is not read to the end is never cached
+
+     Args:
+         url: full url of the request
+         chunks: iterable of bytes making up the response body
+
+     Yields:
+         chunk: each chunk of chunks unchanged
+        """
+        path = self._path(url)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as file:
+                file.write(f"{time.time()}\n".encode())
+                for chunk in chunks:
+                    file.write(chunk)
+                    yield chunk
+            with self._lock:
+                if os.path.exists(path):
+                    self._size -= os.path.getsize(path)
+                os.replace(temp_path, path)  # readers never see a partly written response
+                self._size += os.path.getsize(path)
+        finally:
+            if os.path.exists(temp_path):  # response was not read to the end
+                os.remove(temp_path)
+        self._touch(path)
+        with self._lock:
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """
+Deletes responses in order of least recent use until the cache is within max_bytes
+        """
+        entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".response")]
+        entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+        for entry in entries:
+            if self._size <= self.max_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self._size -= size
+
+
+def set_cache(cache: ResponseCache or None):
+    """
+Sets the cache used by fetch and fetch_all
+
+    Args:
+        cache: ResponseCache to store responses in, None to stop caching
+    """
+    global _cache
+    _cache = cache
+
+
+def get_session(max_workers: int = None) -> requests.Session:
+    """
+Returns the session used for every request to the API, creating it on first use. The session keeps a pool of open
+connections so repeated requests don't each pay for a new TCP and TLS handshake. The pool is made big enough for
+max_workers requests at once, so no thread's connection is thrown away when it finishes
+
+    Args:
+        max_workers: number of requests that will be made at the same time, MAX_WORKERS if None
+
+    Returns:
+        session: requests.Session shared by all requests
+    """
+    global _session, _pool_size
+    size = MAX_WORKERS if max_workers is None else max_workers
+    if _session is None:
+        _session = requests.Session()
+    if size > _pool_size:  # the pool only ever grows
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=size)
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+        _pool_size = size
+    return _session
+
+
+@instrument.timed
+def fetch(url: str) -> bytes:
+    """
+Requests a url using the shared session and returns the body of the response. If a cache has been set with
+set_cache the cached response is returned when there is one, otherwise successful responses are added to it
+
+    Args:
+        url: full url to request
+
+    Returns:
+        content: bytes of the response body
+
+    Raises:
+        requests.RequestException: the request could not be made or took longer than TIMEOUT
+    """
+    if _cache is not None:
+        content = _cache.get(url)
+        if content is not None:
+            return content
+
+    with instrument.phase("request"):
+        res = get_session().get(url, timeout=TIMEOUT)
+    instrument.add(bytes=len(res.content))
+    if _cache is not None and res.ok:  # error pages are not cached
+        _cache.put(url, res.content)
+    return res.content
+
+
+@instrument.timed
+def fetch_all(urls: list[str], max_workers: int = None) -> list[bytes]:
+    """
+Requests every url at the same time using a pool of at most max_workers threads. Responses are returned in the same
+order as urls regardless of the order they arrive in
+
+    Args:
+        urls: list of full urls to request
+        max_workers: maximum number of requests in progress at once, MAX_WORKERS if None
+
+    Returns:
+        contents: list of the bytes of each response body
+
+    Raises:
+        requests.RequestException: a request could not be made
+    """
+    if max_workers is None:
+        max_workers = MAX_WORKERS
+    if len(urls) <= 1 or max_workers <= 1:
+        return [fetch(url) for url in urls]
+    get_session(max_workers)  # sized before the threads share it
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as pool:
+        return list(pool.map(fetch, urls))
+
+
+def stream(url: str):
+    """
+Requests a url and yields the response body a chunk at a time as it arrives, so the whole body is never held in
+memory. If a cache has been set with set_cache a cached response is read from disk in chunks instead, otherwise a
+successful response is written to the cache as it is streamed
+
+    Args:
+        url: full url to request
+
+    Yields:
+        chunk: bytes of the next part of the response body
+
+    Raises:
+        requests.RequestException: the request could not be made or took longer than TIMEOUT
+    """
+    if _cache is not None:
+        file = _cache.open(url)
+        if file is not None:
+            with file:
+                yield from iter(lambda: file.read(CHUNK_SIZE), b"")
+            return
+
+    with get_session().get(url, stream=True, timeout=TIMEOUT) as res:
+        chunks = res.iter_content(CHUNK_SIZE)
+        if _cache is not None and res.ok:  # error pages are not cached
+            chunks = _cache.store(url, chunks)
+        for chunk in chunks:
+            instrument.add("api.stream", bytes=len(chunk))  # counted by name as streams run on pool threads
+            yield chunk
+
+
+@instrument.timed
+def stream_all(urls: list[str], parse, max_workers: int = None) -> list:
+    """
+Streams every url at the same time using a pool of at most max_workers threads, passing each stream of chunks to
+parse. Results are returned in the same order as urls
+
+    Args:
+        urls: list of full urls to request
+        parse: function taking an iterable of response body chunks
+        max_workers: maximum number of requests in progress at once, MAX_WORKERS if None
+
+    Returns:
+        results: list of what parse returned for each url
+
+    Raises:
+        requests.RequestException: a request could not be made
+    """
+    if max_workers is None:
+        max_workers = MAX_WORKERS
+    if len(urls) <= 1 or max_workers <= 1:
+        return [parse(stream(url)) for url in urls]
+    get_session(max_workers)  # sized before the threads share it
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as pool:
+        return list(pool.map(lambda url: parse(stream(url)), urls))
+
+
+# strings, braces, and an opening quote whose string has not fully arrived yet
+_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[{}]|"')
+
+
+@instrument.timed
+def read_raw_values(chunks, expected: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """
+Parses the measurements of a RawAQData response incrementally as its chunks arrive. The response is scanned for its
+strings and braces, so braces inside strings are ignored, and each innermost object such as a measurement is decoded
+on its own and written straight into numpy arrays. The response is never built into one large dictionary.
+The arrays start with space for expected measurements and double in size when they run out
+
+    Args:
+        chunks: iterable of bytes making up a RawAQData response body
+        expected: number of measurements expected, e.g. the number of hours requested
+
+    Returns:
+        dates: 1D numpy datetime64 array of the '@MeasurementDateGMT' of each measurement
+        values: 1D numpy float array of the '@Value' of each measurement, NaN where the value is empty
+
+    Raises:
+        ValueError: the response is not a complete RawAQData object, e.g. an error page
+    """
+    dates = np.empty(max(expected, 16), dtype="datetime64[s]")
+    values = np.empty(len(dates), dtype=np.float64)
+    count = 0
+
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    text = ""
+    position = 0  # where scanning carries on from in text
+    depth = 0  # number of objects open
+    start = None  # position in text of the open object if it has no objects inside it
+    first_key = None
+    for chunk in chunks:
+        text += decoder.decode(chunk)
+        if first_key is None and text.strip() and not text.lstrip().startswith("{"):
+            raise ValueError(f"Response is not JSON: {text.strip()[:50]!r}")
+        for match in _TOKEN.finditer(text, position):
+            token = match.group()
+            if token == '"':  # rest of the string is in the next chunk
+                break
+            position = match.end()
+            if token == "{":
+                depth += 1
+                start = match.start()
+            elif token == "}":
+                depth -= 1
+                if start is None:
+                    continue
+                try:
+                    record = json.loads(text[start:position])
+                    date, value = record["@MeasurementDateGMT"], record["@Value"]
+                except (ValueError, KeyError, TypeError):  # not a measurement
+                    start = None
+                    continue
+                start = None
+                if count == len(dates):  # out of space so double the arrays
+                    dates = np.resize(dates, 2 * count)
+                    values = np.resize(values, 2 * count)
+                dates[count] = date
+                try:
+                    values[count] = float(value)
+                except (ValueError, TypeError):  # empty value means no data for that time
+                    values[count] = np.nan
+                count += 1
+            elif first_key is None and depth == 1:
+                first_key = json.loads(token)
+                if first_key != "RawAQData":
+                    raise ValueError(f"Response is not RawAQData: {text.strip()[:50]!r}")
+        # keep only text that could be the start of a measurement not fully received yet
+        keep = position if start is None else start
+        text, position = text[keep:], position - keep
+        start = None if start is None else 0
+    if first_key is None or depth != 0:
+        raise ValueError("Response is not a complete RawAQData object")
+    return dates[:count], values[:count]
@@ -0,0 +1,328 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import threading
+import time
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+GROUPS = ["utils", "reporting", "intelligence", "monitoring"]
+ROWS_PER_YEAR = 8760  # rows in each bundled station csv, one per hour of 2021
+STATIONS = ["Synthetic A", "Synthetic B"]
+
+
+def make_station_csv(filename: str, scale: int, seed: int = 0):
+    """
+Writes a synthetic monitoring station csv in the same format as the bundled ones with scale years of hourly rows.
+Values follow a gamma distribution with about 5% 'No data' and whole days missing now and then
+
+     Args:
+         filename: file location to write the csv to
+         scale: number of years of data, 1 gives the 8,760 rows of a bundled csv
+         seed: seed for the random values so the same csv is made every time
+     """
+    rng = np.random.default_rng(seed)
+    days = pd.date_range("2021-01-01", periods=365 * scale, freq="D").strftime("%Y-%m-%d")
+    df = pd.DataFrame({"date": np.repeat(days.to_numpy(), 24),
+                       "time": np.tile([f"{hour:0>2}:00:00" for hour in range(1, 25)], len(days))})
+    for pollutant, shape in (("no", 1.5), ("pm10", 3.0), ("pm25", 2.0)):
+        values = rng.gamma(shape, 8.0, len(df))
+        values[rng.random(len(df)) < 0.05] = np.nan
+        values[np.repeat(rng.random(len(days)) < 0.01, 24)] = np.nan  # days without any data
+        df[pollutant] = values
+    df.to_csv(filename, index=False, na_rep="No data", float_format="%.5f")
+
+
+def make_map_png(filename: str, size: int, seed: int = 0):
+    """
+Writes a synthetic size x size map with red and cyan blobs on a grey background, like the bundled map.png
+
+     Args:
+         filename: file location to write the png to
+         size: width and height of the map in pixels
+         seed: seed for the blob positions so the same map is made every time
+     """
+    rng = np.random.default_rng(seed)
+    img = np.full((size, size, 3), 200, dtype=np.uint8)
+    rows, columns = np.ogrid[:size, :size]
+    for colour in ((255, 0, 0), (0, 255, 255)):
+        for _ in range(max(size // 16, 4)):
+            row, column, radius = rng.integers(0, size), rng.integers(0, size), rng.integers(1, max(size // 40, 2) + 1)
+            img[(rows - row) ** 2 + (columns - column) ** 2 <= radius ** 2] = colour
+    Image.fromarray(img).save(filename)
+
+
+def time_call(function, *args, repeat: int = 3, **kwargs) -> dict:
+    """
+Calls a function repeat times and returns the fastest and median time in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times), "repeat": repeat}
+
+
+def bench_utils(workdir: str, scales: list, repeat: int) -> list[dict]:
+    import utils
+    results = []
+    for scale in scales:
+        values = np.random.default_rng(scale).gamma(2.0, 8.0, ROWS_PER_YEAR * scale)
+        values[::20] = np.nan
+        finite = values[~np.isnan(values)]
+        inputs = {"list": finite.tolist(), "array": finite}
+        for kind, data in inputs.items():
+            for name in ("sumvalues", "maxvalue", "minvalue", "meannvalue", "length", "median"):
+                timing = time_call(getattr(utils, name), data, repeat=repeat)
+                results.append({"group": "utils", "name": f"{name}[{kind}]", "scale": scale, **timing})
+            timing = time_call(utils.countvalue, data, data[0], repeat=repeat)
+            results.append({"group": "utils", "name": f"countvalue[{kind}]", "scale": scale, **timing})
+        timing = time_call(utils.sort_list, inputs["list"], repeat=repeat)
+        results.append({"group": "utils", "name": "sort_list[list]", "scale": scale, **timing})
+        for name in ("sumvalues", "maxvalue", "meannvalue", "median"):
+            timing = time_call(getattr(utils, name), values, skip_nan=True, repeat=repeat)
+            results.append({"group": "utils", "name": f"{name}[array,skip_nan]", "scale": scale, **timing})
+        for name in ("RunningMean", "RunningExtremes", "StreamingQuantiles"):
+            accumulator = getattr(utils, name)
+            timing = time_call(lambda: accumulator().update(values).result(), repeat=repeat)
+            results.append({"group": "utils", "name": f"{name}.update", "scale": scale, **timing})
+    return results
+
+
+def bench_reporting(workdir: str, scales: list, repeat: int) -> list[dict]:
+    import reporting
+    import storage
+    results = []
+    for scale in scales:
+        folder = os.path.join(workdir, f"stations-{scale}x")
+        os.makedirs(folder, exist_ok=True)
+        for seed, station in enumerate(STATIONS):
+            filename = os.path.join(folder, f"Pollution-London {station}.csv")
+            if not os.path.exists(filename):  # synthetic data is only made once
+                make_station_csv(filename, scale, seed)
+        filename = os.path.join(folder, f"Pollution-London {STATIONS[0]}.csv")
+
+        def add(name, timing):
+            results.append({"group": "reporting", "name": name, "scale": scale, **timing})
+
+        add("read_csv[raw]", time_call(pd.read_csv, filename, repeat=repeat))
+        add("read_station_csv", time_call(storage.read_station_csv, filename, repeat=repeat))
+        cache_dir = os.path.join(folder, ".station_cache")
+        storage.load_station(filename, cache_dir)  # warm the cache
+        add("load_station[cached]", time_call(storage.load_station, filename, cache_dir, repeat=repeat))
+        add("StationAggregates", time_call(storage.StationAggregates, storage.read_station_csv(filename),
+                                           repeat=repeat))
+
+        layouts = {"dict": {STATIONS[0]: pd.read_csv(filename)},
+                   "store": storage.StationStore.load(STATIONS, folder, cache_dir=cache_dir)}
+        date = layouts["dict"][STATIONS[0]]["date"].iloc[24 * 100]
+        for layout, data in layouts.items():
+            for name in ("daily_average", "daily_median", "hourly_average", "monthly_average", "count_missing_data",
+                         "peak_hours"):
+                add(f"{name}[{layout}]", time_call(getattr(reporting, name), data, STATIONS[0], "no", repeat=repeat))
+            add(f"peak_hour_date[{layout}]", time_call(reporting.peak_hour_date, data, date, STATIONS[0], "no",
+                                                       repeat=repeat))
+            add(f"fill_missing_data[{layout}]", time_call(reporting.fill_missing_data, data, "0", STATIONS[0], "no",
+                                                          repeat=repeat))
+        for strategy in reporting.FILL_STRATEGIES:
+            add(f"fill_missing[{strategy}]", time_call(reporting.fill_missing, layouts["store"], [STATIONS[0]],
+                                                       strategy=strategy, new_value=0, repeat=repeat))
+        for workers in (1, 2):
+            add(f"report_all[workers={workers}]", time_call(reporting.report_all, layouts["store"],
+                                                            max_workers=workers, repeat=repeat))
+    return results
+
+
+def bench_intelligence(workdir: str, sizes: list, repeat: int) -> list[dict]:
+    from matplotlib import pyplot as plt
+    import intelligence
+    results = []
+    start_dir = os.getcwd()
+    for size in sizes:
+        folder = os.path.join(workdir, f"map-{size}")
+        os.makedirs(folder, exist_ok=True)
+        os.chdir(folder)  # intelligence writes its output images to the working directory
+        try:
+            if not os.path.exists("map.png"):
+                make_map_png("map.png", size)
+
+            def add(name, timing):
+                results.append({"group": "intelligence", "name": name, "size": size, **timing})
+
+            rules = [(0, ">", 100), (1, "<", 50), (2, "<", 50)]  # red pixels, the same as find_red_pixels
+            add("colour_mask", time_call(intelligence.colour_mask, plt.imread("map.png"), rules, repeat=repeat))
+            add("find_colour_pixels", time_call(intelligence.find_colour_pixels, "map.png", rules,
+                                                "map-colour-pixels.jpg", repeat=repeat))
+            add("find_red_pixels", time_call(intelligence.find_red_pixels, "map.png", repeat=repeat))
+            add("find_cyan_pixels", time_call(intelligence.find_cyan_pixels, "map.png", repeat=repeat))
+            add("find_red_pixels[banded]", time_call(intelligence.find_red_pixels, "map.png",
+                                                     band_height=max(size // 8, 1), repeat=repeat))
+            mask = plt.imread("map-red-pixels.jpg")[:, :, 0] > 200  # red pixels are white in the output image
+            add("label_components", time_call(intelligence.label_components, mask, repeat=repeat))
+            add("label_components_tiled", time_call(intelligence.label_components_tiled, "map-red-pixels.jpg",
+                                                    max(size // 8, 1), repeat=repeat))
+            add("detect_connected_components", time_call(intelligence.detect_connected_components,
+                                                         "map-red-pixels.jpg", repeat=repeat))
+            MARK = intelligence.detect_connected_components("map-red-pixels.jpg")
+            add("detect_connected_components_sorted", time_call(intelligence.detect_connected_components_sorted,
+                                                                MARK, repeat=repeat))
+        finally:
+            os.chdir(start_dir)
+    return results
+
+
+class StubAPI(BaseHTTPRequestHandler):
+    """
+Local stand in for the London Air API returning synthetic responses, so monitoring can be timed without a network
+    """
+
+    def do_GET(self):
+        path = self.path.split("/AirQuality", 1)[1]
+        if path.startswith("/Daily/MonitoringIndex"):
+            species = [{"@SpeciesCode": code, "@AirQualityIndex": "2"} for code in ("NO2", "PM10", "PM25")]
+            body = {"DailyAirQualityIndex": {"LocalAuthority": {"Site": {"Species": species}}}}
+        elif path.startswith("/Data/SiteSpecies"):
+            start = datetime.datetime.fromisoformat(path.split("StartDate=")[1][:10])
+            end = datetime.datetime.fromisoformat(path.split("EndDate=")[1][:10])
+            hours = int((end - start).total_seconds() // 3600)
+            data = [{"@MeasurementDateGMT": str(start + datetime.timedelta(hours=hour)), "@Value": str(hour % 50)}
+                    for hour in range(hours + 1)]
+            body = {"RawAQData": {"@SiteCode": "XX", "Data": data}}
+        elif path.startswith("/Annual/MonitoringObjective"):
+            objectives = [{"@SpeciesCode": "NO2", "@ObjectiveName": str(number), "@Achieved": "YES"}
+                          for number in range(10)]
+            body = {"SiteObjectives": {"Site": {"Objective": objectives}}}
+        else:
+            body = {}
+        content = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+def bench_monitoring(workdir: str, repeat: int) -> list[dict]:
+    from matplotlib import pyplot as plt
+    import api
+    import monitoring
+    results = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubAPI)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    api_url, cache, show = api.API_URL, api._cache, plt.show
+    api.API_URL = f"http://127.0.0.1:{server.server_address[1]}/AirQuality"
+    api.set_cache(None)  # every call goes to the stub
+    plt.show = lambda: plt.close("all")  # graphs are drawn but never shown
+    try:
+        def add(name, timing):
+            results.append({"group": "monitoring", "name": name, **timing})
+
+        add("air_quality_indexes", time_call(monitoring.air_quality_indexes, "MY1", repeat=repeat))
+        add("compare_sites", time_call(monitoring.compare_sites, "MY1", "BL0", "NO2", repeat=repeat))
+        add("compare_species", time_call(monitoring.compare_species, ["MY1", "BL0", "KC1"], ["NO2", "PM10"],
+                                         repeat=repeat))
+        add("monthly_average", time_call(monitoring.monthly_average, "MY1", "NO2", "2021", repeat=repeat))
+        add("year_objectives", time_call(monitoring.year_objectives, "MY1", "2021", repeat=repeat))
+    finally:
+        api.API_URL, plt.show = api_url, show
+        api.set_cache(cache)
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def run(workdir: str = "./benchmark_data", scales: list = (1, 10, 100), sizes: list = (256, 1024, 2048),
+        repeat: int = 3, groups: list = GROUPS) -> dict:
+    """
+Times every benchmark group. Synthetic station csvs and maps are written to workdir the first time they are
+needed and reused after that, so repeated runs time the same data
+
+     Args:
+         workdir: folder to keep synthetic data and output images in
+         scales: sizes of the synthetic station csvs in years of hourly rows
+         sizes: widths of the synthetic square maps in pixels
+         repeat: number of times each function is timed
+         groups: benchmark groups to run from GROUPS
+
+     Returns:
+         report: dictionary describing the machine and a list of timing results in 'results'
+     """
+    os.makedirs(workdir, exist_ok=True)
+    workdir = os.path.abspath(workdir)
+    results = []
+    if "utils" in groups:
+        results += bench_utils(workdir, scales, repeat)
+    if "reporting" in groups:
+        results += bench_reporting(workdir, scales, repeat)
+    if "intelligence" in groups:
+        results += bench_intelligence(workdir, sizes, repeat)
+    if "monitoring" in groups:
+        results += bench_monitoring(workdir, repeat)
+    return {"created": datetime.datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+            "numpy": np.__version__, "pandas": pd.__version__, "machine": platform.platform(),
+            "cpus": os.cpu_count(), "results": results}
+
+
+def _result_key(result: dict) -> tuple:
+    return result["group"], result["name"], result.get("scale"), result.get("size")
+
+
+def compare(old: dict, new: dict, threshold: float = 1.2) -> list[tuple]:
+    """
+Compares the median times of two benchmark reports
+
+     Args:
+         old: report from an earlier run
+         new: report from a later run
+         threshold: ratio of new to old time above which a result is counted as a regression
+
+     Returns:
+         rows: list of (group, name, scale, size, old seconds, new seconds, ratio, regressed) for results in both
+     """
+    old_results = {_result_key(result): result for result in old["results"]}
+    rows = []
+    for result in new["results"]:
+        previous = old_results.get(_result_key(result))
+        if previous is not None:
+            ratio = result["median"] / previous["median"] if previous["median"] > 0 else float("inf")
+            rows.append((*_result_key(result), previous["median"], result["median"], ratio, ratio > threshold))
+    return rows
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Times the reporting, utils, intelligence and monitoring functions")
+    parser.add_argument("--workdir", default="./benchmark_data", help="folder for synthetic data")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help="station sizes in years")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 1024, 2048], help="map widths in pixels")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--groups", nargs="+", choices=GROUPS, default=GROUPS)
+    parser.add_argument("--output", default="benchmark-results.json", help="file to save the results to")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    report = run(args.workdir, args.scales, args.sizes, args.repeat, args.groups)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=1)
+    for result in report["results"]:
+        where = f"{result['scale']}x" if "scale" in result else f"{result['size']}px" if "size" in result else ""
+        print(f"{result['group']:<13}{result['name']:<40}{where:>8}{result['median'] * 1000:>12.3f} ms")
+
+    if args.compare is not None:
+        with open(args.compare) as file:
+            old = json.load(file)
+        print("\nChanges from", args.compare)
+        for group, name, scale, size, before, after, ratio, regressed in compare(old, report):
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{group:<13}{name:<40}{scale or size or '':>8}{ratio:>9.2f}x{flag}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import argparse
+import json
+import sys
+
+REPORTS = ["daily-average", "daily-median", "hourly-average", "monthly-average", "peak-hour-date", "peak-hours",
+           "count-missing-data", "rolling-average", "rolling-maximum"]
+FORMATS = ["json", "csv", "parquet"]
+
+
+def _clean(value):
+    """
+Converts a value from one of the modules into something every output format can hold. Numpy numbers become
+python numbers, and NaN and "N/A" both become None
+    """
+    if hasattr(value, "item"):  # numpy number
+        value = value.item()
+    if value == "N/A" or (isinstance(value, float) and value != value):
+        return None
+    return value
+
+
+def write_records(records: list[dict], output_format: str = "json", output: str = None):
+    """
+Writes a list of records, each a dictionary of column: value, as JSON, CSV or Parquet. Pandas is only imported for
+CSV and Parquet output
+
+    Args:
+        records: list of dictionaries with the same keys
+        output_format: 'json', 'csv' or 'parquet'
+        output: file location to write to, None for standard output
+
+    Raises:
+        ValueError: parquet output has no file location
+        ImportError: parquet output needs pyarrow or fastparquet which are not installed
+    """
+    records = [{column: _clean(value) for column, value in record.items()} for record in records]
+    if output_format == "json":
+        text = json.dumps(records)
+        if output is None:
+            print(text)
+        else:
+            with open(output, "w") as file:
+                file.write(text + "\n")
+        return
+
+    import pandas as pd
+    table = pd.DataFrame.from_records(records)
+    if output_format == "csv":
+        table.to_csv(output if output is not None else sys.stdout, index=False)
+    elif output is None:
+        raise ValueError("Parquet output needs --output")
+    else:
+        table.to_parquet(output, index=False)
+
+
+def _load_stations(args, stations: list):
+    """
+Loads only the named stations into a StationStore, reusing parsed columns from the cache when there is one
+    """
+    import storage
+    store = storage.StationStore(cache_dir=args.cache_dir or None)
+    for station in stations:
+        try:
+            store.load_station(station, f"{args.data_dir}/Pollution-London {station}.csv")
+        except FileNotFoundError:
+            raise KeyError("Monitoring station invalid")
+    return store
+
+
+def _run_report(args) -> list[dict]:
+    import reporting
+    data = _load_stations(args, [args.station])
+    columns = {"station": args.station, "pollutant": args.pollutant}
+    if args.report == "peak-hour-date":
+        if args.date is None:
+            raise ValueError("peak-hour-date needs --date")
+        time, value = reporting.peak_hour_date(data, args.date, args.station, args.pollutant)
+        return [{**columns, "date": args.date, "time": time, "value": value}]
+    if args.report == "peak-hours":
+        peaks = reporting.peak_hours(data, args.station, args.pollutant, args.start, args.end)
+        return [{**columns, "date": date, "time": time, "value": value} for date, time, value in peaks]
+    if args.report in ("rolling-average", "rolling-maximum"):
+        if args.report == "rolling-average":
+            hours = 8 if args.hours is None else args.hours
+            result = reporting.rolling_average(data, args.station, args.pollutant, hours)
+        else:
+            hours = 24 if args.hours is None else args.hours
+            result = reporting.rolling_maximum(data, args.station, args.pollutant, hours)
+        times = reporting.rolling_times(data, args.station)  # end of each window
+        return [{**columns, "date": date, "time": time, "value": value} for (date, time), value in zip(times, result)]
+
+    result = getattr(reporting, args.report.replace("-", "_"))(data, args.station, args.pollutant)
+    if not isinstance(result, list):  # count of missing data
+        return [{**columns, "value": result}]
+    return [{**columns, "position": position, "value": value} for position, value in enumerate(result)]
+
+
+def _run_report_all(args) -> list[dict]:
+    import reporting
+    data = _load_stations(args, args.stations)
+    table = reporting.report_all(data, pollutants=args.pollutants, max_workers=args.workers)
+    return table.to_dict(orient="records")
+
+
+def _run_station_objectives(args) -> list[dict]:
+    import reporting
+    data = _load_stations(args, args.stations)
+    return reporting.all_station_objectives(data, year=args.year).to_dict(orient="records")
+
+
+def _run_sync(args) -> list[dict]:
+    _set_api_cache(args)
+    import storage
+    import sync
+    store = storage.StationStore(cache_dir=args.cache_dir or None)
+    added = sync.sync(store, args.stations, args.start, args.end, args.data_dir, max_workers=args.workers)
+    return [{"station": station, "site": sync.SITES[station], "rows": rows} for station, rows in added.items()]
+
+
+def _set_api_cache(args):
+    import api
+    if args.api_cache:
+        api.set_cache(api.ResponseCache(args.api_cache))
+
+
+def _run_aqi(args) -> list[dict]:
+    _set_api_cache(args)
+    import monitoring
+    indexes = monitoring.air_quality_indexes(args.site)
+    return [{"site": args.site, "species": species, "day": day, "index": index}
+            for species, values in indexes.items() for day, index in enumerate(values)]
+
+
+def _run_compare_species(args) -> list[dict]:
+    _set_api_cache(args)
+    import monitoring
+    return monitoring.compare_species(args.sites, args.species, args.days).to_dict(orient="records")
+
+
+def _run_objectives(args) -> list[dict]:
+    _set_api_cache(args)
+    import monitoring
+    objectives, _ = monitoring.year_objectives(args.site, args.year)
+    return [{"site": args.site, "year": args.year, "species": species, "objective": objective, "achieved": achieved}
+            for species, objective, achieved in objectives]
+
+
+def _run_pixels(args) -> list[dict]:
+    import intelligence
+    find = intelligence.find_red_pixels if args.command == "red-pixels" else intelligence.find_cyan_pixels
+    mask = find(args.map, args.upper, args.lower, band_height=args.band_height)
+    return [{"map": args.map, "output": f"map-{args.command}.jpg", "pixels": int((mask == 0).sum())}]  # 0 is a match
+
+
+def _run_components(args) -> list[dict]:
+    import intelligence
+    import numpy as np
+    MARK = intelligence.detect_connected_components(args.map, band_height=args.band_height)
+    sizes = np.bincount(np.asarray(MARK).ravel())[1:]
+    return [{"component": component, "size": size} for component, size in enumerate(sizes.tolist(), start=1)]
+
+
+def _add_options(parser: argparse.ArgumentParser, defaults: dict or None):
+    """
+Adds the options shared by every command. Without defaults, options that aren't given are left out so they don't
+replace values given before the command name
+    """
+    default = defaults.get if defaults is not None else lambda _: argparse.SUPPRESS
+    parser.add_argument("--format", choices=FORMATS, default=default("format"), help="output format, json by default")
+    parser.add_argument("--output", default=default("output"), help="file to write to, standard output if not given")
+    parser.add_argument("--data-dir", default=default("data_dir"), help="folder containing the station csv files")
+    parser.add_argument("--cache-dir", default=default("cache_dir"), help="parsed station cache, '' to disable")
+    parser.add_argument("--api-cache", default=default("api_cache"), help="API response cache, '' to disable")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+Creates the parser for every command. Each command's function is stored as the 'run' default of its subparser
+    """
+    parser = argparse.ArgumentParser(prog="cli.py", description="Runs one air pollution analysis without menus")
+    _add_options(parser, {"format": "json", "output": None, "data_dir": "./data",
+                          "cache_dir": "./data/.station_cache", "api_cache": "./data/.api_cache"})
+    options = argparse.ArgumentParser(add_help=False)  # the same options are accepted after the command name
+    _add_options(options, None)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    report = commands.add_parser("report", parents=[options],
+                                 help="run one reporting function for a station and pollutant")
+    report.add_argument("report", choices=REPORTS)
+    report.add_argument("--station", required=True)
+    report.add_argument("--pollutant", required=True)
+    report.add_argument("--date", help="date for peak-hour-date in the form YYYY-MM-DD")
+    report.add_argument("--start", help="first date for peak-hours")
+    report.add_argument("--end", help="last date for peak-hours")
+    report.add_argument("--hours", type=int, help="window length for the rolling reports, 8 or 24 by default")
+    report.set_defaults(run=_run_report)
+
+    report_all = commands.add_parser("report-all", parents=[options],
+                                     help="run every reporting function over several stations")
+    report_all.add_argument("--stations", nargs="+", default=["Harlington", "Marylebone Road", "N Kensington"])
+    report_all.add_argument("--pollutants", nargs="+")
+    report_all.add_argument("--workers", type=int, help="number of worker processes")
+    report_all.set_defaults(run=_run_report_all)
+
+    station_objectives = commands.add_parser("station-objectives", parents=[options],
+                                             help="check pollution objectives from the station csv files")
+    station_objectives.add_argument("--stations", nargs="+", default=["Harlington", "Marylebone Road", "N Kensington"])
+    station_objectives.add_argument("--year", help="year to check, every year separately if not given")
+    station_objectives.set_defaults(run=_run_station_objectives)
+
+    sync = commands.add_parser("sync", parents=[options],
+                               help="add the latest London Air measurements to the station csv files")
+    sync.add_argument("--stations", nargs="+", default=["Harlington", "Marylebone Road", "N Kensington"])
+    sync.add_argument("--start", help="first date to download for stations without any data, YYYY-MM-DD")
+    sync.add_argument("--end", help="date to download up to, tomorrow by default")
+    sync.add_argument("--workers", type=int, help="number of requests made at the same time")
+    sync.set_defaults(run=_run_sync)
+
+    aqi = commands.add_parser("aqi", parents=[options], help="air quality indexes for the last 31 days at a site")
+    aqi.add_argument("--site", required=True)
+    aqi.set_defaults(run=_run_aqi)
+
+    compare = commands.add_parser("compare-species", parents=[options],
+                                  help="statistics of several species at several sites")
+    compare.add_argument("--sites", nargs="+", required=True)
+    compare.add_argument("--species", nargs="+", required=True)
+    compare.add_argument("--days", type=int, default=7)
+    compare.set_defaults(run=_run_compare_species)
+
+    objectives = commands.add_parser("objectives", parents=[options], help="pollution objectives for a site and year")
+    objectives.add_argument("--site", required=True)
+    objectives.add_argument("--year", required=True)
+    objectives.set_defaults(run=_run_objectives)
+
+    for name in ("red-pixels", "cyan-pixels"):
+        pixels = commands.add_parser(name, parents=[options], help=f"save map-{name}.jpg and count the pixels found")
+        pixels.add_argument("--map", default="./data/map.png")
+        pixels.add_argument("--upper", type=int, default=100)
+        pixels.add_argument("--lower", type=int, default=50)
+        pixels.add_argument("--band-height", type=int)
+        pixels.set_defaults(run=_run_pixels)
+
+    components = commands.add_parser("components", parents=[options],
+                                     help="sizes of the connected components of a pixel map")
+    components.add_argument("--map", default="map-red-pixels.jpg")
+    components.add_argument("--band-height", type=int)
+    components.set_defaults(run=_run_components)
+    return parser
+
+
+def main(argv: list = None) -> int:
+    """
+Runs the command given on the command line and writes its result. Modules are only imported by the commands that
+use them so each call starts quickly
+
+    Args:
+        argv: list of command line arguments, sys.argv[1:] if None
+
+    Returns:
+        status: 0 if the command succeeded, 1 if it failed
+    """
+    args = build_parser().parse_args(argv)
+    try:
+        records = args.run(args)
+        write_records(records, args.format, args.output)
+    except (KeyError, ValueError, ImportError, OSError) as error:
+        message = error.args[0] if isinstance(error, KeyError) else error  # KeyError messages are quoted by str
+        print(f"{args.command}: {message}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import atexit
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+ENV_VAR = "POLLUTION_PROFILE"  # set to 1 to print a summary at exit, or to a file name to save it as JSON
+MEMORY_ENV_VAR = "POLLUTION_PROFILE_MEMORY"  # set to 1 to also record peak memory, which slows everything down
+COUNTERS = ("rows", "pixels", "bytes")
+
+_enabled = False  # checked before any recording so instrumented functions cost one flag check when disabled
+_stats = {}  # name: dictionary of calls, seconds, peak_memory and COUNTERS
+_lock = threading.Lock()
+_local = threading.local()  # stack of the instrumented functions running on each thread
+_NULL = contextlib.nullcontext()
+
+
+def _entry(name: str) -> dict:
+    entry = _stats.get(name)
+    if entry is None:
+        entry = _stats[name] = {"calls": 0, "seconds": 0.0, "peak_memory": 0, **{counter: 0 for counter in COUNTERS}}
+    return entry
+
+
+def _stack() -> list:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+class _Record:
+    """
+Context manager recording the wall time of one call of a function or phase, and its peak memory use above what was
+in use when it started if tracemalloc is tracing
+    """
+
+    def __init__(self, name: str, is_phase: bool = False):
+        self.name = name
+        self.is_phase = is_phase  # counts added during a phase belong to the function running it
+        self.peak = 0
+
+    def __enter__(self):
+        self.memory = tracemalloc.is_tracing()
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            stack = _stack()
+            if stack:  # keep the peak reached so far by the caller before it is reset
+                stack[-1].peak = max(stack[-1].peak, peak)
+            self.base = self.peak = current
+            tracemalloc.reset_peak()
+        _stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        stack = _stack()
+        stack.pop()
+        used = 0
+        if self.memory and tracemalloc.is_tracing():
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            used = self.peak - self.base
+            if stack:  # the caller's peak includes this call's peak
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+        with _lock:
+            entry = _entry(self.name)
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            entry["peak_memory"] = max(entry["peak_memory"], used)
+        return False
+
+
+def timed(function):
+    """
+Decorator recording every call of a function under '{module}.{name}' while instrumentation is enabled. When it is
+disabled the function is called straight away after a single flag check
+    """
+    name = f"{function.__module__}.{function.__qualname__}"
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return function(*args, **kwargs)
+        with _Record(name):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def phase(name: str):
+    """
+Returns a context manager recording a phase of the running instrumented function, such as parsing or waiting for
+a response. Phases are recorded as '{function}:{name}' and nested phases as '{function}:{outer}:{name}'
+
+     Args:
+         name: name of the phase
+
+     Returns:
+         context: context manager to wrap the phase in, does nothing when instrumentation is disabled
+     """
+    if not _enabled:
+        return _NULL
+    stack = _stack()
+    return _Record(f"{stack[-1].name}:{name}" if stack else name, is_phase=True)
+
+
+def add(name: str = None, **counts: int):
+    """
+Adds to the rows, pixels or bytes processed by the running instrumented function, or by name if given. Does
+nothing when instrumentation is disabled
+
+     Args:
+         name: name to record the counts under, the innermost running instrumented function if None
+         counts: amounts to add to any of COUNTERS, e.g. rows=8760
+     """
+    if not _enabled:
+        return
+    if name is None:
+        functions = [record.name for record in _stack() if not record.is_phase]
+        name = functions[-1] if functions else "unattributed"
+    with _lock:
+        entry = _entry(name)
+        for counter, amount in counts.items():
+            entry[counter] += amount
+
+
+def enable(memory: bool = False):
+    """
+Starts recording. With memory=True tracemalloc is started so peak memory is recorded too
+    """
+    global _enabled
+    _enabled = True
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    """
+Stops recording. Statistics recorded so far are kept until reset is called
+    """
+    global _enabled
+    _enabled = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def reset():
+    """
+Removes every recorded statistic
+    """
+    with _lock:
+        _stats.clear()
+
+
+@contextlib.contextmanager
+def profiling(memory: bool = False):
+    """
+Context manager that records everything run inside it then returns instrumentation to how it was before
+
+     Args:
+         memory: if True record peak memory with tracemalloc as well
+
+     Yields:
+         stats: dictionary of name: statistics which is filled in as functions run, see summary
+     """
+    was_enabled, was_tracing = _enabled, tracemalloc.is_tracing()
+    enable(memory)
+    try:
+        yield _stats
+    finally:
+        if not was_enabled:
+            disable()
+        elif tracemalloc.is_tracing() and not was_tracing:
+            tracemalloc.stop()
+
+
+def summary() -> list[dict]:
+    """
+Returns the recorded statistics with the most time consuming first
+
+     Returns:
+         records: list of dictionaries of name, calls, seconds, mean_seconds, peak_memory, rows, pixels and bytes
+     """
+    with _lock:
+        records = [{"name": name, **entry, "mean_seconds": entry["seconds"] / entry["calls"] if entry["calls"] else 0.0}
+                   for name, entry in _stats.items()]
+    records.sort(key=lambda record: record["seconds"], reverse=True)
+    return records
+
+
+def dump(file=None, as_json: bool = False):
+    """
+Writes the summary as a table, or as JSON
+
+     Args:
+         file: open text file or file name to write to, standard error if None
+         as_json: if True write JSON instead of a table
+     """
+    if isinstance(file, str):
+        with open(file, "w") as opened:
+            return dump(opened, as_json)
+    file = file if file is not None else sys.stderr
+    records = summary()
+    if as_json:
+        json.dump(records, file, indent=1)
+        return
+    print(f"{'name':<56}{'calls':>8}{'seconds':>11}{'mean ms':>10}{'peak MiB':>10}{'rows':>11}{'pixels':>12}"
+          f"{'bytes':>12}", file=file)
+    for record in records:
+        print(f"{record['name']:<56}{record['calls']:>8}{record['seconds']:>11.4f}"
+              f"{record['mean_seconds'] * 1000:>10.3f}{record['peak_memory'] / 2 ** 20:>10.2f}"
+              f"{record['rows']:>11}{record['pixels']:>12}{record['bytes']:>12}", file=file)
+
+
+def _dump_at_exit(target: str):
+    if target in ("1", "true", "yes"):
+        dump()
+    else:
+        dump(target, as_json=True)
+
+
+if os.environ.get(ENV_VAR):  # switched on for the whole run
+    enable(memory=bool(os.environ.get(MEMORY_ENV_VAR)))
+    atexit.register(_dump_at_exit, os.environ[ENV_VAR])
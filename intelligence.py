@@ -1,9 +1,303 @@
 from matplotlib import pyplot as plt
+import matplotlib as mpl
+from PIL import Image
 import numpy as np
-import utils
+import io
+import mmap
+import operator
+import re
+import struct
+import zlib
+import instrument
+
+
+# comparisons that can be used in a colour rule
+COMPARISONS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+# PNG rawmodes PIL decodes without changing the bytes: bytes per pixel
+PNG_PIXEL_BYTES = {"L": 1, "LA": 2, "P": 1, "RGB": 3, "RGBA": 4, "I;16B": 2}
+READ_SIZE = 2 ** 16  # bytes of compressed or decompressed PNG data handled at once
+# restart markers after every row of JPEG blocks let image_bands decode the JPEGs saved here a band at a time
+JPEG_SAVE_OPTIONS = {"restart_marker_rows": 1}
+JPEG_RESTART = re.compile(rb"\xff[\xd0-\xd7]")  # restart markers, the only markers inside a JPEG's scan
+
+
+def colour_mask(rgb_img: np.ndarray, rules: list[tuple]) -> np.ndarray:
+    """
+Classifies every pixel of an image at once. A pixel matches if it satisfies every rule, where each rule is a tuple
+(channel, comparison, threshold) e.g. (0, ">", 100) means the red value must be above 100.
+Channels are compared after being multiplied up by 255
+
+     Args:
+         rgb_img: 3D numpy array of an image from plt.imread
+         rules: list of (channel index, comparison from COMPARISONS, threshold) tuples
+
+     Returns:
+         mask: 2D boolean numpy array, True for each pixel matching all the rules
+
+     Raises:
+         ValueError: a rule uses a comparison that is not in COMPARISONS
+     """
+    mask = np.ones(rgb_img.shape[:2], dtype=bool)
+    for channel, comparison, threshold in rules:
+        try:
+            compare = COMPARISONS[comparison]
+        except KeyError:
+            raise ValueError(f"Invalid comparison '{comparison}'")
+        mask &= compare(rgb_img[:, :, channel] * 255, threshold)  # multiply up rgb values before comparing
+    return mask
+
+
+def _png_data(map_filename: str):
+    """
+Yields the decompressed pixel data of a PNG, a scanline filter byte followed by the filtered row for each row, in
+pieces of at most READ_SIZE bytes
+    """
+    inflate = zlib.decompressobj()
+    with open(map_filename, "rb") as file:
+        file.seek(8)  # PNG signature
+        while True:
+            header = file.read(8)
+            if len(header) < 8:
+                return
+            length, kind = struct.unpack(">I4s", header)
+            if kind == b"IEND":
+                return
+            if kind != b"IDAT":
+                file.seek(length + 4, 1)  # skip the chunk and its crc
+                continue
+            for _ in range(0, length, READ_SIZE):
+                data = file.read(min(READ_SIZE, length))
+                length -= len(data)
+                while data:
+                    yield inflate.decompress(data, READ_SIZE)
+                    data = inflate.unconsumed_tail
+            file.seek(4, 1)  # crc
+
+
+def _png_bands(image: Image.Image, map_filename: str, band_height: int):
+    """
+Decodes a non-interlaced PNG a band of rows at a time. PIL only decodes a whole image, so each band's scanlines are
+given to PIL's PNG decoder as a stream of their own, after an unfiltered copy of the row above so the scanline filters
+that use the previous row still work
+
+     Yields:
+         top, band: index of the first row of the band and the band as a PIL image
+     """
+    width, height = image.size
+    rawmode = image.png.im_rawmode
+    row_bytes = 1 + width * PNG_PIXEL_BYTES[rawmode]  # filter byte and row
+    prior = bytes(row_bytes - 1)  # the first row is filtered against a row of zeros
+    pending = bytearray()
+    data = _png_data(map_filename)
+    for top in range(0, height, band_height):
+        rows = min(band_height, height - top)
+        while len(pending) < rows * row_bytes:
+            piece = next(data, None)
+            if piece is None:
+                raise ValueError(f"{map_filename} is truncated")
+            pending += piece
+        stream = zlib.compress(b"\x00" + prior + pending[:rows * row_bytes], 0)  # stored, not compressed again
+        del pending[:rows * row_bytes]
+        band = Image.frombytes(image.mode, (width, rows + 1), stream, "zip", rawmode)
+        last = np.asarray(band)[-1]
+        prior = (last.astype(">u2") if rawmode == "I;16B" else last).tobytes()  # back to the PNG's own bytes
+        if image.mode == "P":
+            band.putpalette(image.palette)
+            if "transparency" in image.info:
+                band.info["transparency"] = image.info["transparency"]
+        yield top, band.crop((0, 1, width, rows + 1))
+
+
+def _jpeg_layout(data, map_filename: str) -> tuple:
+    """
+Reads the markers of a baseline JPEG up to the start of its scan
+
+     Args:
+         data: bytes or memory map of the JPEG
+         map_filename: file location of the image, for error messages
+
+     Returns:
+         header, size_offset, height, interval_rows, scan: the JPEG's bytes from its start to the end of the scan
+         header, the position of the image height within header, the image height, the number of pixel rows between
+         restart markers and the position of the first byte of the scan
+
+     Raises:
+         ValueError: the JPEG isn't baseline or has no restart marker at the end of each row of blocks
+     """
+    position, frame, interval = 2, None, 0
+    while data[position + 1] != 0xDA:  # start of scan
+        if data[position + 1] == 0xFF:  # fill byte before a marker
+            position += 1
+            continue
+        marker, length = data[position + 1], struct.unpack(">H", data[position + 2:position + 4])[0]
+        if marker in (0xC0, 0xC1):  # baseline and extended sequential frames
+            frame = position
+        elif 0xC2 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):  # progressive, lossless or arithmetic
+            raise ValueError(f"{map_filename} is not a baseline JPEG so can't be read a band at a time")
+        elif marker == 0xDD:  # restart interval in blocks
+            interval = struct.unpack(">H", data[position + 4:position + 6])[0]
+        position += 2 + length
+    if frame is None:
+        raise ValueError(f"{map_filename} is not a baseline JPEG so can't be read a band at a time")
+    height, width, n_components = struct.unpack(">HHB", data[frame + 5:frame + 10])
+    sampling = data[frame + 11:frame + 11 + 3 * n_components:3]
+    if n_components == 1:  # one component is coded in single 8x8 blocks whatever its sampling
+        block_width = block_height = 8
+    else:
+        block_width = 8 * max(factor >> 4 for factor in sampling)
+        block_height = 8 * max(factor & 15 for factor in sampling)
+    blocks_per_row = -(-width // block_width)
+    if data[position + 4] != n_components or interval == 0 or interval % blocks_per_row != 0:
+        raise ValueError(f"{map_filename} has no restart markers at the end of each row of blocks so can't be read a "
+                         f"band at a time, save it with JPEG_SAVE_OPTIONS")
+    scan = position + 2 + struct.unpack(">H", data[position + 2:position + 4])[0]
+    return bytes(data[:scan]), frame + 5, height, block_height * interval // blocks_per_row, scan
+
+
+def _jpeg_bands(map_filename: str, band_height: int):
+    """
+Decodes a baseline JPEG with restart markers a band of rows at a time. The scan can be cut at each restart marker as
+nothing is carried over from one interval to the next, so each band is given to PIL's JPEG decoder as a JPEG of its
+own made of the header, with the height changed, and the intervals covering the band. The interval either side is
+included so the chroma rows that are smoothed into the band's edge rows when upsampling are the same as in the whole
+image. The file is memory mapped so only the intervals being decoded are read
+
+     Yields:
+         top, band: index of the first row of the band and a numpy array of the band, as plt.imread gives
+
+     Raises:
+         ValueError: the JPEG can't be decoded a band at a time, see _jpeg_layout
+     """
+    with open(map_filename, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        header, size_offset, height, interval_rows, scan = _jpeg_layout(data, map_filename)
+        markers = [(match.start(), match.end()) for match in JPEG_RESTART.finditer(data, scan)]
+        starts = [scan] + [end for _, end in markers]  # entropy coded data of each interval
+        ends = [start for start, _ in markers] + [data.rfind(b"\xff\xd9")]  # end of image marker
+        if len(starts) != -(-height // interval_rows):
+            raise ValueError(f"{map_filename} is truncated")
+        for top in range(0, height, band_height):
+            bottom = min(top + band_height, height)
+            first = max(top // interval_rows - 1, 0)
+            last = min(-(-bottom // interval_rows) + 1, len(starts))
+            rows = min(last * interval_rows, height) - first * interval_rows
+            header = header[:size_offset] + struct.pack(">H", rows) + header[size_offset + 2:]
+            jpeg = [header, data[starts[first]:ends[first]]]
+            for number, interval in enumerate(range(first + 1, last)):  # restart markers numbered again from 0
+                jpeg += [bytes([0xFF, 0xD0 + number % 8]), data[starts[interval]:ends[interval]]]
+            with Image.open(io.BytesIO(b"".join(jpeg) + b"\xff\xd9")) as band:
+                pixels = np.asarray(band)
+            yield top, pixels[top - first * interval_rows:bottom - first * interval_rows]
+
+
+def image_bands(map_filename: str, band_height: int):
+    """
+Reads an image a band of rows at a time, so only the current band is ever in memory. Each band has the same values
+as the matching rows of plt.imread, so PNGs give floats from 0-1, 16 bit greyscale PNGs included, and JPEGs give
+integers from 0-255. .npy files are memory mapped, 8 and 16 bit non-interlaced PNGs and baseline JPEGs with restart
+markers, as saved by find_colour_pixels, are decoded a band at a time. Other images can only be decoded whole so are
+rejected, and should be read with plt.imread instead
+
+     Args:
+         map_filename: file location of the image used
+         band_height: number of rows in each band
 
+     Yields:
+         top, band: index of the first row of the band and a 3D numpy array of the band
 
-def find_red_pixels(map_filename="./data/map.png", upper_threshold=100, lower_threshold=50):
+     Raises:
+         ValueError: the image can't be decoded a band at a time
+     """
+    if str(map_filename).endswith(".npy"):
+        img = np.load(map_filename, mmap_mode="r")
+        for top in range(0, img.shape[0], band_height):
+            yield top, np.asarray(img[top:top + band_height])
+        return
+
+    with Image.open(map_filename) as image:
+        if image.format == "JPEG":
+            yield from _jpeg_bands(map_filename, band_height)
+            return
+        if image.format != "PNG" or image.png.im_rawmode not in PNG_PIXEL_BYTES or image.info.get("interlace"):
+            raise ValueError(f"{map_filename} can't be read a band at a time, only 8 and 16 bit non-interlaced PNGs, "
+                             "JPEGs with restart markers and .npy files can")
+        for top, band in _png_bands(image, map_filename, band_height):  # scaled to floats from 0-1 like plt.imread
+            if band.mode in ("P", "LA"):
+                band = band.convert("RGBA")
+            if band.mode.startswith("I;16"):
+                yield top, np.divide(band, 2 ** 16 - 1, dtype=np.float32)
+            else:
+                yield top, np.divide(band, 2 ** 8 - 1, dtype=np.float32)
+
+
+def _save_options(output_filename: str) -> dict:
+    """
+Returns the options PIL saves an output image with, JPEG_SAVE_OPTIONS for JPEGs so image_bands can read them in bands
+    """
+    return JPEG_SAVE_OPTIONS if str(output_filename).lower().endswith((".jpg", ".jpeg")) else {}
+
+
+def _save_mask_image(colour_array: np.ndarray, output_filename: str):
+    """
+Saves a 2D array of 0's and 1's the same way as plt.imsave(output_filename, colour_array, cmap='Greys') without
+plt.imsave's full size float and RGBA copies. The two values are coloured through a palette instead
+
+     Args:
+         colour_array: 2D uint8 numpy array of 0's and 1's
+         output_filename: file location the image is saved to
+     """
+    values = np.unique(colour_array)  # imsave scales the smallest value to white and the largest to black
+    greys = plt.get_cmap("Greys")([0.0] + [1.0] * (len(values) - 1), bytes=True)[:, :3]
+    palette = np.zeros((2, 3), dtype=np.uint8)
+    palette[values] = greys
+    image = Image.fromarray(colour_array, mode="L").convert("P")
+    image.putpalette(palette.ravel().tolist())
+
+    dpi = mpl.rcParams["savefig.dpi"]
+    if dpi == "figure":
+        dpi = mpl.rcParams["figure.dpi"]
+    image.convert("RGB").save(output_filename, dpi=(dpi, dpi), **_save_options(output_filename))
+
+
+@instrument.timed
+def find_colour_pixels(map_filename: str, rules: list[tuple], output_filename: str,
+                       band_height: int = None) -> np.ndarray:
+    """
+Finds all pixels in an image matching the colour rules and marks their location in a 2D numpy array.
+The array is written as a black and white image to output_filename where matching pixels are represented by white
+and other pixels are represented by black.
+If band_height is given the image is classified a band of rows at a time using image_bands so the whole image never
+has to be loaded as floats. The array and image produced are the same, but the array is uint8 instead of int
+
+     Args:
+         map_filename: file location of the image used
+         rules: list of (channel index, comparison, threshold) tuples, see colour_mask
+         output_filename: file location the black and white image is saved to
+         band_height: number of rows to classify at once, None to load the whole image
+
+     Returns:
+         colour_array: 2D numpy array of 0's for matching pixels and 1's for other pixels
+     """
+    if band_height is None:
+        with instrument.phase("read"):
+            rgb_img = plt.imread(map_filename)  # creates 3D numpy array of image
+        colour_array = np.where(colour_mask(rgb_img, rules), 0, 1)  # 1's used as black image, 0's show white
+        with instrument.phase("save"):
+            plt.imsave(output_filename, colour_array, cmap='Greys', pil_kwargs=_save_options(output_filename))
+        instrument.add(pixels=colour_array.size)
+        return colour_array
+
+    bands = []
+    for _, band in image_bands(map_filename, band_height):
+        bands.append(np.where(colour_mask(band, rules), 0, 1).astype(np.uint8))
+    colour_array = np.concatenate(bands)
+    with instrument.phase("save"):
+        _save_mask_image(colour_array, output_filename)
+    instrument.add(pixels=colour_array.size)
+    return colour_array
+
+
+@instrument.timed
+def find_red_pixels(map_filename="./data/map.png", upper_threshold=100, lower_threshold=50, band_height=None):
     """
 Takes an image as an input and finds all the red pixels in that image and marks their location in a 2D
 numpy array red_array. red_array is written as a black and white image to map-red-pixels.jpg where red pixels
@@ -13,26 +307,17 @@ are represented by white and non-red pixels are represented by black
          map_filename: file location of the image used
          upper_threshold: Minimum amount of red needed in a pixel to mark it as red
          lower_threshold: Maximum amount of blue or green allowed in a pixel to still mark it as red
+         band_height: number of rows to process at once for large maps, None to load the whole image
 
      Returns:
          red_array: 2D numpy array of 0's for red pixels and 1's for non-red pixels
      """
+    rules = [(0, ">", upper_threshold), (1, "<", lower_threshold), (2, "<", lower_threshold)]
+    return find_colour_pixels(map_filename, rules, "map-red-pixels.jpg", band_height)
 
-    rgb_img = plt.imread(map_filename)  # creates 3D numpy array of image
-    height, width = rgb_img.shape[0], rgb_img.shape[1]
-    red_array = np.array([[1] * width for _ in range(height)])  # list of 1's used as black image
-
-    for row_index, row in enumerate(rgb_img):
-        for col_index, col in enumerate(row):
-            pixel = rgb_img[row_index][col_index]*255  # multiply up rgb values before comparing
-            if pixel[0] > upper_threshold and pixel[1] < lower_threshold and pixel[2] < lower_threshold:
-                red_array[row_index][col_index] = 0  # updates black image if red found to show white at each red pixel
-
-    plt.imsave("map-red-pixels.jpg", red_array, cmap='Greys')
-    return red_array
 
-
-def find_cyan_pixels(map_filename="./data/map.png", upper_threshold=100, lower_threshold=50):
+@instrument.timed
+def find_cyan_pixels(map_filename="./data/map.png", upper_threshold=100, lower_threshold=50, band_height=None):
     """
 Takes an image as an input and finds all the cyan pixels in that image and marks their location in a 2D
 numpy array cyan_array. cyan_array is written as an image to map-cyan-pixels.jpg where cyan pixels
@@ -42,135 +327,237 @@ are represented by white and non-cyan pixels are represented by black
          map_filename: file location of the image used
          upper_threshold: Minimum amount of blue and green needed in a pixel to mark it as cyan
          lower_threshold: Maximum amount of red allowed in a pixel to still mark it as cyan
+         band_height: number of rows to process at once for large maps, None to load the whole image
 
      Returns:
          cyan_array: 2D numpy array of 0's for cyan pixels and 1's for non-cyan pixels
      """
+    rules = [(0, "<", lower_threshold), (1, ">", upper_threshold), (2, ">", upper_threshold)]
+    return find_colour_pixels(map_filename, rules, "map-cyan-pixels.jpg", band_height)
 
-    rgb_img = plt.imread(map_filename)  # creates 3D numpy array of image
-    height, width = rgb_img.shape[0], rgb_img.shape[1]
-    cyan_array = np.array([[1] * width for _ in range(height)])  # list of 1's used as black image
 
-    for row_index, row in enumerate(rgb_img):
-        for col_index, col in enumerate(row):
-            pixel = rgb_img[row_index][col_index] * 255  # multiply up rgb values before comparing
-            if pixel[0] < lower_threshold and pixel[1] > upper_threshold and pixel[2] > upper_threshold:  # checks rgb values
-                cyan_array[row_index][col_index] = 0  # updates black image to show white at each cyan pixel
+def _find_runs(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+Finds every horizontal run of consecutive True pixels in a mask. Runs are returned in raster order
 
-    plt.imsave("map-cyan-pixels.jpg", cyan_array, cmap='Greys')
-    return cyan_array
+     Args:
+         mask: 2D boolean numpy array
 
+     Returns:
+         rows, starts, ends: 1D numpy arrays of the row, first column and one past the last column of each run
+     """
+    height, width = mask.shape
+    padded = np.zeros((height, width + 2), dtype=np.int8)  # False border so every run has a start and an end
+    padded[:, 1:-1] = mask
+    changes = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(changes == 1)
+    _, ends = np.nonzero(changes == -1)
+    return rows, starts, ends
+
+
+def _touching_runs(rows: np.ndarray, starts: np.ndarray, ends: np.ndarray, width: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+Finds every pair of runs in adjacent rows that touch, including diagonally (8-connectivity)
+
+     Args:
+         rows, starts, ends: runs from _find_runs
+         width: width of the image
 
-def detect_connected_components(map_filename="map-red-pixels.jpg", *args, **kwargs):
+     Returns:
+         upper, lower: 1D numpy arrays of run indexes, run upper[i] in one row touches run lower[i] in the row below
+     """
+    stride = width + 3  # keys of runs in different rows never overlap
+    start_keys = rows * stride + starts + 1
+    end_keys = rows * stride + ends  # last column of the run + 1
+    # for each run, runs in the row above ending at or after its start - 1 and starting at or before its end
+    above = (rows - 1) * stride
+    first = np.searchsorted(end_keys, above + starts, side="left")
+    last = np.searchsorted(start_keys, above + ends + 1, side="right")
+    counts = np.maximum(last - first, 0)
+
+    lower = np.repeat(np.arange(len(rows)), counts)
+    upper = np.repeat(first, counts) + _counting(counts)
+    return upper, lower
+
+
+def _counting(counts: np.ndarray) -> np.ndarray:
+    """
+Returns 0, 1, .. counts[0] - 1, 0, 1, .. counts[1] - 1, .. as one numpy array
+    """
+    return np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+
+def _label_runs(rows: np.ndarray, starts: np.ndarray, ends: np.ndarray, width: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+Joins touching runs into 8-connected components by union-find and numbers the components from 1 in the order their
+first pixel is found scanning the image row by row, the same order a flood fill from each unvisited pixel gives.
+Runs can come from one whole image or from several bands of it, as runs either side of a seam are in adjacent rows
+
+     Args:
+         rows, starts, ends: runs in raster order, see _find_runs
+         width: width of the image
+
+     Returns:
+         labels: 1D numpy array of the component number of each run
+         sizes: 1D numpy array where sizes[i] is the number of pixels in component i + 1
+     """
+    upper, lower = _touching_runs(rows, starts, ends, width)
+
+    parent = list(range(len(rows)))  # union-find forest over runs
+
+    def find(run):
+        while parent[run] != run:
+            parent[run] = parent[parent[run]]  # path halving
+            run = parent[run]
+        return run
+
+    for run_a, run_b in zip(upper.tolist(), lower.tolist()):
+        root_a, root_b = find(run_a), find(run_b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)  # root is always the earliest run of the component
+    roots = np.array([find(run) for run in range(len(rows))], dtype=np.int64)
+
+    # earliest run of each component is its root, so numbering roots in run order gives raster order
+    is_root = roots == np.arange(len(rows))
+    numbers = np.cumsum(is_root)  # component number of each root
+    labels = numbers[roots] if len(rows) else roots
+    sizes = np.bincount(labels - 1, weights=ends - starts, minlength=int(is_root.sum())).astype(np.int64)
+    return labels, sizes
+
+
+def _paint_runs(MARK: np.ndarray, rows: np.ndarray, starts: np.ndarray, ends: np.ndarray, labels: np.ndarray):
+    """
+Writes the label of each run into every pixel of the run in MARK
+    """
+    lengths = ends - starts
+    run_of_pixel = np.repeat(np.arange(len(rows)), lengths)
+    MARK[rows[run_of_pixel], starts[run_of_pixel] + _counting(lengths)] = labels[run_of_pixel]
+
+
+@instrument.timed
+def label_components(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+Labels the 8-connected components of a mask in time linear in the number of pixels. Runs of pixels in each row are
+joined by union-find wherever they touch a run in the row above
+
+     Args:
+         mask: 2D boolean numpy array, True for pixels that are part of a component
+
+     Returns:
+         MARK: 2D numpy array where each pixel of each connected component is marked with the components unique index
+         sizes: 1D numpy array where sizes[i] is the number of pixels in component i + 1
+     """
+    height, width = mask.shape
+    instrument.add(pixels=mask.size)
+    rows, starts, ends = _find_runs(mask)
+    labels, sizes = _label_runs(rows, starts, ends, width)
+
+    MARK = np.zeros((height, width), dtype=np.int64)
+    MARK[mask] = np.repeat(labels, ends - starts)  # mask pixels are visited in the same raster order as the runs
+    return MARK, sizes
+
+
+@instrument.timed
+def label_components_tiled(map_filename: str, band_height: int,
+                           mark_filename: str = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+Labels the pavement components of an image a band of rows at a time. Only the runs of pavement pixels from each band
+are kept, so components crossing a seam between bands are joined when all runs are labelled together.
+MARK is then painted one band of runs at a time, into a .npy file if mark_filename is given
+
+     Args:
+         map_filename: file location of the image used
+         band_height: number of rows read at once
+         mark_filename: .npy file to memory map MARK to, None to keep MARK in memory
+
+     Returns:
+         MARK: 2D numpy array the same as label_components gives for the whole image
+         sizes: 1D numpy array where sizes[i] is the number of pixels in component i + 1
+     """
+    band_runs = []  # (rows, starts, ends) of pavement runs in each band
+    width = height = 0
+    for top, band in image_bands(map_filename, band_height):
+        rows, starts, ends = _find_runs(band[:, :, 0] > 200)  # pixel is a pavement if its red value is over 200
+        band_runs.append((rows + top, starts, ends))
+        height, width = top + band.shape[0], band.shape[1]
+    rows, starts, ends = (np.concatenate(runs) for runs in zip(*band_runs))
+    labels, sizes = _label_runs(rows, starts, ends, width)
+
+    if mark_filename is None:
+        MARK = np.zeros((height, width), dtype=np.int64)
+    else:
+        MARK = np.lib.format.open_memmap(mark_filename, mode="w+", dtype=np.int64, shape=(height, width))
+    first = 0
+    for band_rows, band_starts, band_ends in band_runs:  # paint one band at a time to bound temporary arrays
+        last = first + len(band_rows)
+        _paint_runs(MARK, band_rows, band_starts, band_ends, labels[first:last])
+        first = last
+    return MARK, sizes
+
+
+@instrument.timed
+def detect_connected_components(map_filename="map-red-pixels.jpg", *args, band_height=None, mark_filename=None,
+                                **kwargs):
     """
 Takes a black and white image as an input and finds the number of connected components in the image and their
-sizes. Iterates through image and uses 2D array MARK to show which pixels have been visited. Each connected
-component is given a unique index number which is stored in MARK in the position of each of the components pixels.
+sizes. Pavement pixels are labelled by label_components and each connected component is given a unique index number
+which is stored in MARK in the position of each of the components pixels.
+If band_height is given the image is read a band of rows at a time by label_components_tiled for maps too large to
+load at once.
 Writes every component number and its size in cc-output-2a.txt
 
        Args:
            map_filename: file location of the image used
+           band_height: number of rows to read at once, None to load the whole image
+           mark_filename: .npy file to memory map MARK to when using bands, None to keep MARK in memory
 
        Returns:
            MARK: 2D numpy array where each pixel of each connected component is marked with the components unique index
        """
 
-    img = plt.imread(map_filename)  # creates 3D numpy array of image
-    height, width = img.shape[0], img.shape[1]
+    if band_height is None:
+        img = plt.imread(map_filename)  # creates 3D numpy array of image
+        MARK, sizes = label_components(img[:, :, 0] > 200)  # pixel is a pavement if its red value is over 200
+    else:
+        MARK, sizes = label_components_tiled(map_filename, band_height, mark_filename)
 
-    MARK = np.array([[0] * width for _ in range(height)])  # creates 2D array of 0's with dimensions of img
-    queue = []  # store pixels to visit as tuples (row index, col index)
-    component_count = 0
     output_file = open("cc-output-2a.txt", "w")
-
-    for row_index, row in enumerate(img):
-        for col_index, col in enumerate(row):
-            # if pixel is a pavement and is unvisited
-            if img[row_index][col_index][0] > 200 and MARK[row_index][col_index] == 0:
-                component_count += 1
-                MARK[row_index][col_index] = component_count   # show pixel as visited by component number
-                queue.append((row_index, col_index))  # add pixel coordinates to queue
-
-                size = 1  # number of pixels in component
-                while len(queue) > 0:  # once queue is 0, component is complete
-                    current_pixel = queue.pop(0)  # tuple of (row_index, col_index)
-
-                    # adds all neighbours coordinates to list 'neighbours'
-                    neighbours = []  # stores coordinates of all 8 neighbours of current_pixel
-                    for row_change in range(-1, 2):
-                        for col_change in range(-1, 2):
-                            new_row = current_pixel[0] + row_change
-                            new_col = current_pixel[1] + col_change
-                            # check coordinates are within image dimensions before adding to 'neighbours'
-                            if 0 <= new_row < height and 0 <= new_col < width:
-                                neighbours.append((new_row, new_col))
-                    neighbours.remove((current_pixel[0], current_pixel[1]))  # remove coordinates of original pixel
-
-                    # iterate through neighbours and check if they are a path and not visited
-                    for neighbour in neighbours:
-                        n_row, n_col = neighbour[0], neighbour[1]
-                        if img[n_row][n_col][0] > 200 and MARK[n_row][n_col] == 0:
-                            MARK[n_row][n_col] = component_count  # show pixel as visited by component number
-                            queue.append((n_row, n_col))
-                            size += 1
-                output_file.write(f"Connected Component {component_count}, number of pixels = {size} \n")
-
-    output_file.write(f"Total number of connected components = {component_count}")
+    for component, size in enumerate(sizes.tolist(), start=1):
+        output_file.write(f"Connected Component {component}, number of pixels = {size} \n")
+    output_file.write(f"Total number of connected components = {len(sizes)}")
     output_file.close()
     return MARK
 
 
-def detect_connected_components_sorted(MARK, *args, **kwargs):
+@instrument.timed
+def detect_connected_components_sorted(MARK, *args, k=2, **kwargs):
     """
 Takes detect_connected_components as a parameter to get MARK which is used to generate a list of all the
-connected components. Sorts components into descending order by size and writes components to cc-output-2b.txt
-Creates an image of the two largest components and saves to cc-top-2.jpg
+connected components. Sorts components into descending order by size and writes components to cc-output-2b.txt.
+Components of equal size are listed with the highest component number first.
+Creates an image of the k largest components and saves to cc-top-{k}.jpg
 
        Args:
            MARK: 2D numpy array generated by detect_connected_components
+           k: number of largest components shown in the image
 
        Returns:
-           top_two: 2D numpy array of two largest connected components in image
+           top_k: 2D numpy array of the k largest connected components in image
        """
 
-    MARK_no_0 = [x for x in MARK.flatten() if x != 0]  # creates 1D array removing all 0's from MARK
-    num_of_components = max(MARK_no_0)  # largest number in MARK is the number of components
-
-    # generates list of all connected components by searching for how many times each number occurs in MARK
-    component_list = []  # stores unsorted components as tuples (index, size)
-    for index in range(1, num_of_components+1):
-        size = utils.countvalue(MARK_no_0, index)
-        component_list.append((index, size))
-
-    # sorts components using insertion sort
-    sorted_components = []
-    for component in component_list:
-        # if sorted_components is empty or component is larger than the largest sorted component
-        if len(sorted_components) == 0 or component[1] > sorted_components[0][1]:
-            sorted_components = [component] + sorted_components
-        else:
-            for index, _ in enumerate(sorted_components):  # compares current component with already sorted components
-                if component[1] >= sorted_components[index][1]:  # if current components size >= a sorted component
-                    sorted_components[index:index] = [component]  # add to sorted list just before compared component
-                    break
-            else:  # if loop finished without break, current component size is smaller than all components in sortedlist
-                sorted_components.append(component)
+    sizes = np.bincount(MARK.ravel())[1:]  # number of pixels in each component, 0's are not a component
+    components = np.arange(1, len(sizes) + 1)
+    order = np.lexsort((components, sizes))[::-1]  # largest first, ties broken by highest component number
 
     # writes components in sorted order to output file
     output_file = open("cc-output-2b.txt", "w")  # creates text file to write to
-    for component in sorted_components:
-        output_file.write(f"Connected Component {component[0]}, number of pixels = {component[1]}\n")
-    output_file.write(f"Total number of connected components = {utils.length(sorted_components)}")
+    for component, size in zip(components[order].tolist(), sizes[order].tolist()):
+        output_file.write(f"Connected Component {component}, number of pixels = {size}\n")
+    output_file.write(f"Total number of connected components = {len(sizes)}")
     output_file.close()
 
-    # Generates image of largest two components
-    component_1, component_2 = sorted_components[0][0], sorted_components[1][0]  # index of largest two components
-    height, width = MARK.shape[0], MARK.shape[1]
-    top_two = np.array([[1] * width for _ in range(height)])  # creates black image
-    for row_index, row in enumerate(MARK):
-        for col_index, _ in enumerate(row):
-            pixel = int(MARK[row_index][col_index])
-            if pixel == component_1 or pixel == component_2:  # if pixel is one of the two largest components
-                top_two[row_index][col_index] = 0  # make pixel white
-    plt.imsave("cc-top-2.jpg", top_two, cmap='Greys')
-    return top_two
+    # Generates image of largest k components
+    largest = components[order[:k]]
+    top_k = np.where(np.isin(MARK, largest), 0, 1)  # white for pixels in the largest components, black otherwise
+    plt.imsave(f"cc-top-{k}.jpg", top_k, cmap='Greys')
+    return top_k
@@ -1,10 +1,11 @@
-import pandas as pd
 import re
 import datetime
 from matplotlib import pyplot as plt
 import reporting
 import intelligence
 import monitoring
+import storage
+import api
 
 
 def main_menu():
@@ -81,6 +82,10 @@ Returns:
         else:
             print("Invalid option, try again:", end="")
     print(f"\n{site_selected} selected")
+    try:
+        LocationData.refresh([site_selected])  # adds any hours appended to the csv since it was read
+    except FileNotFoundError:  # csv deleted or moved since it was loaded
+        print(f"Data file for {site_selected} not found, using the data already loaded")
 
     print("0: Daily Average")
     print("1: Daily Median")
@@ -442,14 +447,10 @@ Returns:
 
 
 if __name__ == '__main__':
-    LocationData = {"Harlington": None,
-                    "Marylebone Road": None,
-                    "N Kensington": None}  # dictionary containing data about each location
-
-    # adds dataframe for each location to LocationData dictionary
-    for key in LocationData:  # for each location
-        dataframe = pd.read_csv(f"./data/Pollution-London {key}.csv")
-        LocationData[key] = dataframe
+    # typed dataframe for each location, parsed csvs are cached in ./data/.station_cache for fast startup
+    LocationData = storage.StationStore.load(["Harlington", "Marylebone Road", "N Kensington"], "./data",
+                                             cache_dir="./data/.station_cache")
+    api.set_cache(api.ResponseCache("./data/.api_cache"))  # past dates are only ever downloaded once
 
     main_menu()
 
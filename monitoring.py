@@ -1,20 +1,25 @@
-from matplotlib import pyplot as plt
-import requests
 import datetime
+import json
+import api
+import instrument
 import utils
 import numpy as np
+import requests
 
 
-def air_quality_indexes(site_code: str) -> dict[str: list]:
+@instrument.timed
+def air_quality_indexes(site_code: str, max_workers: int = None) -> dict[str: list]:
     """
 Returns the air quality indexes for each pollutant measured at the specified site every day for the last 31 days
 Returns a dictionary containing pollutant: indexes_list as key: value pairs
 Indexes lists have air quality index from the furthest back date at the start of the list and the air quality index from
 the most recent date at the end of the list
 Adds "N/A" to a pollutants indexes list if there is no data for that day
+The 31 days are requested at the same time and then processed in date order
 
     Args:
         site_code: string of code for the specified monitoring site e.g. MY1
+        max_workers: maximum number of requests made at the same time, api.MAX_WORKERS if None
 
     Returns:
         indexes: dictionary containing pollutant codes of pollutants measured at the site as keys and lists containing
@@ -23,14 +28,12 @@ Adds "N/A" to a pollutants indexes list if there is no data for that day
     """
     indexes = {}
 
-    date = datetime.date.today() - datetime.timedelta(days=32)
-    for day in range(31):
-        date = date + datetime.timedelta(days=1)
-
-        url = f"https://api.erg.ic.ac.uk/AirQuality/Daily/MonitoringIndex/SiteCode={site_code}/Date={date}/Json"
-        res = requests.get(url)
+    first_date = datetime.date.today() - datetime.timedelta(days=31)
+    dates = [first_date + datetime.timedelta(days=day) for day in range(31)]
+    urls = [f"{api.API_URL}/Daily/MonitoringIndex/SiteCode={site_code}/Date={date}/Json" for date in dates]
+    for content in api.fetch_all(urls, max_workers):  # responses are in date order
         try:
-            live_data = res.json()  # dictionary returned by api containing live data
+            live_data = json.loads(content)  # dictionary returned by api containing live data
             for item in live_data["DailyAirQualityIndex"]["LocalAuthority"]["Site"]["Species"]:
                 if indexes.get(item["@SpeciesCode"]) is None:  # if pollutant is not a key in indexes dictionary
                     indexes[item["@SpeciesCode"]] = [int(item["@AirQualityIndex"])]  # add pollutant as key with list
@@ -42,6 +45,43 @@ Adds "N/A" to a pollutants indexes list if there is no data for that day
     return indexes
 
 
+def _fetch_values(pairs: list[tuple], start_date, end_date, max_workers: int = None,
+                  skip_failures: bool = False) -> list[np.ndarray]:
+    """
+Fetches the raw values of every (site_code, species_code) pair between two dates at the same time. Responses are
+streamed into numpy arrays by api.read_raw_values rather than loaded as dictionaries
+
+    Args:
+        pairs: list of (site_code, species_code) tuples
+        start_date: first date of data
+        end_date: date data ends on
+        max_workers: maximum number of requests made at the same time, api.MAX_WORKERS if None
+        skip_failures: if True a pair whose request fails gives the error raised instead of raising it
+
+    Returns:
+        values_arrays: list of 1D numpy arrays of the values for each pair in the same order as pairs, empty values are
+        ignored. A pair that failed has its exception instead when skip_failures is True
+
+    Raises:
+        requests.RequestException: a request could not be made and skip_failures is False
+        ValueError: a response is not raw data and skip_failures is False
+    """
+    urls = [_site_species_url(site_code, species_code, start_date, end_date) for site_code, species_code in pairs]
+    hours = (end_date - start_date).days * 24  # most measurements are hourly
+
+    def read_values(chunks):
+        try:
+            _, values = api.read_raw_values(chunks, hours)
+        except (requests.RequestException, ValueError) as error:
+            if not skip_failures:
+                raise
+            return error
+        return values[~np.isnan(values)]  # value is empty so ignored
+
+    return api.stream_all(urls, read_values, max_workers)
+
+
+@instrument.timed
 def compare_sites(site1_code: str, site2_code: str, species_code: str) -> dict[str: tuple]:
     """
 Calculates the mean, median and standard deviation for two different monitoring stations for the last week of data
@@ -60,22 +100,9 @@ and standard deviation for these sites
     start_date = end_date - datetime.timedelta(days=7)
 
     sites_analytics = {site1_code: (), site2_code: ()}
-    for i in range(1, 3):
-        if i == 1:
-            site_code = site1_code
-        else:
-            site_code = site2_code
-        url = f"https://api.erg.ic.ac.uk/AirQuality/Data/SiteSpecies/SiteCode={site_code}/SpeciesCode={species_code}/StartDate={start_date}/EndDate={end_date}/Json"
-        res = requests.get(url)
-        live_data = res.json()  # dictionary returned by api containing live data
-
-        values = []
-        for item in live_data["RawAQData"]["Data"]:
-            try:
-                values.append(float(item["@Value"]))
-            except ValueError:  # value is empty so ignored from list
-                pass
-
+    pairs = [(site1_code, species_code), (site2_code, species_code)]
+    for (site_code, _), values in zip(pairs, _fetch_values(pairs, start_date, end_date)):
+        values = values.tolist()
         if utils.length(values) == 0:  # no data available for that site
             sites_analytics[site_code] = ("N/A", "N/A", "N/A")
         else:
@@ -87,15 +114,69 @@ and standard deviation for these sites
     return sites_analytics
 
 
-def monthly_average(site_code: str, species_code: str, year: str = None) -> list[float]:
+@instrument.timed
+def compare_species(site_codes: list[str], species_codes: list[str], days: int = 7,
+                    max_workers: int = None) -> "pd.DataFrame":
+    """
+Calculates the mean, median and standard deviation of every species at every site over the last days of data.
+Every site and species combination is requested at the same time over the shared connection pool
+
+    Args:
+        site_codes: list of codes for monitoring sites e.g. ["MY1", "BL0"]
+        species_codes: list of codes for pollutants e.g. ["NO2", "PM10"]
+        days: number of days of data before today to use
+        max_workers: maximum number of requests made at the same time, api.MAX_WORKERS if None
+
+    Returns:
+        table: dataframe with one row per (site, species) pair and columns site, species, count, mean, median, sd and
+        error. Statistics are to 3dp and NaN where there is no data for the pair. Pairs whose request failed, or whose
+        response was not raw data, have NaN for count and every statistic and the reason in error, which is missing for
+        every other pair
+    """
+    import pandas as pd  # only needed here, the other functions return plain lists and dictionaries
+    end_date = datetime.date.today()
+    start_date = end_date - datetime.timedelta(days=days)
+
+    pairs = [(site_code, species_code) for site_code in site_codes for species_code in species_codes]
+    rows = []
+    all_values = _fetch_values(pairs, start_date, end_date, max_workers, skip_failures=True)
+    for (site_code, species_code), values in zip(pairs, all_values):
+        if isinstance(values, Exception):  # request for that pair failed
+            rows.append((site_code, species_code, np.nan, np.nan, np.nan, np.nan, str(values)))
+            continue
+        if len(values) == 0:  # no data available for that pair
+            mean = median = sd = np.nan
+        else:
+            mean, median, sd = values.mean(), np.median(values), values.std()
+        rows.append((site_code, species_code, len(values), round(float(mean), 3), round(float(median), 3),
+                     round(float(sd), 3), None))
+
+    return pd.DataFrame(rows, columns=["site", "species", "count", "mean", "median", "sd", "error"])
+
+
+def _site_species_url(site_code: str, species_code: str, start_date, end_date) -> str:
+    """
+Returns the url for the raw data of a species at a site between two dates
+    """
+    return (f"{api.API_URL}/Data/SiteSpecies/SiteCode={site_code}/SpeciesCode={species_code}"
+            f"/StartDate={start_date}/EndDate={end_date}/Json")
+
+
+@instrument.timed
+def monthly_average(site_code: str, species_code: str, year: str = None, months_per_request: int = 12,
+                    max_workers: int = None) -> list[float]:
     """
 Calculates the monthly average for each month in the specified year for the desired site and species.
+The year is requested in ranges of months_per_request months, by default in a single request, and the values are then
+grouped into months using their measurement dates.
 Displays a line graph of the monthly averages where any values that are "N/A" are removed from the graph
 so the line travels straight between the two adjacent points
     Args:
         site_code: string of code for a specific monitoring site e.g. MY1
         species_code: string of code for a specific pollutant e.g. NO2
         year: string of year in the form YYYY
+        months_per_request: number of months of data fetched by each request, from 1-12
+        max_workers: maximum number of requests made at the same time, api.MAX_WORKERS if None
 
     Returns:
         month_averages: list containing the average pollutant values for each month of the year
@@ -105,27 +186,34 @@ so the line travels straight between the two adjacent points
         today = datetime.date.today()
         year = today.year
 
-    month_averages = []
-    for month in range(1, 13):
-        start_date = np.datetime64(f'{year}-{month:0>2}-01')  # first day of month
-        end_date = np.datetime64(f'{year}-{month:0>2}') + np.timedelta64(1, 'M') - np.timedelta64(1, "D")  # last day
+    first_months = range(1, 13, months_per_request)  # first month of each request
+    urls = []
+    for first_month in first_months:
+        start_date = np.datetime64(f'{year}-{first_month:0>2}')  # first day of range
+        end_date = start_date + np.timedelta64(months_per_request, 'M')  # first day after range
+        urls.append(_site_species_url(site_code, species_code, f"{start_date}-01", f"{end_date}-01"))
 
+    hours = months_per_request * 31 * 24  # most measurements are hourly
+    responses = api.stream_all(urls, lambda chunks: api.read_raw_values(chunks, hours), max_workers)
+    dates = np.concatenate([response_dates for response_dates, _ in responses])  # measurement date of every value
+    values = np.concatenate([response_values for _, response_values in responses])
+    requested = np.repeat([first_month - 1 for first_month in first_months],  # first month of the request for each value
+                          [len(response_values) for _, response_values in responses])
 
-        url = f"https://api.erg.ic.ac.uk/AirQuality/Data/SiteSpecies/SiteCode={site_code}/SpeciesCode={species_code}/StartDate={start_date}/EndDate={end_date}/Json"
-        res = requests.get(url)
-        live_data = res.json()  # dictionary returned by api containing live data
+    # month of each value from 0-11. Values outside their request's months, e.g. midnight at the end of the range
+    # which is also the start of the next request, are dropped so they are not counted twice. Empty values are dropped
+    months = (dates.astype("datetime64[M]") - np.datetime64(f"{year}-01")).astype(np.int64)
+    in_range = (months >= requested) & (months < requested + months_per_request) & (months < 12) & ~np.isnan(values)
+    months, values = months[in_range], values[in_range]
+    counts = np.bincount(months, minlength=12)
+    totals = np.bincount(months, weights=values, minlength=12)  # summed in order, the same as utils.meannvalue
 
-        values = []  # temporarily stores values for current month
-        for item in live_data["RawAQData"]["Data"]:
-            try:
-                values.append(float(item["@Value"]))
-            except ValueError:  # no data available for that time
-                pass
-        try:
-            avg = utils.meannvalue(values)
-            month_averages.append(round(avg, 3))
-        except ZeroDivisionError:  # no values available for that month
+    month_averages = []
+    for total, count in zip(totals.tolist(), counts.tolist()):
+        if count == 0:  # no values available for that month
             month_averages.append("N/A")
+        else:
+            month_averages.append(round(total / count, 3))
 
     graph_averages = []  # removes any data that is "N/A" from graph
     months = []
@@ -137,6 +225,7 @@ so the line travels straight between the two adjacent points
     if utils.length(graph_averages) == 0:
         print("No data available")
     else:
+        from matplotlib import pyplot as plt  # loaded only when plotting, it is slow to import
         # Plot graph of monthly averages
         plt.plot(months, graph_averages)
         plt.title(f"{species_code} Monthly Averages in {year} for {site_code}")
@@ -147,6 +236,7 @@ so the line travels straight between the two adjacent points
     return month_averages
 
 
+@instrument.timed
 def year_objectives(site_code: str, year: str) -> tuple[list[tuple], float]:
     """
 Finds the pollution objectives for a given site and a given year.
@@ -164,10 +254,10 @@ List of objectives contains tuples of (pollutant code, objective description, ac
     Raises:
         ValueError: No data is available from the api
     """
-    url = f"https://api.erg.ic.ac.uk/AirQuality/Annual/MonitoringObjective/SiteCode={site_code}/Year={year}/Json"
-    res = requests.get(url)
+    url = f"{api.API_URL}/Annual/MonitoringObjective/SiteCode={site_code}/Year={year}/Json"
+    content = api.fetch(url)
     try:
-        live_data = res.json()  # dictionary returned by api containing live data
+        live_data = json.loads(content)  # dictionary returned by api containing live data
     except Exception:
         raise ValueError
 
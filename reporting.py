@@ -1,7 +1,173 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import inspect
+import os
+import tempfile
+import numpy as np
 import pandas as pd
-import utils
+import instrument
+import storage
 
 
+def _parse_column(df, pollutant: str) -> np.ndarray:
+    """
+Returns a pollutant column as a numpy array of floats. Typed columns from storage.read_station_csv are returned
+without copying. Columns of strings are converted in a single pass and values that are 'no data' become NaN
+
+     Args:
+         df: dataframe for a monitoring station
+         pollutant: code for pollutant to be used
+
+     Returns:
+         values: 1D numpy array of floats with NaN wherever there was no data
+
+     Raises:
+         KeyError: Invalid pollutant entered
+     """
+    try:
+        column = df[pollutant]
+    except KeyError:
+        raise KeyError("Invalid pollutant code")
+    instrument.add(rows=len(column))
+    if pd.api.types.is_float_dtype(column):  # already typed by storage.read_station_csv
+        return column.to_numpy(dtype=np.float64)
+    with instrument.phase("parse"):
+        return pd.to_numeric(column, errors="coerce").to_numpy(dtype=np.float64)  # 'No data' can't be parsed so is NaN
+
+
+def _station_index(data: dict, monitoring_station: str, pollutant: str = None) -> storage.StationAggregates or None:
+    """
+Returns the aggregate index of a station's current dataframe, built by the store on first use, if data is a
+StationStore holding the station and, if pollutant is given, the index includes the pollutant. Otherwise returns None
+so the caller scans the dataframe instead
+    """
+    if not isinstance(data, storage.StationStore) or monitoring_station not in data:
+        return None
+    index = data.index(monitoring_station)
+    if index is None:
+        return None
+    if pollutant is not None and pollutant not in index.tables:
+        return None
+    return index
+
+
+def _grouped_mean(codes: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    """
+Calculates the mean of the values in every group at once. Values are summed in the order they appear, the same as
+utils.meannvalue, so results match it exactly
+
+     Args:
+         codes: 1D numpy array giving the group number of each value
+         values: 1D numpy array of floats, NaN values are ignored
+         n_groups: total number of groups
+
+     Returns:
+         means: 1D numpy array of the mean of each group, NaN for groups with no values
+     """
+    present = ~np.isnan(values)
+    counts = np.bincount(codes[present], minlength=n_groups)
+    totals = np.bincount(codes[present], weights=values[present], minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):  # empty groups give 0/0 which is NaN
+        return totals / counts
+
+
+def _grouped_median(codes: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    """
+Calculates the median of the values in every group at once by sorting all values by group then by value and
+picking out the middle of each group
+
+     Args:
+         codes: 1D numpy array giving the group number of each value
+         values: 1D numpy array of floats, NaN values are ignored
+         n_groups: total number of groups
+
+     Returns:
+         medians: 1D numpy array of the median of each group, NaN for groups with no values
+     """
+    present = ~np.isnan(values)
+    codes, values = codes[present], values[present]
+    values = values[np.lexsort((values, codes))]  # sorted by group, then by value within each group
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.cumsum(counts) - counts  # position of the first value of each group
+
+    medians = np.full(n_groups, np.nan)
+    has_data = counts > 0
+    mid = counts[has_data] // 2
+    lower = values[starts[has_data] + mid]
+    upper = values[starts[has_data] + counts[has_data] - 1 - mid]  # same element as lower for odd length groups
+    medians[has_data] = (lower + upper) / 2
+    return medians
+
+
+def _grouped_argmax(codes: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    """
+Finds the position of the largest value in every group at once, ignoring NaN. If the largest value occurs more than
+once in a group the first position is returned, the same as np.nanargmax
+
+     Args:
+         codes: 1D numpy array giving the group number of each value
+         values: 1D numpy array of floats, NaN values are ignored
+         n_groups: total number of groups
+
+     Returns:
+         positions: 1D numpy array of the position in values of each group's largest value, -1 for groups with no values
+     """
+    rows = np.flatnonzero(~np.isnan(values))
+    order = rows[np.lexsort((rows, -values[rows], codes[rows]))]  # by group, then largest value, then earliest row
+    counts = np.bincount(codes[rows], minlength=n_groups)
+    positions = np.full(n_groups, -1, dtype=np.intp)
+    positions[counts > 0] = order[(np.cumsum(counts) - counts)[counts > 0]]  # first row of each group
+    return positions
+
+
+def _daily_statistic(data: dict, monitoring_station: str, pollutant: str, statistic) -> list[float]:
+    """
+Groups a pollutant column by date and calculates a statistic for every day in one pass.
+Days are returned in the same order as the dates found every 24 rows of the dataframe
+
+     Args:
+         data: dictionary containing the monitoring sites as keys with their associated dataframes as the values
+         monitoring_station: Name of monitoring station
+         pollutant: code for pollutant to be used
+         statistic: _grouped_mean or _grouped_median
+
+     Returns:
+         results: list of the statistic to 3dp for each day, "N/A" for days without data
+
+     Raises:
+         KeyError: Invalid monitoring station or pollutant entered
+     """
+    try:
+        df = data[monitoring_station]  # gets dataframe for location
+    except KeyError:
+        raise KeyError("Monitoring station invalid")
+
+    values = _parse_column(df, pollutant)
+    codes, dates = pd.factorize(df["date"], sort=False)  # number each distinct date
+    days = dates.get_indexer(df["date"].iloc[0::24])  # Step 24 as each date repeated 24 times
+    return _report(statistic(codes, values, len(dates))[days])
+
+
+def _report(results: np.ndarray) -> list[float]:
+    """
+Converts an array of statistics into the list returned by the reporting functions
+
+     Args:
+         results: 1D numpy array of floats, NaN where there was no data
+
+     Returns:
+         report: list of values rounded to 3dp with "N/A" in place of NaN
+     """
+    report = []
+    for value in results.tolist():
+        if np.isnan(value):  # no data for the whole group
+            report.append("N/A")
+        else:
+            report.append(round(value, 3))
+    return report
+
+
+@instrument.timed
 def daily_average(data: dict, monitoring_station: str, pollutant: str) -> list[float]:
     """
 Returns a list containing the average value for the specified pollutant for each day of the year
@@ -20,30 +186,13 @@ If there is no data for the whole day, "N/A" is added to averages list
      Raises:
          KeyError: Invalid monitoring station or pollutant entered
      """
-    try:
-        df = data[monitoring_station]  # gets dataframe for location
-    except KeyError:
-        raise KeyError("monitoring station invalid")
-
-    averages = []  # list to store pollutant averages of each day
-    for day in df.loc[0::24, "date"]:  # loops through each date in dataframe. Step 24 as each date repeated 24 times
-        day_values = []
-        try:
-            for value in df.loc[df["date"] == day, pollutant]:
-                try:
-                    day_values.append(float(value))
-                except ValueError:  # value contains 'no data' so not added to list
-                    continue
-            try:
-                day_average = utils.meannvalue(day_values)
-                averages.append(round(day_average, 3))  # adds average value rounded to 3dp to list of averages
-            except ZeroDivisionError:  # no items in day_values
-                averages.append("N/A")
-        except KeyError:
-            raise KeyError("Invalid pollutant code")
-    return averages
+    index = _station_index(data, monitoring_station, pollutant)
+    if index is not None:  # read from the station's day table
+        return _report(index.mean(pollutant, "day")[index.day_order])
+    return _daily_statistic(data, monitoring_station, pollutant, _grouped_mean)
 
 
+@instrument.timed
 def daily_median(data: dict, monitoring_station: str, pollutant: str) -> list[float]:
     """
 Returns a list containing the median value for the specified pollutant for every day of the year
@@ -62,30 +211,10 @@ If there is no data for the whole day, "N/A" is added to medians list
      Raises:
          KeyError: Invalid monitoring station or pollutant entered
      """
-    try:
-        df = data[monitoring_station]  # gets dataframe for location
-    except KeyError:
-        raise KeyError("Monitoring station invalid")
-
-    medians = []
-    for day in df.loc[0::24, "date"]:  # loops through each date in dataframe. Step 24 as each date repeated 24 times
-        day_values = []
-        try:
-            for value in df.loc[df['date'] == day, pollutant]:
-                try:
-                    day_values.append(float(value))
-                except ValueError:  # if value cannot be converted to float, ignore value
-                    continue
-            try:
-                median_value = utils.median(day_values)
-                medians.append(round(median_value, 3))  # adds median value rounded to 3dp to list of medians
-            except IndexError:  # day_values has no elements
-                medians.append("N/A")
-        except KeyError:
-            raise KeyError("Invalid pollutant code")
-    return medians
+    return _daily_statistic(data, monitoring_station, pollutant, _grouped_median)
 
 
+@instrument.timed
 def hourly_average(data: dict, monitoring_station: str, pollutant: str) -> list[float]:
     """
 Returns a list containing the average value to 3dp for a pollutant for each hour of the day at the specified
@@ -104,32 +233,23 @@ If there is no data on any day for that hour, "N/A" is added to hourly_averages
      Raises:
          KeyError: Invalid monitoring station or pollutant entered
      """
+    index = _station_index(data, monitoring_station, pollutant)
+    if index is not None:
+        return _report(index.mean(pollutant, "hour"))
+
     try:
         df = data[monitoring_station]  # gets dataframe for location
     except KeyError:
         raise KeyError("Monitoring station invalid")
 
-    hourly_averages = []
-    for hour in range(1, 25):
-        time = f"{hour:0>2}:00:00"
-
-        hour_values = []
-        try:
-            for value in df.loc[df['time'] == time, pollutant]:  # for pollutant values for specified hour
-                try:
-                    hour_values.append(float(value))
-                except ValueError:  # value contains 'no data' so not added to list
-                    continue
-            try:
-                hour_average = utils.meannvalue(hour_values)
-                hourly_averages.append(round(hour_average, 3))  # adds average for specified hour to 3dp
-            except ZeroDivisionError:  # no items in hour_values
-                hourly_averages.append("N/A")
-        except KeyError:
-            raise KeyError("Invalid pollutant code")
-    return hourly_averages
+    values = _parse_column(df, pollutant)
+    times = pd.Index([f"{hour:0>2}:00:00" for hour in range(1, 25)])
+    codes = times.get_indexer(df["time"])  # hour of each row from 0-23, -1 for any other time
+    on_the_hour = codes >= 0
+    return _report(_grouped_mean(codes[on_the_hour], values[on_the_hour], 24))
 
 
+@instrument.timed
 def monthly_average(data: dict, monitoring_station: str, pollutant: str) -> list[float]:
     """
 Returns a list of the average pollutant value to 3dp for each month of the year for a specified monitoring station
@@ -148,31 +268,21 @@ If there is no data for the whole month, "N/A" is added to medians list
      Raises:
          KeyError: Invalid monitoring station or pollutant entered
      """
+    index = _station_index(data, monitoring_station, pollutant)
+    if index is not None:
+        return _report(index.mean(pollutant, "month"))
+
     try:
         df = data[monitoring_station]  # gets dataframe for location
     except KeyError:  # the monitoring station inputted was invalid
         raise KeyError("Monitoring station invalid")
 
-    month_avg_list = []
-    for month in range(1, 13):
-        month_df = df[pd.to_datetime(df['date']).dt.month == month]  # creates dataframe for specified month
-        month_data = []
-        try:
-            for value in month_df.loc[:, pollutant]:
-                try:
-                    month_data.append(float(value))
-                except ValueError:  # ignore if value is 'no data'
-                    continue
-            try:
-                month_average = utils.meannvalue(month_data)
-                month_avg_list.append(round(month_average, 3))
-            except ZeroDivisionError:  # no items in month_average
-                month_avg_list.append("N/A")
-        except KeyError:
-            raise KeyError("Invalid pollutant code")
-    return month_avg_list
+    values = _parse_column(df, pollutant)
+    codes = pd.to_datetime(df["date"].to_numpy()).month.to_numpy() - 1  # month of each row from 0-11
+    return _report(_grouped_mean(codes, values, 12))
 
 
+@instrument.timed
 def peak_hour_date(data: dict, date: str, monitoring_station: str, pollutant: str) -> (str, float):
     """
 Returns a tuple (time, max_value) where 'time' is the time of the largest pollutant value and
@@ -191,28 +301,87 @@ Returns None, None if no data is found for that day
      Raises:
          KeyError: Invalid monitoring station or pollutant entered
      """
+    index = _station_index(data, monitoring_station)
+    if index is not None:
+        day = index.day(date)  # binary search of the station's sorted dates
+        if pollutant in index.tables:  # largest value and its first row are kept in the day table
+            table = index.tables[pollutant]["day"]
+            if day == -1 or table["count"][day] == 0:  # no rows or no data for that day
+                return None, None
+            return index.times[table["argmax"][day]], float(table["max"][day])
+        rows = index.rows(day) if day != -1 else np.empty(0, dtype=np.intp)
+        return _peak(_parse_column(index.frame.iloc[rows], pollutant), index.times[rows])
+
     try:
         df = data[monitoring_station]  # gets dataframe for location
     except KeyError:
         raise KeyError("Monitoring station invalid")
 
-    max_value = None
-    max_time = None
-    day_df = df.loc[df["date"] == date]  # creates dataframe only containing data for specified date
-    if day_df.empty:
+    values = _parse_column(df, pollutant)
+    on_date = (df["date"] == date).to_numpy()  # rows containing data for specified date
+    return _peak(values[on_date], df["time"].to_numpy()[on_date])
+
+
+def _peak(day_values: np.ndarray, day_times: np.ndarray) -> (str, float):
+    """
+Returns the time and value of the largest value of a day, ignoring NaN, or None, None if the day has no data
+    """
+    if len(day_values) == 0 or np.isnan(day_values).all():  # no rows or every value that day is 'no data'
         return None, None
-    for _, row in day_df.iterrows():
-        try:
-            if max_value is None or float(row[pollutant]) > max_value:  # if no maxvalue yet or value>maxvalue
-                max_value = float(row[pollutant])  # update maxvalue to new largest value
-                max_time = row["time"]  # update max_time to time of the largest value
-        except ValueError:  # pollutant value is 'no data'
-            continue
-        except KeyError:
-            raise KeyError("Invalid pollutant code")
-    return max_time, max_value  # if there is a value for maxvalue and max_time return values
+    index = int(np.nanargmax(day_values))  # first occurrence of the largest value
+    return day_times[index], float(day_values[index])
 
 
+@instrument.timed
+def peak_hours(data: dict, monitoring_station: str, pollutant: str, start_date: str = None,
+               end_date: str = None) -> list[tuple]:
+    """
+Returns the peak hour of every day from start_date to end_date in one call. Each day gives the same time and value
+as peak_hour_date, found for all days at once instead of one date at a time
+
+     Args:
+         data: dictionary containing the monitoring sites as keys with their associated dataframes as the values
+         monitoring_station: Name of monitoring station
+         pollutant: code for pollutant to be used
+         start_date: first date in the form YYYY-MM-DD, None to start from the first date of data
+         end_date: last date in the form YYYY-MM-DD, None to finish at the last date of data
+
+     Returns:
+         peaks: list of (date, max_time, max_value) tuples in date order, time and value are None for days without data
+
+     Raises:
+         KeyError: Invalid monitoring station or pollutant entered
+     """
+    index = _station_index(data, monitoring_station, pollutant)
+    if index is not None:
+        days = index.days_between(start_date, end_date)
+        table = index.tables[pollutant]["day"]
+        dates, rows, maxima = index.dates[days], table["argmax"][days], table["max"][days]
+        times = index.times
+    else:
+        try:
+            df = data[monitoring_station]  # gets dataframe for location
+        except KeyError:
+            raise KeyError("Monitoring station invalid")
+        values = _parse_column(df, pollutant)
+        codes, dates = pd.factorize(df["date"], sort=True)  # number each distinct date in date order
+        dates = dates.to_numpy().astype(str)
+        first = 0 if start_date is None else np.searchsorted(dates, start_date, side="left")
+        last = len(dates) if end_date is None else np.searchsorted(dates, end_date, side="right")
+        dates, rows = dates[first:last], _grouped_argmax(codes, values, len(dates))[first:last]
+        maxima = np.where(rows >= 0, values[rows], np.nan)
+        times = df["time"].to_numpy()
+
+    peaks = []
+    for date, row, max_value in zip(dates, rows.tolist(), maxima.tolist()):
+        if row == -1:  # no data for the whole day
+            peaks.append((str(date), None, None))
+        else:
+            peaks.append((str(date), times[row], max_value))
+    return peaks
+
+
+@instrument.timed
 def count_missing_data(data: dict,  monitoring_station: str, pollutant: str) -> int:
     """
 Counts the number of values that contain 'no data' for a specified pollutant column at a specified monitoring station
@@ -228,25 +397,135 @@ Counts the number of values that contain 'no data' for a specified pollutant col
      Raises:
          KeyError: Invalid monitoring station or pollutant entered
      """
+    index = _station_index(data, monitoring_station, pollutant)
+    if index is not None:
+        return int(index.tables[pollutant]["day"]["missing"].sum())
+
     try:
         df = data[monitoring_station]  # gets dataframe for location
     except KeyError:
         raise KeyError("Monitoring station invalid")
 
-    count = 0
-    for _, row in df.iterrows():
-        try:
-            if row[pollutant] == "No data":
-                count += 1
-        except KeyError:
-            raise KeyError("Invalid pollutant code")
-    return count
+    return int(np.isnan(_parse_column(df, pollutant)).sum())
+
+
+FILL_STRATEGIES = ("constant", "ffill", "linear", "climatology")
+
+
+def _filled_values(values: np.ndarray, strategy: str, new_value: float, hours: np.ndarray,
+                   hour_means: np.ndarray = None) -> np.ndarray:
+    """
+Returns a copy of a pollutant column with NaN values replaced using a fill strategy. Gaps that the strategy can't
+fill, such as gaps before the first value when forward filling, are left as NaN
+
+     Args:
+         values: 1D numpy array of floats with NaN wherever there is no data
+         strategy: 'constant' uses new_value, 'ffill' repeats the last value before the gap, 'linear' draws a
+         straight line between the values either side of the gap, 'climatology' uses the mean for that hour of day
+         new_value: float used by the constant strategy
+         hours: 1D numpy array of the hour of each row from 0-23, -1 for any other time
+         hour_means: 1D numpy array of the mean for each hour, calculated from values if None
 
+     Returns:
+         filled: 1D numpy array of floats
+     """
+    missing = np.isnan(values)
+    positions = np.arange(len(values))
+    if strategy == "constant":
+        return np.where(missing, new_value, values)
+    if strategy == "ffill":
+        last = np.maximum.accumulate(np.where(missing, -1, positions))  # position of latest value at or before row
+        return np.where(last >= 0, values[last], np.nan)
+    if strategy == "linear":
+        known = np.flatnonzero(~missing)
+        filled = values.copy()
+        if len(known) > 0:
+            inner = np.flatnonzero(missing[known[0]:known[-1]]) + known[0]  # gaps with a value either side
+            filled[inner] = np.interp(inner, known, values[known])
+        return filled
+    if hour_means is None:
+        on_the_hour = hours >= 0
+        hour_means = _grouped_mean(hours[on_the_hour], values[on_the_hour], 24)
+    return np.where(missing & (hours >= 0), hour_means[hours], values)
+
+
+@instrument.timed
+def fill_missing(data: dict, monitoring_stations: list = None, pollutants: list = None, strategy: str = "constant",
+                 new_value: str = None, inplace: bool = False) -> dict:
+    """
+Replaces 'No data' values in several pollutant columns at several monitoring stations in one call. Missing values
+are found with a mask and filled using one of FILL_STRATEGIES. By default filled copies of the dataframes are
+returned and data is unchanged, with inplace=True the dataframes in data are changed instead. Stations in a
+StationStore keep an up to date aggregate index either way, a filled copy reuses its index once stored in the store
+
+     Args:
+         data: dictionary containing the monitoring sites as keys with their associated dataframes as the values
+         monitoring_stations: list of names of monitoring stations, every station in data if None
+         pollutants: list of codes for pollutants to fill, every pollutant in storage.POLLUTANTS if None
+         strategy: one of FILL_STRATEGIES, see _filled_values
+         new_value: value that replaces 'no data' values for the constant strategy
+         inplace: if True change the dataframes in data instead of returning copies
 
+     Returns:
+         filled: dictionary of monitoring station names and their filled dataframes
+
+     Raises:
+         KeyError: Invalid monitoring station or pollutant entered
+         ValueError: Invalid strategy entered or new_value is not a number
+     """
+    if strategy not in FILL_STRATEGIES:
+        raise ValueError("Invalid fill strategy")
+    if monitoring_stations is None:
+        monitoring_stations = list(data.keys())
+
+    filled = {}
+    for monitoring_station in monitoring_stations:
+        try:
+            df = data[monitoring_station]  # gets dataframe for location
+        except KeyError:
+            raise KeyError("Monitoring station invalid")
+        station_pollutants = pollutants
+        if pollutants is None:
+            station_pollutants = [pollutant for pollutant in storage.POLLUTANTS if pollutant in df.columns]
+        columns = {pollutant: _parse_column(df, pollutant) for pollutant in station_pollutants}
+        if strategy == "constant":
+            try:
+                new_value = float(new_value)
+            except TypeError:  # no value given
+                raise ValueError("new_value must be a number for the constant strategy")
+
+        index = _station_index(data, monitoring_station)
+        if index is not None:
+            hours = index.codes["hour"]
+        else:
+            times = pd.Index([f"{hour:0>2}:00:00" for hour in range(1, 25)])
+            hours = times.get_indexer(df["time"]) if strategy == "climatology" else None
+
+        result = df if inplace else df.copy()
+        for pollutant, values in columns.items():
+            hour_means = None
+            if strategy == "climatology" and index is not None and pollutant in index.tables:
+                hour_means = index.mean(pollutant, "hour")  # read from the station's hour table
+            new_values = _filled_values(values, strategy, new_value, hours, hour_means)
+            result[pollutant] = new_values
+            if index is not None and pollutant in index.tables:
+                rows = np.flatnonzero(np.isnan(values) & ~np.isnan(new_values))  # gaps that were filled
+                index = index.filled(result, pollutant, rows, new_values[rows])
+
+        if index is not None:
+            data.prepare(monitoring_station, index)  # index is reused when result is stored
+            if inplace:
+                data[monitoring_station] = result
+        filled[monitoring_station] = result
+    return filled
+
+
+@instrument.timed
 def fill_missing_data(data: dict, new_value: str,  monitoring_station: str, pollutant: str):
     """
 Returns a copy of the dataframe for the specified monitoring station where 'No data' values in the
-pollutant column have been replaced by 'new_value'
+pollutant column have been replaced by 'new_value'. If data is a StationStore the station's aggregate index is
+updated for the filled rows and reused when the copy is stored back under the same station
 
      Args:
          data: dictionary containing the monitoring sites as keys with their associated dataframes as the values
@@ -259,16 +538,441 @@ pollutant column have been replaced by 'new_value'
 
      Raises:
          KeyError: Invalid monitoring station or pollutant entered
+         ValueError: new_value is not a number
+     """
+    return fill_missing(data, [monitoring_station], [pollutant], "constant", new_value)[monitoring_station]
+
+
+# UK air quality objectives that can be checked from hourly station data, as
+# (species code, objective, hours averaged, limit, exceedances allowed a year, what is counted). Hours averaged is None
+# for annual means. 'hour' counts every running mean above the limit, 'day' counts days whose running mean at 24:00
+# is above it, which is the calendar day mean for 24 hour means, and 'day max' counts days whose largest running mean
+# is above it. Limits are in the units of the station data, ug/m3 except CO which is mg/m3
+OBJECTIVES = (
+    ("NO2", "200 ug/m3 as a 1 hour mean, not to be exceeded more than 18 times a year", 1, 200.0, 18, "hour"),
+    ("NO2", "40 ug/m3 as an annual mean", None, 40.0, 0, "year"),
+    ("PM10", "50 ug/m3 as a 24 hour mean, not to be exceeded more than 35 times a year", 24, 50.0, 35, "day"),
+    ("PM10", "40 ug/m3 as an annual mean", None, 40.0, 0, "year"),
+    ("PM25", "20 ug/m3 as an annual mean", None, 20.0, 0, "year"),
+    ("CO", "10 mg/m3 as a maximum daily running 8 hour mean", 8, 10.0, 0, "day max"),
+    ("O3", "100 ug/m3 as a daily maximum of running 8 hour means, not to be exceeded more than 10 times a year", 8,
+     100.0, 10, "day max"),
+    ("SO2", "350 ug/m3 as a 1 hour mean, not to be exceeded more than 24 times a year", 1, 350.0, 24, "hour"),
+    ("SO2", "125 ug/m3 as a 24 hour mean, not to be exceeded more than 3 times a year", 24, 125.0, 3, "day"),
+)
+MIN_FRACTION = 0.75  # running means need at least 75% of their hours to have data, e.g. 6 of 8 or 18 of 24
+
+
+def _hour_positions(df: pd.DataFrame) -> tuple[np.ndarray, np.datetime64]:
+    """
+Places every row on an hourly time axis starting at 01:00:00 on the station's first date, so the hour ending at
+hour h of day d is at position 24 * d + h - 1 whether or not the rows in between exist
+
+     Args:
+         df: dataframe for a monitoring station
+
+     Returns:
+         positions: 1D numpy array of the position of each row, -1 for rows whose date or time can't be read
+         origin: midnight at the start of the first date as a numpy datetime64, None if no row can be read
+     """
+    if isinstance(df.index, pd.DatetimeIndex) and df.index.name == "timestamp":  # built by storage.read_station_csv
+        ends = df.index.to_numpy(dtype="datetime64[ns]")
+    else:
+        ends = (pd.to_datetime(df["date"].to_numpy(), format="%Y-%m-%d", errors="coerce")
+                + pd.to_timedelta(df["time"].to_numpy(), errors="coerce")).to_numpy(dtype="datetime64[ns]")
+    positions = np.full(len(ends), -1, dtype=np.intp)
+    readable = ~np.isnat(ends)
+    origin = None
+    if readable.any():
+        origin = (ends[readable].min() - np.timedelta64(1, "h")).astype("datetime64[D]")  # midnight of first date
+        positions[readable] = (ends[readable] - origin) // np.timedelta64(1, "h") - 1
+    return positions, origin
+
+
+def _hour_count(positions: np.ndarray) -> int:
+    """
+Returns the number of hours on the time axis of _hour_positions, every hour of every day up to the last position
+    """
+    return 24 * (int(positions.max()) // 24 + 1) if (positions >= 0).any() else 0
+
+
+def _hourly_grid(df: pd.DataFrame, pollutants: list, year: str = None) -> np.ndarray:
+    """
+Lays out pollutant columns on the hourly time axis of _hour_positions so running windows cover a fixed number of
+hours even where rows are missing
+
+     Args:
+         df: dataframe for a monitoring station
+         pollutants: list of codes for pollutants, one grid column each
+         year: str in the form YYYY to only use rows dated in that year, every row if None
+
+     Returns:
+         grid: 2D numpy array with a row for every hour of every day from the first date to the last and a column for
+         each pollutant, NaN wherever there was no data or no row
+
+     Raises:
+         KeyError: Invalid pollutant entered
+     """
+    if year is not None:
+        df = df[df["date"].astype(str).str.startswith(str(year)).to_numpy()]
+    positions, _ = _hour_positions(df)
+    on_axis = positions >= 0
+    grid = np.full((_hour_count(positions), len(pollutants)), np.nan)
+    for column, pollutant in enumerate(pollutants):
+        grid[positions[on_axis], column] = _parse_column(df, pollutant)[on_axis]
+    return grid
+
+
+def _min_count(hours: int, min_fraction: float) -> int:
+    """
+Returns the number of hours of a window that need data for its mean to be used
+
+     Raises:
+         ValueError: hours is not a positive whole number
+     """
+    if not isinstance(hours, (int, np.integer)) or isinstance(hours, bool) or hours < 1:
+        raise ValueError("hours must be a positive whole number")
+    return max(1, int(np.ceil(hours * min_fraction - 1e-9)))
+
+
+def _rolling_mean(grid: np.ndarray, hours: int, min_count: int) -> np.ndarray:
+    """
+Calculates the running mean over the last hours rows of every column in O(n). Each window's sum and count are the
+difference of two cumulative sums, so the cost doesn't depend on the length of the window
+
+     Args:
+         grid: 2D numpy array of floats, NaN values are ignored
+         hours: number of rows in each window, windows at the start of the grid are shorter
+         min_count: number of values a window needs for its mean to be calculated
+
+     Returns:
+         means: 2D numpy array the shape of grid holding the mean of the window ending at each row, NaN where the
+         window has fewer than min_count values
+     """
+    present = ~np.isnan(grid)
+    zeros = np.zeros((1, grid.shape[1]))
+    sums = np.concatenate([zeros, np.cumsum(np.where(present, grid, 0.0), axis=0)])
+    counts = np.concatenate([zeros, np.cumsum(present, axis=0)])
+    starts = np.maximum(np.arange(len(grid)) + 1 - hours, 0)  # cumulative row before the start of each window
+    totals = sums[1:] - sums[starts]
+    window_counts = counts[1:] - counts[starts]
+    with np.errstate(invalid="ignore", divide="ignore"):  # empty windows give 0/0 which is NaN
+        return np.where(window_counts >= min_count, totals / window_counts, np.nan)
+
+
+def _rolling_max(values: np.ndarray, hours: int) -> np.ndarray:
+    """
+Finds the largest value over the last hours values at every position in O(n) with a monotonic deque. The deque holds
+the positions of values that could still be the largest of a later window, in decreasing order of value, so its first
+position is always the largest value of the current window
+
+     Args:
+         values: 1D numpy array of floats, NaN values are ignored
+         hours: number of values in each window, windows at the start are shorter
+
+     Returns:
+         maxima: 1D numpy array of the largest value of the window ending at each position, NaN where the window has
+         no values
+     """
+    maxima = np.full(len(values), np.nan)
+    window = deque()
+    values = values.tolist()
+    for position, value in enumerate(values):
+        if value == value:  # NaN is never kept
+            while window and values[window[-1]] <= value:  # can never be a maximum again
+                window.pop()
+            window.append(position)
+        if window and window[0] <= position - hours:  # largest value has left the window
+            window.popleft()
+        if window:
+            maxima[position] = values[window[0]]
+    return maxima
+
+
+@instrument.timed
+def rolling_average(data: dict, monitoring_station: str, pollutant: str, hours: int = 8,
+                    min_fraction: float = MIN_FRACTION) -> list[float]:
+    """
+Returns the running mean to 3dp of a pollutant over the hours ending at each hour at the specified monitoring
+station, e.g. the running 8 hour mean used for CO or the running 24 hour mean used for PM10. There is one value for
+every hour of every day from the first date to the last, in time order.
+If fewer than min_fraction of the hours of a window have data, "N/A" is added instead
+
+     Args:
+         data: dictionary containing the monitoring sites as keys with their associated dataframes as the values
+         monitoring_station: Name of monitoring station
+         pollutant: code for pollutant to be used
+         hours: number of hours in each window
+         min_fraction: fraction of the hours of a window that need data for its mean to be used
+
+     Returns:
+         rolling_averages: list of the running mean to 3dp ending at each hour
+
+     Raises:
+         KeyError: Invalid monitoring station or pollutant entered
+         ValueError: hours is not a positive whole number
+     """
+    min_count = _min_count(hours, min_fraction)
+    try:
+        df = data[monitoring_station]  # gets dataframe for location
+    except KeyError:
+        raise KeyError("Monitoring station invalid")
+
+    return _report(_rolling_mean(_hourly_grid(df, [pollutant]), hours, min_count)[:, 0])
+
+
+@instrument.timed
+def rolling_maximum(data: dict, monitoring_station: str, pollutant: str, hours: int = 24) -> list[float]:
+    """
+Returns the largest value of a pollutant over the hours ending at each hour at the specified monitoring station.
+There is one value for every hour of every day from the first date to the last, in time order.
+If a window has no data, "N/A" is added instead
+
+     Args:
+         data: dictionary containing the monitoring sites as keys with their associated dataframes as the values
+         monitoring_station: Name of monitoring station
+         pollutant: code for pollutant to be used
+         hours: number of hours in each window
+
+     Returns:
+         rolling_maxima: list of the largest value to 3dp in the window ending at each hour
+
+     Raises:
+         KeyError: Invalid monitoring station or pollutant entered
+         ValueError: hours is not a positive whole number
      """
+    _min_count(hours, 1)
     try:
         df = data[monitoring_station]  # gets dataframe for location
     except KeyError:
         raise KeyError("Monitoring station invalid")
 
-    for _, row in df.iterrows():
+    return _report(_rolling_max(_hourly_grid(df, [pollutant])[:, 0], hours))
+
+
+def rolling_times(data: dict, monitoring_station: str) -> list[tuple]:
+    """
+Returns the date and time of the end of every hour that rolling_average and rolling_maximum give a value for, in the
+same order, so each running value can be matched to the hour its window ends
+
+     Args:
+         data: dictionary containing the monitoring sites as keys with their associated dataframes as the values
+         monitoring_station: Name of monitoring station
+
+     Returns:
+         times: list of tuples of (date, time) in the station's form, e.g. ("2021-01-01", "24:00:00")
+
+     Raises:
+         KeyError: Invalid monitoring station entered
+     """
+    try:
+        df = data[monitoring_station]  # gets dataframe for location
+    except KeyError:
+        raise KeyError("Monitoring station invalid")
+
+    positions, origin = _hour_positions(df)
+    hours = np.arange(_hour_count(positions))
+    dates = (origin + (hours // 24).astype("timedelta64[D]")).astype(str) if len(hours) > 0 else []
+    return [(date, f"{hour % 24 + 1:0>2}:00:00") for date, hour in zip(dates, hours.tolist())]
+
+
+@instrument.timed
+def station_objectives(data: dict, monitoring_station: str, year: str, objectives: tuple = OBJECTIVES,
+                       min_fraction: float = MIN_FRACTION) -> list[tuple]:
+    """
+Checks the pollution objectives of every pollutant measured at a monitoring station over one calendar year of its
+hourly data, in the same form as monitoring.year_objectives so the two can be compared. Exceedances are allowed a
+number of times a year, so only that year's data is used. Every pollutant is laid out on one hourly grid and each
+length of running mean is calculated once for all of them. Objectives for species the station doesn't measure are
+left out
+
+     Args:
+         data: dictionary containing the monitoring sites as keys with their associated dataframes as the values
+         monitoring_station: Name of monitoring station
+         year: str in the form YYYY of the year to check
+         objectives: tuples in the form of OBJECTIVES
+         min_fraction: fraction of the hours of a running mean that need data for it to be used
+
+     Returns:
+         objective_list: list of tuples of (species code, objective, exceedances, achieved) where exceedances is the
+         number of times the limit was exceeded, 1 or 0 for annual means, and achieved is "YES", "NO", or "N/A" if
+         there was no data to check
+
+     Raises:
+         KeyError: Invalid monitoring station entered
+         ValueError: year is not in the form YYYY
+     """
+    if not (isinstance(year, (str, int)) and len(str(year)) == 4 and str(year).isdigit()):
+        raise ValueError("year must be in the form YYYY")
+    try:
+        df = data[monitoring_station]  # gets dataframe for location
+    except KeyError:
+        raise KeyError("Monitoring station invalid")
+
+    objectives = [objective for objective in objectives if objective[0].lower() in df.columns]
+    pollutants = list(dict.fromkeys(objective[0].lower() for objective in objectives))
+    grid = _hourly_grid(df, pollutants, year)
+    running = {hours: _rolling_mean(grid, hours, _min_count(hours, min_fraction))  # one pass for every pollutant
+               for hours in {objective[2] for objective in objectives if objective[2] is not None}}
+
+    objective_list = []
+    for species, objective, hours, limit, allowed, counted in objectives:
+        column = pollutants.index(species.lower())
+        if counted == "year":
+            present = grid[:, column][~np.isnan(grid[:, column])]
+            means = np.array([present.mean()]) if len(present) > 0 else np.empty(0)
+        else:
+            means = running[hours][:, column]
+            if counted == "day":
+                means = means[23::24]  # window ending at 24:00 of each day
+            elif counted == "day max":
+                means = _rolling_max(means, 24)[23::24]  # largest window ending during each day
+            means = means[~np.isnan(means)]
+        exceedances = int(np.count_nonzero(means > limit))
+        if len(means) == 0:  # nothing to check the objective against
+            achieved = "N/A"
+        else:
+            achieved = "YES" if exceedances <= allowed else "NO"
+        objective_list.append((species, objective, exceedances, achieved))
+    return objective_list
+
+
+@instrument.timed
+def all_station_objectives(data: dict, monitoring_stations: list = None, year: str = None,
+                           objectives: tuple = OBJECTIVES, min_fraction: float = MIN_FRACTION) -> pd.DataFrame:
+    """
+Checks the pollution objectives of every pollutant at several monitoring stations, see station_objectives. Each
+calendar year is checked on its own, as exceedances are allowed a number of times a year
+
+     Args:
+         data: dictionary containing the monitoring sites as keys with their associated dataframes as the values
+         monitoring_stations: list of names of monitoring stations, every station in data if None
+         year: str in the form YYYY of the year to check, every year a station has data for if None
+         objectives: tuples in the form of OBJECTIVES
+         min_fraction: fraction of the hours of a running mean that need data for it to be used
+
+     Returns:
+         table: dataframe with columns 'station', 'year', 'species', 'objective', 'exceedances' and 'achieved'
+
+     Raises:
+         KeyError: Invalid monitoring station entered
+         ValueError: year is not in the form YYYY
+     """
+    if monitoring_stations is None:
+        monitoring_stations = list(data.keys())
+    rows = []
+    for monitoring_station in monitoring_stations:
+        if year is not None:
+            years = [str(year)]
+        else:
+            try:
+                df = data[monitoring_station]  # gets dataframe for location
+            except KeyError:
+                raise KeyError("Monitoring station invalid")
+            years = sorted(first for first in df["date"].astype(str).str[:4].unique() if first.isdigit())
+        rows += [(monitoring_station, station_year, *result) for station_year in years
+                 for result in station_objectives(data, monitoring_station, station_year, objectives, min_fraction)]
+    return pd.DataFrame(rows, columns=["station", "year", "species", "objective", "exceedances", "achieved"])
+
+
+BATCH_REPORTS = (daily_average, daily_median, hourly_average, monthly_average, count_missing_data)
+
+
+def _report_station(monitoring_station: str, folder: str, key: dict, reports: tuple, pollutants: list) -> list[tuple]:
+    """
+Runs every report for every pollutant at one station. The station's columns are memory mapped from folder, so
+worker processes share the operating system's copy of the data instead of each being sent the dataframe
+
+     Args:
+         monitoring_station: Name of monitoring station
+         folder: folder the station was written to by storage.write_station_cache
+         key: dictionary the cache must have been written with, {} to accept any
+         reports: reporting functions taking (data, monitoring_station, pollutant)
+         pollutants: list of codes for pollutants, every column of storage.POLLUTANTS in the station if None
+
+     Returns:
+         rows: list of (station, pollutant, report name, position, value) tuples
+
+     Raises:
+         ValueError: the cache is missing or was written for a different version of the station
+     """
+    df = storage.read_station_cache(folder, key)
+    if df is None:
+        raise ValueError(f"Cache of {monitoring_station} in {folder} is missing or out of date")
+    store = storage.StationStore({monitoring_station: df})  # index built by the first report is reused
+    if pollutants is None:
+        pollutants = [pollutant for pollutant in storage.POLLUTANTS if pollutant in df.columns]
+
+    rows = []
+    for pollutant in pollutants:
+        for report in reports:
+            result = report(store, monitoring_station, pollutant)
+            if not isinstance(result, list):  # single value such as a count
+                result = [result]
+            for position, value in enumerate(result):
+                rows.append((monitoring_station, pollutant, report.__name__, position,
+                             np.nan if value == "N/A" else value))
+    return rows
+
+
+@instrument.timed
+def report_all(data: dict, reports: tuple = BATCH_REPORTS, monitoring_stations: list = None, pollutants: list = None,
+               max_workers: int = None) -> pd.DataFrame:
+    """
+Runs a set of reporting functions over every station and pollutant, one station per worker process. Workers memory
+map each station from .npy column files, so dataframes are never pickled to the workers. Stations a StationStore
+read from its cache_dir and that haven't changed since are mapped straight from that cache, the rest are written once
+to a temporary folder. Only reports called as report(data, monitoring_station, pollutant), such as BATCH_REPORTS, can
+be run, and they must be module level functions so they can be sent to the workers
+
+     Args:
+         data: dictionary containing the monitoring sites as keys with their associated dataframes as the values
+         reports: reporting functions taking (data, monitoring_station, pollutant), defaults to BATCH_REPORTS
+         monitoring_stations: list of names of monitoring stations, every station in data if None
+         pollutants: list of codes for pollutants, every pollutant in storage.POLLUTANTS if None
+         max_workers: maximum number of worker processes, the number of cpus if None
+
+     Returns:
+         table: dataframe with columns 'station', 'pollutant', 'report', 'position' and 'value' holding one row for
+         each value returned by each report, NaN where a report returned "N/A"
+
+     Raises:
+         KeyError: Invalid monitoring station or pollutant entered
+         ValueError: a report can't be called with (data, monitoring_station, pollutant)
+     """
+    for report in reports:
         try:
-            if row[pollutant] == "No data":
-                row[pollutant] = new_value
-        except KeyError:
-            raise KeyError("Invalid pollutant code")
-    return df
+            inspect.signature(report).bind(data, "", "")
+        except (TypeError, ValueError):
+            name = getattr(report, "__name__", report)
+            raise ValueError(f"Report {name} must take (data, monitoring_station, pollutant)")
+    if monitoring_stations is None:
+        monitoring_stations = list(data.keys())
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        jobs = []
+        for number, monitoring_station in enumerate(monitoring_stations):
+            try:
+                df = data[monitoring_station]  # gets dataframe for location
+            except KeyError:
+                raise KeyError("Monitoring station invalid")
+            location = None
+            if isinstance(data, storage.StationStore):
+                location = data.cache_location(monitoring_station)
+            if location is not None and storage.read_station_cache(*location) is None:  # cache rebuilt since
+                location = None
+            if location is None:
+                location = (os.path.join(temp_dir, str(number)), {})
+                storage.write_station_cache(df, *location)
+            jobs.append((monitoring_station, *location, tuple(reports), pollutants))
+
+        if len(jobs) <= 1 or max_workers <= 1:
+            results = [_report_station(*job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+                results = list(pool.map(_report_station, *zip(*jobs)))
+
+    rows = [row for station_rows in results for row in station_rows]
+    return pd.DataFrame(rows, columns=["station", "pollutant", "report", "position", "value"])
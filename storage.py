@@ -0,0 +1,785 @@
+import copy
+import hashlib
+import io
+import json
+import os
+import numpy as np
+import pandas as pd
+import instrument
+
+POLLUTANTS = ["no", "pm10", "pm25"]  # pollutant columns found in every monitoring station csv
+CHUNK_SIZE = 2 ** 12  # bytes read back from an offset to find the start of its line
+
+
+@instrument.timed
+def read_station_csv(filename: str) -> pd.DataFrame:
+    """
+Reads a monitoring station csv into a typed dataframe. Pollutant columns are parsed once into float64 with NaN
+wherever the csv says 'No data'. The 'date' and 'time' columns are kept as categorical strings, each distinct date
+and time held once, and a datetime index is built from them. Times run from 01:00:00 to 24:00:00 so 24:00:00 is
+indexed as midnight at the start of the next day
+
+     Args:
+         filename: file location of the monitoring station csv
+
+     Returns:
+         df: pandas dataframe with float64 pollutant columns and a DatetimeIndex called 'timestamp'
+
+     Raises:
+         FileNotFoundError: csv file does not exist
+     """
+    return _parse_station_csv(filename)
+
+
+def _parse_station_csv(source) -> pd.DataFrame:
+    """
+Parses station csv text into a typed dataframe, see read_station_csv
+
+     Args:
+         source: file location or binary file holding csv text that starts with a header line
+     """
+    with instrument.phase("parse"):
+        df = pd.read_csv(source, na_values=["No data"], dtype={"date": "category", "time": "category",
+                                                               **{pollutant: np.float64 for pollutant in POLLUTANTS}})
+    instrument.add(rows=len(df))
+    timestamps = pd.to_datetime(df["date"].to_numpy(), format="%Y-%m-%d") + pd.to_timedelta(df["time"].to_numpy())
+    df.index = pd.DatetimeIndex(timestamps, name="timestamp")
+    return df
+
+
+@instrument.timed
+def read_appended_rows(filename: str, offset: int) -> tuple[pd.DataFrame, int]:
+    """
+Reads only the lines added to the end of a station csv after byte offset, parsed the same way as read_station_csv.
+A last line that doesn't end in a newline is still being written so is left for the next read. If offset is partway
+through a line, reading starts at the beginning of that line
+
+     Args:
+         filename: file location of the monitoring station csv
+         offset: byte offset returned by the previous read, or the size of the csv when it was read in full
+
+     Returns:
+         df: typed dataframe of the new rows, empty if no complete lines have been added
+         offset: byte offset of the end of the last complete line read
+
+     Raises:
+         FileNotFoundError: csv file does not exist
+     """
+    with open(filename, "rb") as file:
+        header = file.readline()
+        start = max(offset, len(header))
+        if start > len(header):  # move back to the start of the line the offset is in
+            file.seek(start - min(start - len(header), CHUNK_SIZE))
+            before = file.read(start - file.tell())
+            start -= len(before) - (before.rfind(b"\n") + 1)
+        file.seek(start)
+        content = file.read()
+    end = content.rfind(b"\n") + 1  # end of the last complete line
+    instrument.add(bytes=end)
+    df = _parse_station_csv(io.BytesIO(header + content[:end]))
+    return df, start + end if end > 0 else max(offset, start)
+
+
+def _group_table(codes: np.ndarray, values: np.ndarray, n_groups: int) -> dict:
+    """
+Summarises the values in every group of a column in one pass. Sums are added up in row order, the same as
+utils.meannvalue, so means taken from the table match a full scan exactly
+
+     Args:
+         codes: 1D numpy array giving the group number of each row, -1 for rows not in any group
+         values: 1D numpy array of floats with NaN where there is no data
+         n_groups: total number of groups
+
+     Returns:
+         table: dictionary of 1D arrays with one element per group, 'sum', 'count' and 'missing' of the values and
+         'min', 'argmin', 'max', 'argmax' giving the extremes and the row of their first occurrence, NaN and -1 for
+         groups without data
+     """
+    grouped = codes >= 0
+    missing = grouped & np.isnan(values)
+    rows = np.flatnonzero(grouped & ~missing)  # rows with data
+    present_codes, present_values = codes[rows], values[rows]
+    table = {"sum": np.bincount(present_codes, weights=present_values, minlength=n_groups),
+             "count": np.bincount(present_codes, minlength=n_groups),
+             "missing": np.bincount(codes[missing], minlength=n_groups)}
+
+    has_data = table["count"] > 0
+    starts = (np.cumsum(table["count"]) - table["count"])[has_data]  # position of the first value of each group
+    for name, sign in (("min", 1), ("max", -1)):
+        order = np.lexsort((rows, sign * present_values, present_codes))  # by group, then value, then earliest row
+        extreme, position = np.full(n_groups, np.nan), np.full(n_groups, -1, dtype=np.intp)
+        extreme[has_data] = present_values[order[starts]]
+        position[has_data] = rows[order[starts]]
+        table[name], table["arg" + name] = extreme, position
+    return table
+
+
+def _fill_table(table: dict, codes: np.ndarray, rows: np.ndarray, new_values, values: np.ndarray) -> dict:
+    """
+Returns a copy of a table from _group_table updated for rows that had no data being given new values. Only groups
+containing filled rows change. Their sums are added up again in row order from the filled column, so they are exactly
+those of a table built over the filled column, and the filled rows are summarised on their own for the other columns
+
+     Args:
+         table: dictionary of arrays from _group_table
+         codes: 1D numpy array of the group number of every row of the column
+         rows: 1D numpy array of the positions of the filled rows in increasing order
+         new_values: float the rows were all filled with, or 1D numpy array of the value given to each row
+         values: 1D numpy array of floats of every row of the filled column with NaN where there is no data
+
+     Returns:
+         table: updated copy of the table
+     """
+    new_values = np.broadcast_to(np.asarray(new_values, dtype=np.float64), rows.shape)
+    in_group = codes[rows] >= 0  # filled rows that belong to a group
+    rows, new_values = rows[in_group], new_values[in_group]
+    added = _group_table(codes[rows], new_values, len(table["count"]))  # positions are into rows
+
+    table = {name: column.copy() for name, column in table.items()}
+    table["count"] += added["count"]
+    table["missing"] -= added["count"]
+
+    groups = np.flatnonzero(added["count"])
+    affected = np.zeros(len(table["count"]), dtype=bool)
+    affected[groups] = True
+    in_affected = (codes >= 0) & ~np.isnan(values)
+    in_affected[in_affected] = affected[codes[in_affected]]  # rows with data in a group containing filled rows
+    sums = np.bincount(codes[in_affected], weights=values[in_affected], minlength=len(affected))
+    table["sum"][groups] = sums[groups]
+    for name, better in (("min", np.less), ("max", np.greater)):
+        new_value, new_row = added[name][groups], rows[added["arg" + name][groups]]
+        current, position = table[name][groups], table["arg" + name][groups]
+        replace = (position == -1) | better(new_value, current)  # group had no data or new value is more extreme
+        tie = (position != -1) & (current == new_value)  # keep whichever row came first
+        table[name][groups] = np.where(replace, new_value, current)
+        table["arg" + name][groups] = np.where(replace, new_row, np.where(tie, np.minimum(position, new_row), position))
+    return table
+
+
+def _append_table(table: dict, codes: np.ndarray, start: int, values: np.ndarray, n_groups: int) -> dict:
+    """
+Returns a copy of a table from _group_table extended for rows added after the last row of the column. Groups first
+seen in the new rows are added without data, then the new values are added on to the sums one at a time in row order,
+so sums are exactly those of a table built over every row. Extremes of the new rows only replace strictly more
+extreme values, as earlier rows win ties
+
+     Args:
+         table: dictionary of arrays from _group_table
+         codes: 1D numpy array of the group number of each new row, -1 for rows not in any group
+         start: position of the first new row in the column
+         values: 1D numpy array of floats of each new row with NaN where there is no data
+         n_groups: total number of groups including new ones
+
+     Returns:
+         table: updated copy of the table
+     """
+    empty = {"sum": 0.0, "count": 0, "missing": 0, "min": np.nan, "max": np.nan, "argmin": -1, "argmax": -1}
+    new_groups = n_groups - len(table["count"])
+    table = {name: np.concatenate([column, np.full(new_groups, empty[name], dtype=column.dtype)])
+             for name, column in table.items()}
+    added = _group_table(codes, values, n_groups)  # positions are into the new rows
+    present = (codes >= 0) & ~np.isnan(values)
+    np.add.at(table["sum"], codes[present], values[present])  # unbuffered so each value is added in row order
+    table["count"] += added["count"]
+    table["missing"] += added["missing"]
+
+    groups = np.flatnonzero(added["count"])
+    for name, better in (("min", np.less), ("max", np.greater)):
+        new_value, new_row = added[name][groups], start + added["arg" + name][groups]
+        current, position = table[name][groups], table["arg" + name][groups]
+        replace = (position == -1) | better(new_value, current)  # group had no data or new value is more extreme
+        table[name][groups] = np.where(replace, new_value, current)
+        table["arg" + name][groups] = np.where(replace, new_row, position)
+    return table
+
+
+def _column_views(df: pd.DataFrame, columns) -> dict:
+    """
+Returns a view of each column of df. While a view is held, pandas copy on write copies a column's data before
+changing it in place, so _columns_unchanged can tell the column has changed
+    """
+    return {column: df[column] for column in columns}
+
+
+def _columns_unchanged(df: pd.DataFrame, views: dict) -> bool:
+    """
+Checks that every column viewed by _column_views is still in df and has not been changed in place or replaced. Only
+where the columns' data is held is compared, so the check costs the same however long df is
+    """
+    for column, view in views.items():
+        if column not in df.columns or not np.may_share_memory(_column_data(df[column]), _column_data(view)):
+            return False
+    return True
+
+
+def _column_data(column: pd.Series) -> np.ndarray:
+    """
+Returns the numpy array holding a column's data without copying it, the codes of a categorical column
+    """
+    array = column.array
+    return array.codes if isinstance(array, pd.Categorical) else np.asarray(array)
+
+
+class StationAggregates:
+    """
+Index of per-day, per-hour-of-day and per-month summaries of every pollutant at a station, built in one pass over
+the dataframe. Reporting queries read their answer straight from the tables instead of scanning every row. The index
+describes the dataframe it was built from, frame, and is not updated by changes made to that dataframe directly, which
+describes detects. Only the pollutants given are summarised, every column of POLLUTANTS in the dataframe by default
+    """
+
+    GROUPINGS = ("day", "hour", "month")
+    HOURS = pd.Index([f"{hour:0>2}:00:00" for hour in range(1, 25)])  # times of the hour groups
+
+    @instrument.timed
+    def __init__(self, df: pd.DataFrame, pollutants: list = None):
+        self.frame = df
+        instrument.add(rows=len(df))
+        day_codes, self.dates = pd.factorize(df["date"], sort=False)  # number each distinct date
+        self.dates = pd.Index(self.dates.to_numpy())  # plain strings whether or not the column is categorical
+        self.day_order = self.dates.get_indexer(df["date"].iloc[0::24])  # days in the order reporting lists them
+        self.times = df["time"].to_numpy()
+        self.months = pd.to_datetime(self.dates, format="%Y-%m-%d").month.to_numpy() - 1  # month of each distinct date
+        self.codes = {"day": day_codes, "hour": self.HOURS.get_indexer(df["time"]), "month": self.months[day_codes]}
+        self.sizes = {"day": len(self.dates), "hour": 24, "month": 12}
+
+        # date partition: days sorted by date for binary search, and rows grouped by day with offsets to each day
+        date_strings = self.dates.to_numpy().astype(str)
+        self.days_by_date = np.argsort(date_strings, kind="stable")
+        self.sorted_dates = date_strings[self.days_by_date]
+        self.row_order = np.argsort(day_codes, kind="stable")  # rows of each day stay in row order
+        self.day_offsets = np.concatenate([[0], np.cumsum(np.bincount(day_codes, minlength=len(self.dates)))])
+
+        if pollutants is None:
+            pollutants = [pollutant for pollutant in POLLUTANTS if pollutant in df.columns]
+        self.tables = {}  # pollutant: grouping: table from _group_table
+        for pollutant in pollutants:
+            values = pd.to_numeric(df[pollutant], errors="coerce").to_numpy(dtype=np.float64)
+            self.tables[pollutant] = {grouping: _group_table(self.codes[grouping], values, self.sizes[grouping])
+                                      for grouping in self.GROUPINGS}
+        self._watch(df)
+
+    def _watch(self, df: pd.DataFrame):
+        """
+Sets frame to df and keeps a view of every column the index was built from so describes can tell when one changes
+        """
+        self.frame = df
+        self._views = _column_views(df, ["date", "time", *self.tables])
+
+    def describes(self, df: pd.DataFrame) -> bool:
+        """
+Checks whether the index describes df, meaning df is frame and none of the columns the index was built from has been
+changed in place or replaced since
+
+     Args:
+         df: dataframe to check
+
+     Returns:
+         current: True if the index can answer queries about df
+        """
+        return df is self.frame and len(df) == len(self.times) and _columns_unchanged(df, self._views)
+
+    def mean(self, pollutant: str, grouping: str) -> np.ndarray:
+        """
+Returns the mean of a pollutant for every group, NaN for groups without data
+
+     Args:
+         pollutant: code for pollutant
+         grouping: 'day', 'hour' or 'month'
+
+     Returns:
+         means: 1D numpy array of the mean of each group
+        """
+        table = self.tables[pollutant][grouping]
+        with np.errstate(invalid="ignore", divide="ignore"):  # empty groups give 0/0 which is NaN
+            return table["sum"] / table["count"]
+
+    def day(self, date: str) -> int:
+        """
+Finds the group number of a date in the day tables with a binary search of the sorted dates
+
+     Args:
+         date: str in the form YYYY-MM-DD
+
+     Returns:
+         day: group number of the date, -1 if the station has no rows for that date
+        """
+        position = int(np.searchsorted(self.sorted_dates, date)) if isinstance(date, str) else len(self.sorted_dates)
+        if position < len(self.sorted_dates) and self.sorted_dates[position] == date:
+            return int(self.days_by_date[position])
+        return -1
+
+    def days_between(self, start_date: str = None, end_date: str = None) -> np.ndarray:
+        """
+Returns the group numbers of every day from start_date to end_date inclusive, in date order
+
+     Args:
+         start_date: str in the form YYYY-MM-DD, None to start from the first date
+         end_date: str in the form YYYY-MM-DD, None to finish at the last date
+
+     Returns:
+         days: 1D numpy array of day group numbers
+        """
+        first = 0 if start_date is None else np.searchsorted(self.sorted_dates, start_date, side="left")
+        last = len(self.sorted_dates) if end_date is None else np.searchsorted(self.sorted_dates, end_date, "right")
+        return self.days_by_date[first:last]
+
+    def rows(self, day: int) -> np.ndarray:
+        """
+Returns the positions of the rows of a day in the dataframe, in row order
+        """
+        return self.row_order[self.day_offsets[day]:self.day_offsets[day + 1]]
+
+    def filled(self, df: pd.DataFrame, pollutant: str, rows: np.ndarray, new_values) -> "StationAggregates":
+        """
+Returns an index for df, which is frame or a copy of it where the given rows of a pollutant that had no data have
+been filled with new values. Only the tables of that pollutant are changed and only the groups containing filled rows
+are updated, the rest of the index is shared with this one. Sums of those groups are added up again in row order so
+the index matches one rebuilt from df exactly
+
+     Args:
+         df: filled frame or filled copy of frame
+         pollutant: code for the filled pollutant
+         rows: 1D numpy array of the positions of the filled rows in increasing order
+         new_values: float the rows were all filled with, or 1D numpy array of the value given to each row
+
+     Returns:
+         index: StationAggregates describing df
+        """
+        index = copy.copy(self)
+        values = pd.to_numeric(df[pollutant], errors="coerce").to_numpy(dtype=np.float64)
+        index.tables = {**self.tables, pollutant: {grouping: _fill_table(table, self.codes[grouping], rows, new_values,
+                                                                         values)
+                                                   for grouping, table in self.tables[pollutant].items()}}
+        index._watch(df)
+        return index
+
+    @instrument.timed
+    def appended(self, df: pd.DataFrame, start: int) -> "StationAggregates":
+        """
+Returns an index for df, which is frame with new rows added to the end from row start onwards, such as the next hours
+of a growing csv. Only the new rows are parsed and grouped, then merged into the tables and date partition, so that
+work grows with the number of new rows rather than the length of df. The per row arrays (codes, times and row order)
+are still copied whole into longer arrays, a plain memory copy that does grow with df. Sums carry on in row order so
+the index matches one rebuilt from df exactly
+
+     Args:
+         df: dataframe whose first start rows are the rows of frame
+         start: number of rows in frame
+
+     Returns:
+         index: StationAggregates describing df
+        """
+        index = copy.copy(self)
+        new = df.iloc[start:]
+        instrument.add(rows=len(new))
+        day_codes = self.dates.get_indexer(new["date"])
+        unseen = pd.Index(pd.unique(new["date"].to_numpy()[day_codes == -1]))  # new dates in order of first row
+        if len(unseen) > 0:
+            index.dates = self.dates.append(unseen)
+            index.months = np.concatenate([self.months, pd.to_datetime(unseen, format="%Y-%m-%d").month.to_numpy() - 1])
+            day_codes = index.dates.get_indexer(new["date"])
+        positions = np.arange(start, len(df))
+        index.day_order = np.concatenate([self.day_order, day_codes[positions % 24 == 0]])
+        index.times = np.concatenate([self.times, new["time"].to_numpy()])
+        new_codes = {"day": day_codes, "hour": self.HOURS.get_indexer(new["time"]), "month": index.months[day_codes]}
+        index.codes = {grouping: np.concatenate([self.codes[grouping], new_codes[grouping]])
+                       for grouping in self.GROUPINGS}
+        index.sizes = {**self.sizes, "day": len(index.dates)}
+
+        # new rows go to the end of their day's rows, new days after every existing day
+        date_strings = index.dates.to_numpy().astype(str)
+        index.days_by_date = np.argsort(date_strings, kind="stable")
+        index.sorted_dates = date_strings[index.days_by_date]
+        counts = np.bincount(self.codes["day"], minlength=len(index.dates))
+        order = np.argsort(day_codes, kind="stable")
+        index.row_order = np.insert(self.row_order, np.cumsum(counts)[day_codes[order]], positions[order])
+        counts += np.bincount(day_codes, minlength=len(index.dates))
+        index.day_offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        index.tables = {}
+        for pollutant, tables in self.tables.items():
+            values = pd.to_numeric(new[pollutant], errors="coerce").to_numpy(dtype=np.float64)
+            index.tables[pollutant] = {grouping: _append_table(table, new_codes[grouping], start, values,
+                                                               index.sizes[grouping])
+                                       for grouping, table in tables.items()}
+        index._watch(df)
+        return index
+
+
+def _source_key(filename: str) -> dict:
+    """
+Identifies the current version of a csv by its path, modification time and size
+
+     Args:
+         filename: file location of the monitoring station csv
+
+     Returns:
+         key: dictionary of the absolute path, mtime in nanoseconds and size in bytes of the file
+
+     Raises:
+         FileNotFoundError: csv file does not exist
+     """
+    stat = os.stat(filename)
+    return {"source": os.path.abspath(filename), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def _file_version(filename: str, offset: int) -> tuple:
+    """
+Identifies a csv by the file it is stored in and the bytes read from it up to offset, so a csv that has been replaced
+or rewritten is told apart from one that has only had rows appended, whatever its new size
+
+     Args:
+         filename: file location of the monitoring station csv
+         offset: byte offset of the end of the last csv line read
+
+     Returns:
+         version: tuple of the device and inode of the file and a hash of its header and the CHUNK_SIZE bytes before
+         offset
+
+     Raises:
+         FileNotFoundError: csv file does not exist
+     """
+    with open(filename, "rb") as file:
+        stat = os.fstat(file.fileno())
+        header = file.readline()
+        file.seek(max(0, offset - CHUNK_SIZE))
+        read = file.read(offset - max(0, offset - CHUNK_SIZE))  # short if the file is now smaller than offset
+    return stat.st_dev, stat.st_ino, hashlib.sha1(header + read).hexdigest()
+
+
+def _cache_folder(cache_dir: str, filename: str) -> str:
+    """
+Returns the folder inside cache_dir that holds the cached columns of a csv. Each source path gets its own folder
+    """
+    name = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, name)
+
+
+@instrument.timed
+def write_station_cache(df: pd.DataFrame, folder: str, key: dict):
+    """
+Saves every column and the index of a typed station dataframe as .npy files in folder. Dates and times are saved as
+categorical codes, with the few distinct values kept in meta.json, so they can be memory mapped like the float columns.
+meta.json is written last so a cache that was only partly written is never read
+
+     Args:
+         df: typed dataframe from read_station_csv
+         folder: folder to write the cache to
+         key: dictionary from _source_key describing the csv the dataframe was read from
+     """
+    os.makedirs(folder, exist_ok=True)
+    meta_file = os.path.join(folder, "meta.json")
+    if os.path.exists(meta_file):  # invalidate the old cache before overwriting its columns
+        os.remove(meta_file)
+
+    categories = {}  # column: distinct values the codes of a non float column refer to
+    for index, column in enumerate(df.columns):
+        values = df[column].array
+        if not pd.api.types.is_float_dtype(values.dtype):  # dates and times, one code per row
+            values = pd.Categorical(values)
+            categories[column] = values.categories.astype(str).tolist()
+            values = values.codes  # smallest integer type for the number of categories, as from_codes gives
+        np.save(os.path.join(folder, f"column{index}.npy"), np.asarray(values))
+    np.save(os.path.join(folder, "timestamp.npy"), df.index.to_numpy())
+
+    with open(meta_file, "w") as meta:
+        json.dump({**key, "columns": list(df.columns), "categories": categories}, meta)
+
+
+@instrument.timed
+def read_station_cache(folder: str, key: dict) -> pd.DataFrame or None:
+    """
+Loads a station dataframe written by write_station_cache. Every column and the index are memory mapped copy-on-write,
+so they are only read from disk when used and changes are never written back to the cache. Dates and times are
+categorical columns over the memory mapped codes, so loading costs the same however many rows the station has
+
+     Args:
+         folder: folder the cache was written to
+         key: dictionary from _source_key describing the current version of the csv
+
+     Returns:
+         df: typed dataframe, or None if there is no cache or it was built from a different version of the csv
+     """
+    try:
+        with open(os.path.join(folder, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+        if any(meta.get(field) != value for field, value in key.items()):  # csv has changed since cache was built
+            return None
+        columns = {column: np.load(os.path.join(folder, f"column{index}.npy"), mmap_mode="c")
+                   for index, column in enumerate(meta["columns"])}
+        for column, categories in meta.get("categories", {}).items():
+            dtype = pd.CategoricalDtype(pd.Index(categories, dtype="str"))
+            columns[column] = pd.Categorical.from_codes(columns[column], dtype=dtype, validate=False)  # not copied
+        timestamps = np.load(os.path.join(folder, "timestamp.npy"), mmap_mode="c")
+    except (OSError, ValueError, KeyError):  # missing or corrupt cache is rebuilt
+        return None
+    return pd.DataFrame(columns, index=pd.DatetimeIndex(timestamps, name="timestamp"), copy=False)
+
+
+@instrument.timed
+def load_station(filename: str, cache_dir: str = None) -> pd.DataFrame:
+    """
+Returns the typed dataframe for a monitoring station csv. If cache_dir is given the parsed columns are cached
+there in .npy files and reused while the csv is unchanged. The cache is rebuilt whenever the csv's path, mtime or
+size no longer match
+
+     Args:
+         filename: file location of the monitoring station csv
+         cache_dir: folder to keep cached stations in, None to always read the csv
+
+     Returns:
+         df: typed dataframe for the station
+
+     Raises:
+         FileNotFoundError: csv file does not exist
+     """
+    if cache_dir is None:
+        return read_station_csv(filename)
+
+    key = _source_key(filename)
+    folder = _cache_folder(cache_dir, filename)
+    df = read_station_cache(folder, key)
+    if df is None:  # cold start or csv has changed
+        df = read_station_csv(filename)
+        write_station_cache(df, folder, key)
+    return df
+
+
+class StationStore(dict):
+    """
+Dictionary with monitoring station names as keys and typed dataframes from read_station_csv as values.
+Can be passed to any reporting function in place of a dictionary of dataframes. A StationAggregates index is built
+for a station the first time a reporting function queries it, then used to answer queries without scanning the data
+until the station's dataframe is replaced or changed in place
+    """
+
+    def __init__(self, stations: dict = None, cache_dir: str = None):
+        super().__init__()
+        self.sources = {}  # station name: file location the station was loaded from
+        self.offsets = {}  # station name: byte offset of the end of the last csv line read
+        self.versions = {}  # station name: _file_version of the csv at its offset
+        self.last_timestamps = {}  # station name: latest timestamp read from the csv, None if it had no rows
+        self.cache_dir = cache_dir  # folder of cached parsed csvs, None if not caching
+        self.aggregates = {}  # station name: StationAggregates built for the station's dataframe
+        self._prepared = {}  # station name: index built ahead of its dataframe being stored
+        self._caches = {}  # station name: (folder, key, index, column views) of the cache its dataframe was read from
+        for station, df in (stations or {}).items():
+            self[station] = df
+
+    def __setitem__(self, station: str, df: pd.DataFrame):
+        super().__setitem__(station, df)
+        self._caches.pop(station, None)
+        index = self._prepared.pop(station, None)
+        if index is not None and index.describes(df):
+            self.aggregates[station] = index
+        else:  # built by index when first needed
+            self.aggregates.pop(station, None)
+
+    def update(self, stations: dict = (), **kwargs):
+        for station, df in dict(stations, **kwargs).items():  # stored one at a time so each gets an index
+            self[station] = df
+
+    def __ior__(self, stations: dict):
+        self.update(stations)
+        return self
+
+    def setdefault(self, station: str, df: pd.DataFrame = None) -> pd.DataFrame:
+        if station not in self:
+            self[station] = df
+        return self[station]
+
+    def _forget(self, station: str):
+        """
+Drops the indexes held for a station that is no longer in the store
+        """
+        self.aggregates.pop(station, None)
+        self._prepared.pop(station, None)
+        self._caches.pop(station, None)
+
+    def __delitem__(self, station: str):
+        super().__delitem__(station)
+        self._forget(station)
+
+    def pop(self, station: str, *default) -> pd.DataFrame:
+        self._forget(station)
+        return super().pop(station, *default)
+
+    def popitem(self) -> tuple:
+        station, df = super().popitem()
+        self._forget(station)
+        return station, df
+
+    def clear(self):
+        super().clear()
+        self.aggregates.clear()
+        self._prepared.clear()
+        self._caches.clear()
+
+    def copy(self) -> "StationStore":
+        """
+Returns a shallow copy of the store holding the same dataframes, with its own record of where each station was
+loaded from. Built indexes are shared as they are never changed once built
+        """
+        store = type(self)(cache_dir=self.cache_dir)
+        super(StationStore, store).update(self)  # indexes copied below rather than rebuilt
+        store.sources, store.offsets, store.versions = dict(self.sources), dict(self.offsets), dict(self.versions)
+        store.last_timestamps, store.aggregates = dict(self.last_timestamps), dict(self.aggregates)
+        store._prepared, store._caches = dict(self._prepared), dict(self._caches)
+        return store
+
+    __copy__ = copy
+
+    def index(self, station: str) -> StationAggregates or None:
+        """
+Returns the aggregate index of a station's current dataframe, building it the first time it is needed and again
+whenever the dataframe has been changed in place since it was built
+
+     Args:
+         station: Name of monitoring station
+
+     Returns:
+         index: StationAggregates describing the station's dataframe, None if it isn't a station dataframe
+
+     Raises:
+         KeyError: station is not in the store
+        """
+        df = self[station]
+        index = self.aggregates.get(station)
+        if index is None or not index.describes(df):
+            try:
+                index = StationAggregates(df)
+            except KeyError:  # not a station dataframe so reporting scans it instead
+                self.aggregates.pop(station, None)
+                return None
+            self.aggregates[station] = index
+        return index
+
+    def cache_location(self, station: str) -> tuple[str, dict] or None:
+        """
+Returns where a station's dataframe is cached while the dataframe is still exactly what was read from the cache, so
+other processes can memory map the same columns with read_station_cache instead of being sent the dataframe
+
+     Args:
+         station: Name of monitoring station
+
+     Returns:
+         location: (folder, key) to pass to read_station_cache, None if the station wasn't loaded with a cache_dir or
+         its dataframe has been replaced or changed since
+        """
+        folder, key, index, views = self._caches.get(station, (None, None, None, None))
+        df = self[station]
+        if folder is None or df.index is not index or not _columns_unchanged(df, views):
+            return None
+        return folder, key
+
+    def prepare(self, station: str, index: StationAggregates):
+        """
+Keeps an index that has been updated for a new dataframe, such as the copy returned by
+reporting.fill_missing_data, so storing that dataframe under station reuses the index instead of rebuilding it.
+Only the latest prepared index of a station is kept, and it is dropped once anything is stored under the station
+
+     Args:
+         station: Name of monitoring station
+         index: StationAggregates whose frame is the dataframe that will be stored
+        """
+        self._prepared[station] = index
+
+    @classmethod
+    def load(cls, stations: list, directory: str = "./data", cache_dir: str = None):
+        """
+Creates a store containing every station in stations. Station csv files are found at
+'{directory}/Pollution-London {station}.csv'
+
+     Args:
+         stations: list of monitoring station names
+         directory: folder containing the station csv files
+         cache_dir: folder to cache parsed stations in, None to always read the csv files
+
+     Returns:
+         store: StationStore with a typed dataframe for every station
+        """
+        store = cls(cache_dir=cache_dir)
+        for station in stations:
+            store.load_station(station, f"{directory}/Pollution-London {station}.csv")
+        return store
+
+    def load_station(self, station: str, filename: str) -> pd.DataFrame:
+        """
+Reads a station csv, or its cache if the store has a cache_dir, and adds it to the store replacing any data
+already held for that station
+
+     Args:
+         station: Name of monitoring station
+         filename: file location of the monitoring station csv
+
+     Returns:
+         df: typed dataframe for the station
+        """
+        size = os.path.getsize(filename)  # rows added while loading are read again by refresh then skipped
+        version = _file_version(filename, size)
+        key = _source_key(filename) if self.cache_dir is not None else None  # version the cache will hold
+        df = load_station(filename, self.cache_dir)
+        self[station] = df
+        if key is not None:
+            self._caches[station] = (_cache_folder(self.cache_dir, filename), key, df.index,
+                                     _column_views(df, df.columns))
+        self.sources[station] = filename
+        self.offsets[station] = size
+        self.versions[station] = version
+        self.last_timestamps[station] = df.index.max() if len(df) > 0 else None
+        return df
+
+    @instrument.timed
+    def refresh(self, stations: list = None) -> dict:
+        """
+Reads only the rows appended to each station's csv since it was loaded or last refreshed and adds them to the end of
+the station's dataframe. The station's aggregate index is extended with the new rows instead of being rebuilt, so the
+parsing and grouping of an hourly refresh cost about the same however long the csv has grown. The dataframe and the
+index's per row arrays are still copied whole to add the rows, so memory use and copying do grow with the csv. New
+rows timed at or before the latest timestamp already read are skipped. A csv that has been replaced by another file,
+or whose header or last lines read have changed, is loaded again in full
+
+     Args:
+         stations: list of names of stations loaded from csv files, every station in sources if None
+
+     Returns:
+         added: dictionary of station name: number of rows added, every row if the station was loaded again
+
+     Raises:
+         KeyError: station was not loaded from a csv file
+         FileNotFoundError: csv file no longer exists
+        """
+        if stations is None:
+            stations = list(self.sources)
+        added = {}
+        for station in stations:
+            try:
+                filename = self.sources[station]
+            except KeyError:
+                raise KeyError("Monitoring station invalid")
+            if _file_version(filename, self.offsets[station]) != self.versions.get(station):  # csv has been replaced
+                added[station] = len(self.load_station(station, filename))
+                continue
+
+            new, self.offsets[station] = read_appended_rows(filename, self.offsets[station])
+            self.versions[station] = _file_version(filename, self.offsets[station])
+            last = self.last_timestamps[station]
+            if last is not None:
+                new = new[new.index > last]
+            new = new[~new.index.duplicated()]
+            added[station] = len(new)
+            if len(new) == 0:
+                continue
+            df = self[station]
+            result = pd.concat([df, new])
+            for column in ("date", "time"):  # kept categorical like a station loaded in full
+                if isinstance(df[column].dtype, pd.CategoricalDtype) and isinstance(new[column].dtype,
+                                                                                  pd.CategoricalDtype):
+                    result[column] = pd.api.types.union_categoricals([df[column].array, new[column].array])
+            index = self.aggregates.get(station)
+            if index is not None and index.describes(df):  # otherwise built when next needed
+                self.prepare(station, index.appended(result, len(df)))
+            self[station] = result
+            self.last_timestamps[station] = new.index.max()
+        return added
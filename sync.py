@@ -0,0 +1,196 @@
+import datetime
+import os
+import numpy as np
+import pandas as pd
+import api
+import instrument
+import storage
+
+SITES = {"Harlington": "LH0", "Marylebone Road": "MY1", "N Kensington": "KC1"}  # station name: London Air site code
+SPECIES = {"PM10": "pm10", "PM25": "pm25"}  # London Air species code: station csv column
+DAYS_PER_REQUEST = 31  # days of data asked for in each request
+MEASUREMENT_OFFSET = np.timedelta64(1, "h")  # API times mark the start of each hour, station csv times its end
+MAX_LAG = pd.Timedelta(hours=24)  # species further behind the latest measurement than this are taken to have stopped
+
+
+def _last_timestamp(filename: str) -> pd.Timestamp or None:
+    """
+Returns the end of the last hour in a station csv by reading only the end of the file
+
+     Args:
+         filename: file location of the monitoring station csv
+
+     Returns:
+         timestamp: time the last row's hour ended, None if the csv doesn't exist or has no rows
+     """
+    try:
+        with open(filename, "rb") as file:
+            file.seek(max(0, os.path.getsize(filename) - storage.CHUNK_SIZE))
+            lines = file.read().decode().split("\n")
+    except FileNotFoundError:
+        return None
+    lines = [line for line in lines if line.strip()]
+    if len(lines) == 0 or lines[-1].startswith("date,"):  # only a header
+        return None
+    date, time = lines[-1].split(",")[:2]
+    return pd.Timestamp(date) + pd.Timedelta(time)
+
+
+def _request_ranges(start_date: datetime.date, end_date: datetime.date, days_per_request: int) -> list[tuple]:
+    """
+Splits the dates from start_date to end_date into ranges of at most days_per_request days
+    """
+    ranges = []
+    while start_date < end_date:
+        ranges.append((start_date, min(start_date + datetime.timedelta(days=days_per_request), end_date)))
+        start_date = ranges[-1][1]
+    return ranges
+
+
+def _hourly_rows(responses: dict, after: pd.Timestamp or None) -> pd.DataFrame:
+    """
+Combines the measurements of every species at a site into one row per hour. Measurements repeated by overlapping
+requests are kept once, preferring a value over an empty one, and only hours ending after 'after' are kept. Rows stop
+at the last measured hour of the species furthest behind, as the API lists hours before they have been measured and
+a species that reports late would otherwise be written as missing and never filled in. Species with no values at
+all, or more than MAX_LAG behind the latest measurement, aren't waited for
+
+     Args:
+         responses: dictionary of csv column: list of (dates, values) arrays from api.read_raw_values
+         after: end of the last hour already stored, None if nothing is stored
+
+     Returns:
+         rows: dataframe indexed by the end of every hour from the first new hour to the last hour every species has
+         been measured up to, with a float column for each species, NaN where there is no value
+     """
+    columns = {}
+    for column, parts in responses.items():
+        dates = np.concatenate([dates for dates, _ in parts]) if parts else np.empty(0, dtype="datetime64[s]")
+        values = np.concatenate([values for _, values in parts]) if parts else np.empty(0)
+        series = pd.Series(values, index=pd.DatetimeIndex(dates + MEASUREMENT_OFFSET))
+        columns[column] = series.groupby(level=0).first()  # one value per hour, NaN only if every copy is empty
+    rows = pd.DataFrame(columns)
+    # requests start on the day of the last stored hour, so a species' last value is found even if it is stored
+    last_measured = [series.last_valid_index() for series in columns.values()]
+    last_measured = [hour for hour in last_measured if hour is not None]
+    if len(last_measured) == 0:
+        return rows.iloc[:0]
+    last = min(hour for hour in last_measured if hour >= max(last_measured) - MAX_LAG)
+    if after is not None:
+        rows = rows[rows.index > after]
+    if len(rows) == 0 or (after is not None and last <= after):
+        return rows.iloc[:0]
+    # every hour of every day is written so the csv keeps 24 rows a day
+    hour = pd.Timedelta(hours=1)
+    first = after + hour if after is not None else (rows.index[0] - hour).floor("D") + hour
+    return rows.reindex(pd.date_range(first, last, freq="h"))
+
+
+def _write_rows(filename: str, rows: pd.DataFrame):
+    """
+Appends hourly rows to a station csv in its own format, creating the csv with a header if it doesn't exist.
+Columns the csv has that weren't synced are written as 'No data'
+    """
+    if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+        with open(filename, "w") as file:
+            file.write(",".join(["date", "time"] + storage.POLLUTANTS
+                                + [column for column in rows.columns if column not in storage.POLLUTANTS]) + "\n")
+    with open(filename, "rb") as file:
+        header = file.readline().decode().strip().split(",")
+        file.seek(-1, os.SEEK_END)
+        ends_in_newline = file.read(1) == b"\n"
+
+    starts = rows.index - pd.Timedelta(hours=1)
+    dates = starts.strftime("%Y-%m-%d")
+    times = [f"{hour:0>2}:00:00" for hour in (starts.hour + 1)]  # 01:00:00 to 24:00:00
+    fields = [dates, times]
+    for column in header[2:]:
+        values = rows[column].to_numpy() if column in rows.columns else np.full(len(rows), np.nan)
+        fields.append(["No data" if np.isnan(value) else repr(value) for value in values.tolist()])
+    lines = [",".join(line) for line in zip(*fields)]
+    with open(filename, "a") as file:
+        if not ends_in_newline:  # the station csvs don't end with a newline
+            file.write("\n")
+        file.write("\n".join(lines) + "\n")
+
+
+@instrument.timed
+def sync(store: storage.StationStore, stations: list = None, start_date: str = None, end_date: str = None,
+         directory: str = "./data", sites: dict = None, species: dict = None,
+         days_per_request: int = DAYS_PER_REQUEST, max_workers: int = None) -> dict:
+    """
+Downloads the London Air API measurements a station is missing and adds them to its csv and to the store, so every
+reporting function works on fresh data. Each station carries on from the last hour in its csv, so history is only
+ever downloaded once. Every species and date range of every station is requested at the same time, with at most
+max_workers requests in progress, and each response is streamed into arrays by api.read_raw_values. The new hours are
+appended to the csv then added to the store with StationStore.refresh, which updates the aggregate index in place.
+Every response is read before any csv is written, so a failed request leaves every csv as it was
+
+     Args:
+         store: StationStore to add the data to, stations it doesn't hold yet are loaded from their csv
+         stations: list of names of stations in sites to sync, every station in sites if None
+         start_date: first date to download, as YYYY-MM-DD, for stations whose csv has no data yet
+         end_date: date to download up to, as YYYY-MM-DD, tomorrow if None so the latest hours are included
+         directory: folder containing the station csv files, found at '{directory}/Pollution-London {station}.csv'
+         sites: dictionary of station name: London Air site code, SITES if None
+         species: dictionary of London Air species code: station csv column, SPECIES if None
+         days_per_request: maximum number of days of data in each request
+         max_workers: maximum number of requests made at the same time, api.MAX_WORKERS if None
+
+     Returns:
+         added: dictionary of station name: number of hours added to the store
+
+     Raises:
+         KeyError: Invalid monitoring station entered
+         ValueError: a station has no data yet and start_date wasn't given
+         requests.RequestException: a request could not be made
+         ValueError: a response was not RawAQData, e.g. an error page
+     """
+    sites = SITES if sites is None else sites
+    species = SPECIES if species is None else species
+    if stations is None:
+        stations = list(sites)
+    end = datetime.date.fromisoformat(end_date) if end_date else datetime.date.today() + datetime.timedelta(days=1)
+
+    jobs = []  # (station, csv column, url) for every request
+    last = {}
+    for station in stations:
+        try:
+            site_code = sites[station]
+        except KeyError:
+            raise KeyError("Monitoring station invalid")
+        last[station] = _last_timestamp(f"{directory}/Pollution-London {station}.csv")
+        if last[station] is not None:  # carry on from the day of the first missing hour
+            start = last[station].date()
+            start = max(start, datetime.date.fromisoformat(start_date)) if start_date else start
+        elif start_date:
+            start = datetime.date.fromisoformat(start_date)
+        else:
+            raise ValueError(f"start_date is needed as {station} has no data yet")
+        for first, stop in _request_ranges(start, end, days_per_request):
+            for species_code, column in species.items():
+                url = (f"{api.API_URL}/Data/SiteSpecies/SiteCode={site_code}/SpeciesCode={species_code}"
+                       f"/StartDate={first}/EndDate={stop}/Json")
+                jobs.append((station, column, url))
+
+    hours = days_per_request * 24  # most measurements are hourly
+    results = api.stream_all([url for _, _, url in jobs], lambda chunks: api.read_raw_values(chunks, hours),
+                             max_workers)
+
+    responses = {station: {column: [] for column in species.values()} for station in stations}
+    for (station, column, _), result in zip(jobs, results):
+        responses[station][column].append(result)
+
+    added = {}
+    for station in stations:
+        filename = f"{directory}/Pollution-London {station}.csv"
+        rows = _hourly_rows(responses[station], last[station])
+        if len(rows) > 0:
+            _write_rows(filename, rows)
+        if station in store.sources and os.path.abspath(store.sources[station]) == os.path.abspath(filename):
+            added[station] = store.refresh([station])[station]
+        elif os.path.exists(filename):
+            added[station] = len(store.load_station(station, filename))
+        else:  # nothing has been measured yet
+            added[station] = 0
+    return added
@@ -1,8 +1,52 @@
-def sumvalues(values: list) -> int or float:
+import instrument
+import numpy as np
+
+
+def _as_array(values, message: str = None) -> np.ndarray or None:
     """
-Takes in a list and sums the elements of the list
+Returns values as a flat numpy array if it is a numpy array, pandas series or other object exposing an array or
+buffer, so it can be handled by vectorized kernels. Lists, tuples, strings and bytes return None and are handled
+element by element instead
+
+     Args:
+         values: sequence passed to one of the utils functions
+         message: TypeError message if the array is not integers or floats, None to allow any dtype
+
+     Returns:
+         arr: 1D numpy array view of values, or None if values is not an array
+
+     Raises:
+         TypeError: message is given and the array is not integers or floats
+     """
+    if isinstance(values, (list, tuple, str, bytes, bytearray)):
+        return None
+    if not isinstance(values, np.ndarray):
+        if not hasattr(values, "__array__"):
+            try:
+                memoryview(values)  # array.array, mmap and other buffers
+            except TypeError:
+                return None
+        values = np.asarray(values)
+    if values.ndim == 0:  # single number rather than a sequence
+        return None
+    if message is not None and values.dtype.kind not in "iuf":  # booleans and objects are not numbers
+        raise TypeError(message)
+    return values.ravel()
+
+
+def _is_nan(value) -> bool:
+    return type(value) is float and value != value  # NaN is the only float not equal to itself
+
+
+@instrument.timed
+def sumvalues(values: list, skip_nan: bool = False) -> int or float:
+    """
+Takes in a list and sums the elements of the list. Numpy arrays and other array-likes are summed in one vectorized
+call
+
     Args:
-        values: list of integers of floats
+        values: list or array of integers of floats
+        skip_nan: if True NaN values are left out of the sum instead of making it NaN
 
     Returns:
         total: integer or float that is the sum of the list elements
@@ -10,91 +54,133 @@ Takes in a list and sums the elements of the list
     Raises:
         TypeError: an element in values is not an int or float
     """
+    arr = _as_array(values, "must be only numerical values in list")
+    if arr is not None:
+        return (np.nansum(arr) if skip_nan else arr.sum()).item()  # item gives a python int or float
+
     total = 0
     for value in values:
         if type(value) is int or type(value) is float:  # checks value is a number before adding
-            total += value
+            if not (skip_nan and _is_nan(value)):
+                total += value
         else:
             raise TypeError("must be only numerical values in list")
     return total
 
 
-def maxvalue(values: list) -> int:
+@instrument.timed
+def maxvalue(values: list, skip_nan: bool = False) -> int:
     """
 Returns the index of the maximum value in a sequence. If there are multiple occurrences of the largest value, the index
-of the first occurrence is returned
+of the first occurrence is returned. Numpy arrays and other array-likes are searched with argmax and indexed as if
+flattened
 
     Args:
-        values: list of integers of floats
+        values: list or array of integers of floats
+        skip_nan: if True NaN values are never chosen as the maximum
 
     Returns:
         max_index: integer index of the largest value in list
 
     Raises:
         TypeError: an element in values is not an int or float
-        IndexError: value list is empty
+        IndexError: value list is empty, or only contains NaN when skip_nan is True
     """
+    arr = _as_array(values, "Must be only numerical values in list")
+    if arr is not None:
+        if arr.size == 0 or (skip_nan and arr.dtype.kind == "f" and np.isnan(arr).all()):
+            raise IndexError("List is empty")
+        return int(np.nanargmax(arr) if skip_nan else np.argmax(arr))
+
     if length(values) == 0:
         raise IndexError("List is empty")
 
-    max_index = 0
+    max_index = None
     for index, value in enumerate(values):  # loops through values
-        print(index)
         if type(value) is int or type(value) is float:  # checks value is a number
-            if value > values[max_index]:          # if value is greater than current largest value
+            if skip_nan and _is_nan(value):
+                continue
+            if max_index is None or value > values[max_index]:  # if value is greater than current largest value
                 max_index = index
         else:
             raise TypeError("Must be only numerical values in list")
+    if max_index is None:
+        raise IndexError("List is empty")
     return max_index
 
 
-def minvalue(values: list) -> int:
+@instrument.timed
+def minvalue(values: list, skip_nan: bool = False) -> int:
     """
 Returns the index of the smallest value in a sequence. If there are multiple occurrences of the smallest value, the index
-of the first occurrence is returned
+of the first occurrence is returned. Numpy arrays and other array-likes are searched with argmin and indexed as if
+flattened
 
      Args:
-         values: list of integers of floats
+         values: list or array of integers of floats
+         skip_nan: if True NaN values are never chosen as the minimum
 
      Returns:
          max_index: integer index of the smallest value in list
 
      Raises:
          TypeError: an element in values is not an int or float
-         IndexError: values list is empty
+         IndexError: values list is empty, or only contains NaN when skip_nan is True
      """
+    arr = _as_array(values, "Must be only numerical values in list")
+    if arr is not None:
+        if arr.size == 0 or (skip_nan and arr.dtype.kind == "f" and np.isnan(arr).all()):
+            raise IndexError("List is empty")
+        return int(np.nanargmin(arr) if skip_nan else np.argmin(arr))
+
     if length(values) == 0:
         raise IndexError("List is empty")
 
-    min_index = 0
+    min_index = None
     for index, value in enumerate(values):
         if type(value) is int or type(value) is float:  # checks value is a number
-            if value < values[min_index]:   # if value less than current smallest value
+            if skip_nan and _is_nan(value):
+                continue
+            if min_index is None or value < values[min_index]:   # if value less than current smallest value
                 min_index = index
         else:
             raise TypeError("Must be only numerical values in list")
+    if min_index is None:
+        raise IndexError("List is empty")
     return min_index
 
 
-def meannvalue(values: list) -> float:
+@instrument.timed
+def meannvalue(values: list, skip_nan: bool = False) -> float:
     """
  Returns the arithmetic mean of a list as a float. Adds up the values and divides by
-the number of values in list
+the number of values in list. Numpy arrays and other array-likes are averaged in one vectorized call
 
      Args:
-         values: list of integers of floats
+         values: list or array of integers of floats
+         skip_nan: if True NaN values are left out of both the total and the count
 
      Returns:
          avg: average value of all elements in the list
 
      Raises:
          TypeError: an element in values is not an int or float
-         ZeroDivisionError: values list is empty
+         ZeroDivisionError: values list is empty, or only contains NaN when skip_nan is True
      """
+    arr = _as_array(values, "must be only numerical values in list")
+    if arr is not None:
+        if skip_nan and arr.dtype.kind == "f":
+            arr = arr[~np.isnan(arr)]
+        if arr.size == 0:
+            raise ZeroDivisionError("List is empty")
+        return float(arr.mean())
+
     total = 0
     count = 0
     for value in values:
         if type(value) is int or type(value) is float:  # checks value is a number before adding
+            if skip_nan and _is_nan(value):
+                continue
             total += value
             count += 1
         else:
@@ -106,16 +192,23 @@ the number of values in list
         raise ZeroDivisionError("List is empty")
 
 
+@instrument.timed
 def countvalue(values: list, xw) -> int:
     """
  Returns the number of times an element appears in a list
 
      Args:
-         values: a list you want to search
+         values: a list or array you want to search
 
      Returns:
          count: int number of times xw occurs in the list
      """
+    arr = _as_array(values)
+    if arr is not None:
+        matches = np.asarray(arr == xw)
+        if matches.shape == arr.shape:  # comparison was made element by element
+            return int(np.count_nonzero(matches))
+
     count = 0  # stores number of times xw if found
     for value in values:
         if value == xw:
@@ -123,6 +216,7 @@ def countvalue(values: list, xw) -> int:
     return count
 
 
+@instrument.timed
 def length(values: list) -> int:
     """
  Returns number of elements in a sequence
@@ -136,6 +230,9 @@ def length(values: list) -> int:
     Raises:
         TypeError: values argument is not a sequence
      """
+    if _as_array(values) is not None:
+        return len(values)
+
     count = 0
     try:
         for _ in values:
@@ -145,39 +242,34 @@ def length(values: list) -> int:
         raise TypeError("Non sequence passed in")
 
 
+@instrument.timed
 def sort_list(L):
     """
-Sorts L into descending order by insertion sort. L should contain integers or floats
+Sorts L into descending order. L should contain integers or floats. Equal values are ordered with the last occurrence
+in L first
 
      Args:
-         L: list of integers of floats
+         L: list, or any other iterable, of integers of floats
 
      Returns:
          sorted_L: L sorted into descending order
      """
-    sorted_l = []
+    L = list(L)  # generators, sets and dictionary views can't be reversed by slicing
     for item in L:
         if type(item) != int and type(item) != float:
             raise TypeError("List contains non numerical value")
-
-        if length(sorted_l) == 0:  # first element of L added to sorted_L without comparison
-            sorted_l.append(item)
-            continue
-        for index, _ in enumerate(sorted_l):  # compares current component with already sorted components
-            if item >= sorted_l[index]:
-                sorted_l[index:index] = [item]  # add to sorted list just before compared component
-                break
-        else:  # if current component size is smaller than all components in sorted list. Loop completes without break
-            sorted_l.append(item)
-    return sorted_l
+    return sorted(L[::-1], reverse=True)  # stable sort of reversed list puts later equal values first
 
 
-def median(values: list) -> float:
+@instrument.timed
+def median(values: list, skip_nan: bool = False) -> float:
     """
- Returns the median of all the values in a list
+ Returns the median of all the values in a list. Numpy arrays and other array-likes are partitioned around the middle
+ element in linear time instead of being sorted
 
      Args:
-         values: list of integers of floats
+         values: list or array of integers of floats
+         skip_nan: if True NaN values are left out before the middle is found
 
      Returns:
          avg: average value of all elements in the list
@@ -186,6 +278,17 @@ def median(values: list) -> float:
          TypeError: an element in values is not an int or float
          IndexError: values list is empty
      """
+    arr = _as_array(values, "input is not a list of numbers")
+    if arr is not None:
+        values = arr[~np.isnan(arr)] if skip_nan and arr.dtype.kind == "f" else arr
+        if values.size == 0:
+            raise IndexError("List is empty")
+        mid = values.size // 2
+        partitioned = np.partition(values, [values.size - 1 - mid, mid])  # both middle elements in sorted position
+        return float((partitioned[mid] + partitioned[values.size - 1 - mid]) / 2)
+
+    if skip_nan:
+        values = [value for value in values if not _is_nan(value)]
     try:
         values = sort_list(values)
         mid = len(values) // 2
@@ -198,3 +301,309 @@ def median(values: list) -> float:
         raise IndexError("List is empty")
 
 
+def _number_array(values) -> np.ndarray:
+    """
+Returns a single number, list or array of numbers as a flat numpy array, keeping any NaN values
+    """
+    arr = _as_array(values, "must be only numerical values in list")
+    if arr is not None:
+        return arr
+    if isinstance(values, (int, float, np.number)) and not isinstance(values, bool):  # single value
+        return np.array([values])
+    for value in values:
+        if type(value) is not int and type(value) is not float:
+            raise TypeError("must be only numerical values in list")
+    return np.array(values, dtype=np.float64 if any(type(value) is float for value in values) else np.int64)
+
+
+def _finite_values(values) -> np.ndarray:
+    """
+Returns a single number, list or array of numbers as a flat float array with NaN values removed
+    """
+    arr = _number_array(values).astype(np.float64, copy=False)
+    return arr[~np.isnan(arr)]
+
+
+class RunningMean:
+    """
+Accumulates the count, mean and variance of a stream of values without keeping the values, using Welford's method.
+Accumulators built over separate parts of the data, for example by parallel workers, can be combined with merge.
+NaN values are treated as missing and skipped
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0  # sum of squared differences from the mean
+
+    def update(self, values):
+        """
+Adds a single number, or every value in a list or array, to the accumulator
+
+     Args:
+         values: int, float, list or array of integers of floats
+
+     Returns:
+         self: the updated accumulator
+
+     Raises:
+         TypeError: an element in values is not an int or float
+        """
+        arr = _finite_values(values)
+        if arr.size == 1:  # Welford's update for a single value
+            value = float(arr[0])
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self._m2 += delta * (value - self.mean)
+        elif arr.size > 1:  # summarise the batch then combine it like another accumulator
+            batch = RunningMean()
+            batch.count, batch.mean = arr.size, float(arr.mean())
+            batch._m2 = float(np.square(arr - batch.mean).sum())
+            self.merge(batch)
+        return self
+
+    def merge(self, other: "RunningMean"):
+        """
+Combines the values seen by another accumulator into this one, using Chan's parallel update
+
+     Args:
+         other: RunningMean built over a different part of the data
+
+     Returns:
+         self: the updated accumulator
+        """
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self._m2 += other._m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        return self
+
+    def result(self, ddof: int = 0) -> tuple[float, float]:
+        """
+Returns the mean and variance of every value seen so far
+
+     Args:
+         ddof: delta degrees of freedom, 0 for the population variance as np.var, 1 for the sample variance
+
+     Returns:
+         mean: float mean of the values
+         variance: float variance of the values
+
+     Raises:
+         ZeroDivisionError: no values have been seen, or too few for ddof
+        """
+        if self.count - ddof <= 0:
+            raise ZeroDivisionError("List is empty")
+        return self.mean, self._m2 / (self.count - ddof)
+
+
+class RunningExtremes:
+    """
+Tracks the smallest and largest values of a stream and their positions in it. Positions count every value passed
+to update, including NaN values which are never chosen as an extreme. If an extreme occurs more than once the first
+position is kept, as in minvalue and maxvalue
+    """
+
+    def __init__(self):
+        self.count = 0  # number of values seen including NaN
+        self.min_index = self.max_index = None
+        self.min = self.max = None
+
+    def update(self, values):
+        """
+Adds a single number, or every value in a list or array, to the end of the stream
+
+     Args:
+         values: int, float, list or array of integers of floats
+
+     Returns:
+         self: the updated accumulator
+
+     Raises:
+         TypeError: an element in values is not an int or float
+        """
+        arr = _number_array(values)  # NaN values are kept so they still count as positions
+        batch = RunningExtremes()
+        batch.count = arr.size
+        finite = ~np.isnan(arr) if arr.dtype.kind == "f" else np.ones(arr.size, dtype=bool)
+        if finite.any():
+            positions = np.flatnonzero(finite)
+            values = arr[positions]
+            low, high = int(np.argmin(values)), int(np.argmax(values))
+            batch.min_index, batch.min = int(positions[low]), values[low].item()
+            batch.max_index, batch.max = int(positions[high]), values[high].item()
+        return self.merge(batch)
+
+    def merge(self, other: "RunningExtremes"):
+        """
+Appends the stream seen by another accumulator to the end of this one. Positions from other are moved along by the
+number of values this accumulator has seen
+
+     Args:
+         other: RunningExtremes built over the data following this accumulator's data
+
+     Returns:
+         self: the updated accumulator
+        """
+        if other.min_index is not None:
+            if self.min_index is None or other.min < self.min:  # ties keep the earlier position
+                self.min_index, self.min = other.min_index + self.count, other.min
+            if self.max_index is None or other.max > self.max:
+                self.max_index, self.max = other.max_index + self.count, other.max
+        self.count += other.count
+        return self
+
+    def result(self) -> tuple[int, int or float, int, int or float]:
+        """
+Returns the smallest and largest values seen so far and their positions
+
+     Returns:
+         min_index: integer position of the smallest value
+         min: smallest value
+         max_index: integer position of the largest value
+         max: largest value
+
+     Raises:
+         IndexError: no values other than NaN have been seen
+        """
+        if self.min_index is None:
+            raise IndexError("List is empty")
+        return self.min_index, self.min, self.max_index, self.max
+
+
+class StreamingQuantiles:
+    """
+Estimates quantiles such as the median of a stream of values using a t-digest. Values are grouped into weighted
+centroids which are kept small near the ends of the distribution and larger in the middle, so memory stays around
+compression centroids however many values are seen. Until more than compression values have been seen every value
+is kept as its own centroid and results are exactly those of np.quantile. NaN values are treated as missing and
+skipped
+    """
+
+    def __init__(self, compression: int = 100):
+        self.compression = compression
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self._means = np.empty(0)  # centroid means in increasing order
+        self._weights = np.empty(0)  # number of values in each centroid
+        self._buffer = []  # arrays of values not yet merged into the centroids
+        self._buffered = 0
+
+    def update(self, values):
+        """
+Adds a single number, or every value in a list or array, to the digest
+
+     Args:
+         values: int, float, list or array of integers of floats
+
+     Returns:
+         self: the updated digest
+
+     Raises:
+         TypeError: an element in values is not an int or float
+        """
+        arr = _finite_values(values)
+        if arr.size == 0:
+            return self
+        self._buffer.append(arr)
+        self._buffered += arr.size
+        self.count += arr.size
+        self.min = min(self.min, float(arr.min()))
+        self.max = max(self.max, float(arr.max()))
+        if self._buffered >= 5 * self.compression:  # merging in batches keeps updates cheap
+            self._compress()
+        return self
+
+    def merge(self, other: "StreamingQuantiles"):
+        """
+Combines the centroids of another digest into this one
+
+     Args:
+         other: StreamingQuantiles built over a different part of the data
+
+     Returns:
+         self: the updated digest
+        """
+        other._compress()
+        if other.count == 0:
+            return self
+        self._buffer.append(np.column_stack([other._means, other._weights]))  # weighted centroids not single values
+        self._buffered += other.count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _compress(self):
+        """
+Merges buffered values into the centroids, combining neighbouring centroids while the combined centroid stays
+within the size limit for its position in the distribution
+        """
+        if self._buffered == 0:
+            return
+        means, weights = [self._means], [self._weights]
+        for batch in self._buffer:
+            if batch.ndim == 2:  # centroids from merge
+                means.append(batch[:, 0])
+                weights.append(batch[:, 1])
+            else:
+                means.append(batch)
+                weights.append(np.ones(batch.size))
+        means, weights = np.concatenate(means), np.concatenate(weights)
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        self._buffer, self._buffered = [], 0
+        if self.count <= self.compression:  # few enough values to keep every one
+            self._means, self._weights = means, weights
+            return
+
+        def q_limit(q):  # largest quantile a centroid starting at q can reach, from the k1 scale function
+            k = self.compression / (2 * np.pi) * np.arcsin(2 * q - 1) + 1
+            return 1.0 if k >= self.compression / 4 else (np.sin(2 * np.pi * k / self.compression) + 1) / 2
+
+        new_means, new_weights = [means[0]], [weights[0]]
+        done = 0.0  # weight of finished centroids
+        limit = q_limit(0.0)
+        for mean, weight in zip(means[1:].tolist(), weights[1:].tolist()):
+            if (done + new_weights[-1] + weight) / self.count <= limit:  # fits in the current centroid
+                new_weights[-1] += weight
+                new_means[-1] += (mean - new_means[-1]) * weight / new_weights[-1]
+            else:
+                done += new_weights[-1]
+                limit = q_limit(done / self.count)
+                new_means.append(mean)
+                new_weights.append(weight)
+        self._means, self._weights = np.array(new_means), np.array(new_weights)
+
+    def result(self, q: float = 0.5) -> float:
+        """
+Returns the estimated value at quantile q of every value seen so far, so q=0.5 gives the median
+
+     Args:
+         q: quantile between 0 and 1
+
+     Returns:
+         value: float estimate of the quantile
+
+     Raises:
+         ValueError: q is not between 0 and 1
+         IndexError: no values have been seen
+        """
+        if not 0 <= q <= 1:
+            raise ValueError("Quantile must be between 0 and 1")
+        self._compress()
+        if self.count == 0:
+            raise IndexError("List is empty")
+        if np.all(self._weights == 1):  # every value is its own centroid so the quantile is exact
+            return float(np.quantile(self._means, q))
+        # each centroid sits at the middle of the weight it covers, values between centroids are interpolated
+        centres = np.cumsum(self._weights) - self._weights / 2
+        positions = np.concatenate([[0.0], centres, [self.count]])
+        values = np.concatenate([[self.min], self._means, [self.max]])
+        return float(np.interp(q * self.count, positions, values))